@@ -1,11 +1,16 @@
 import copy
+import collections
+import os
+import signal
 import multiprocessing
+import multiprocessing.connection
+import sqlite3
 import time
 import logging
 
 from .utils import set_naive_attr_path
 from .config import Configuration
-from .db import DatabaseManager
+from .db import DatabaseManager, write_run_final
 
 logger = logging.getLogger(__name__)
 
@@ -42,85 +47,166 @@ def apply_batch_schema_on_schemas(configuration_schema, potential_schema, traini
     return full_schemas
 
 
-def naive_scheduler(full_schemas, scheduler_frequency=5, monitor_interval=60, max_cpus=None):
-    """ Naive Scheduler (FIFO) schedules up to max cpus
-    uses num_workers field in configuration + 1 (to account for master)
-    dask would be a good choice in the future (if can account for jobs that
-    take more than more processor).
+def _job_cpus(full_schema):
+    return full_schema['configuration']['spec'].get('problem', {}).get('num_workers', 1)
+
+
+def _job_process(target, full_schema, connection):
+    """Run job in its own process group so that the job and its
+    calculator workers are terminated together"""
+    os.setsid()
+    target(full_schema, connection)
+
+
+def _terminate_job(process):
+    """Terminate all processes in process group of job"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError: # all processes exited
+        pass
+
+
+def batch_scheduler(full_schemas, monitor_interval=60, max_cpus=None, max_retries=1):
+    """ Event driven scheduler (FIFO) of dftfit jobs on a single node
+
+    Jobs are started as soon as enough cpus are free using the
+    ``num_workers`` of the problem as the cpus of each job. The
+    scheduler sleeps until a job reports, exits, or a progress check
+    is due. A job is stalled when the number of evaluations of its run
+    did not increase within ``monitor_interval`` seconds. Stalled jobs
+    are terminated and, like crashed jobs, retried up to
+    ``max_retries`` times. Each job runs in its own process group so
+    that its calculator workers are terminated with it.
+
+    Evaluations are written to the database in batches of
+    ``spec.database.interval`` so ``monitor_interval`` must be longer
+    than the time of that many evaluations (including startup of the
+    calculator) otherwise healthy jobs are terminated.
+
+    Returns
+    -------
+    list:
+        run ids of completed jobs in order of jobs
     """
     from .dftfit import dftfit_process
 
     max_cpus = max_cpus or multiprocessing.cpu_count()
 
-    def filter_jobs_to_many_cpus(full_schemas):
-        filtered_full_schemas = []
-        for i, full_schema in enumerate(full_schemas):
-            if full_schema['configuration']['spec'].get('problem', {}).get('num_workers', 0) > max_cpus:
-                logger.warning('skipping job %d becuase requsted cpus is larger than allotment' % i+1)
-            else:
-                filtered_full_schemas.append(full_schema)
-        return filtered_full_schemas
-
-    full_schemas = filter_jobs_to_many_cpus(full_schemas)
-
-    running_jobs = []
-    current_cpu_used = 0
-    result_queue = multiprocessing.Queue()
-    results_dict = {}
-    submitted_tasks = 0
-
-    while len(full_schemas) or len(running_jobs):
-        # Schedule a process
-        if len(full_schemas):
-            next_cpus_requested = full_schemas[0]['configuration']['spec'].get('problem', {}).get('num_workers', 1)
-            if max_cpus - current_cpu_used >= next_cpus_requested:
-                logger.info('(batch) scheduled dftfit task id: %d' % submitted_tasks)
-                full_schema = full_schemas.pop(0)
-                p = multiprocessing.Process(target=dftfit_process, args=(
-                    full_schema, submitted_tasks, result_queue))
+    pending = collections.deque()
+    for task_id, full_schema in enumerate(full_schemas):
+        if _job_cpus(full_schema) > max_cpus:
+            logger.warning('(batch) skipping task id %d because requested cpus is larger than allotment' % task_id)
+        else:
+            pending.append((task_id, full_schema, 0))
+
+    running = []
+    databases = {}
+    run_ids = {}
+    cpus_used = 0
+
+    def database(filename):
+        if filename not in databases:
+            databases[filename] = DatabaseManager(filename)
+        return databases[filename]
+
+    def progress(job):
+        """Number of evaluations of run if increased since last check"""
+        dbm = database(job['database_filename'])
+        try:
+            count = dbm.connection.execute(
+                'SELECT count(*) FROM evaluation WHERE run_id = ?', (job['run_id'],)).fetchone()[0]
+        except sqlite3.OperationalError: # database locked by writing job
+            return True
+        increased = count > job['num_evaluations']
+        job['num_evaluations'] = count
+        return increased
+
+    def receive(job):
+        try:
+            while job['connection'].poll():
+                event, database_filename, run_id = job['connection'].recv()
+                job.update({'database_filename': database_filename, 'run_id': run_id, 'last_progress': time.time()})
+                if event == 'completed':
+                    job['completed'] = True
+        except (EOFError, OSError):
+            job['connection'].close()
+            job['connection'] = None
+
+    def finish(job, reason=None):
+        nonlocal cpus_used
+        if reason is not None:
+            # workers of a crashed or stalled job would keep running
+            _terminate_job(job['process'])
+        job['process'].join()
+        running.remove(job)
+        cpus_used -= job['num_cpus']
+        if job['connection'] is not None:
+            job['connection'].close()
+
+        task_id = job['task_id']
+        if reason == 'crashed':
+            reason = 'crashed with exitcode %s' % job['process'].exitcode
+        if reason is None:
+            logger.info('(batch) task id %d completed run id %d' % (task_id, job['run_id']))
+            run_ids[task_id] = job['run_id']
+            return
+
+        if job['run_id'] is not None:
+            write_run_final(database(job['database_filename']), job['run_id'])
+        if job['attempt'] < max_retries:
+            logger.warning('(batch) task id %d %s retrying (attempt %d)' % (task_id, reason, job['attempt'] + 2))
+            pending.append((task_id, job['full_schema'], job['attempt'] + 1))
+        else:
+            logger.error('(batch) task id %d %s no retries left' % (task_id, reason))
+
+    try:
+        while pending or running:
+            # fill all free cpus without skipping ahead of the first pending job
+            while pending and _job_cpus(pending[0][1]) <= max_cpus - cpus_used:
+                task_id, full_schema, attempt = pending.popleft()
+                p_conn, c_conn = multiprocessing.Pipe(duplex=False)
+                p = multiprocessing.Process(target=_job_process, args=(dftfit_process, full_schema, c_conn))
                 p.start()
-                results_dict[submitted_tasks] = {
+                c_conn.close()
+                logger.info('(batch) scheduled dftfit task id: %d' % task_id)
+                running.append({
+                    'task_id': task_id,
+                    'full_schema': full_schema,
+                    'attempt': attempt,
                     'process': p,
-                    'num_cpus': next_cpus_requested,
+                    'connection': p_conn,
+                    'num_cpus': _job_cpus(full_schema),
+                    'database_filename': None,
                     'run_id': None,
-                    'last_id': None,
-                    'last_time': None,
-                    'dbm': None}
-                current_cpu_used += next_cpus_requested
-                submitted_tasks += 1
-
-        # Update completed and running jobs
-        time.sleep(scheduler_frequency)
-        completed_jobs = [v['num_cpus'] for k, v in results_dict.items() if not v['process'].is_alive()]
-        running_jobs = [k for k, v in results_dict.items() if v['process'].is_alive()]
-
-        if completed_jobs:
-            logger.info('(batch) %d dftfit jobs just completed' % len(completed_jobs))
-        current_cpu_used = current_cpu_used - sum(completed_jobs)
-
-        # Check that running taks are making progress
-        while not result_queue.empty():
-            task_id, database_filename, run_id = result_queue.get()
-            results_dict[task_id].update({
-                'last_time': time.time(),
-                'run_id': run_id,
-                'dbm': DatabaseManager(database_filename)})
-
-        for task_id, value in results_dict.items():
-            # skipped finished tasks
-            if not value['process'].is_alive():
-                continue
-            run_id = value['run_id']
-            last_id = value['last_id'] or 0
-            count = value['dbm'].connection.execute('SELECT count(*) FROM evaluation WHERE run_id = ? AND evaluation_id > ?', (run_id, last_id)).fetchone()
-            if count > 0:
-                value['time_elapsed'] = time.time()
-            elif (time.time() - value['last_time']) > monitor_interval:
-                logger.warning('(batch) killing process task id %d' % (k))
-                value['process'].kill()
-                value['process'].wait()
-                current_cpu_used -= value['num_cpus']
-
-    run_ids = sorted([v['run_id'] for k, v in results_dict.items()])
+                    'num_evaluations': 0,
+                    'last_progress': None,
+                    'completed': False})
+                cpus_used += _job_cpus(full_schema)
+
+            # jobs are monitored once their run is written to the database
+            deadlines = [job['last_progress'] + monitor_interval for job in running if job['last_progress'] is not None]
+            timeout = max(min(deadlines) - time.time(), 0) if deadlines else None
+            waitables = [job['process'].sentinel for job in running] + [job['connection'] for job in running if job['connection'] is not None]
+            ready = multiprocessing.connection.wait(waitables, timeout)
+
+            for job in list(running):
+                if job['connection'] is not None and job['connection'] in ready:
+                    receive(job)
+                if job['process'].sentinel in ready:
+                    if job['connection'] is not None:
+                        receive(job)
+                    finish(job, None if job['completed'] else 'crashed')
+                elif job['last_progress'] is not None and time.time() - job['last_progress'] >= monitor_interval:
+                    if progress(job):
+                        job['last_progress'] = time.time()
+                    else:
+                        logger.warning('(batch) terminating stalled task id %d run id %d' % (job['task_id'], job['run_id']))
+                        finish(job, 'stalled')
+    finally:
+        # jobs do not receive signals of scheduler (e.g. ctrl-c)
+        for job in running:
+            _terminate_job(job['process'])
+
+    run_ids = [run_ids[task_id] for task_id in sorted(run_ids)]
     logger.info('(batch) run ids of completed jobs: %s' % run_ids)
     return run_ids
@@ -0,0 +1,138 @@
+""" Scaling benchmarks of dftfit runs
+
+Fixed seed fits are run for several numbers of workers and training
+set sizes. Evaluations per second and the fraction of time in lammps
+and interprocess communication are taken from the stage timings of
+each run (see :mod:`dftfit.timing`).
+"""
+import copy
+import math
+import os
+import tempfile
+import time
+import logging
+
+import pandas as pd
+
+from .potential import Potential
+from .training import Training
+from .config import Configuration
+from .dftfit import _dftfit_internal
+from .db import write_run_initial, write_run_final, run_profile
+
+logger = logging.getLogger(__name__)
+
+
+def stage_fractions(profile, num_workers):
+    """ Fraction of fitness evaluation time spent in lammps and
+    interprocess communication
+
+    lammps time is the mean time per worker of ``lammps_run``. ipc
+    time is the time of sending to and receiving from the workers
+    that is not spent applying potentials and running lammps within
+    the workers (serialization, pipes, and waiting on the slowest
+    worker). Without multiprocessing (one worker) there is no ipc.
+
+    Parameters
+    ----------
+    profile: pandas.DataFrame
+        run profile see :func:`dftfit.db.run_profile`
+    num_workers: int
+        number of workers of run
+
+    Returns
+    -------
+    dict:
+        lammps_fraction and ipc_fraction of fitness time
+    """
+    def total(stage):
+        return float(profile['total'].get(stage, 0.0)) if len(profile) else 0.0
+
+    fitness = total('fitness')
+    if not fitness:
+        return {'lammps_fraction': math.nan, 'ipc_fraction': math.nan}
+
+    lammps = total('calculator.worker.lammps_run') / num_workers
+    worker = lammps + total('calculator.worker.apply_potential') / num_workers
+    ipc = max(total('calculator.pipe_send') + total('calculator.pipe_recv') - worker, 0.0)
+    return {'lammps_fraction': lammps / fitness, 'ipc_fraction': ipc / fitness}
+
+
+def parallel_efficiency(df):
+    """ Speedup of evaluations per second relative to the fewest
+    workers of the same training set size divided by the increase in
+    workers"""
+    efficiency = []
+    for _, row in df.iterrows():
+        same_size = df[df['num_calculations'] == row['num_calculations']]
+        base = same_size.loc[same_size['num_workers'].idxmin()]
+        efficiency.append((row['evaluations_per_second'] / base['evaluations_per_second']) / (row['num_workers'] / base['num_workers']))
+    return efficiency
+
+
+def scaling_benchmark(configuration_schema, potential_schema, training_schema, workers=(1, 2, 4), replicates=(1,), steps=3, seed=0):
+    """ Run fixed seed fits for each number of workers and training set size
+
+    Runs are written to a temporary database.
+
+    Parameters
+    ----------
+    workers: list
+        number of workers of lammps-cython calculator
+    replicates: list
+        training set sizes as multiples of the training calculations
+    steps: int
+        number of optimization steps of each fit
+    seed: int
+        seed of each fit
+
+    Returns
+    -------
+    pandas.DataFrame:
+        dataframe with fields: num_calculations, num_workers, steps,
+        num_evaluations, wall_time, evaluations_per_second,
+        parallel_efficiency, lammps_fraction, ipc_fraction
+    """
+    configuration_schema = copy.deepcopy(configuration_schema)
+    spec = configuration_schema['spec']
+    spec['seed'] = seed
+    spec.setdefault('algorithm', {})['steps'] = steps
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        spec['database'] = {**spec.get('database', {}), 'filename': os.path.join(directory, 'scaling.db')}
+        base_training = Training(training_schema, **Configuration(configuration_schema).training_kwargs)
+
+        for num_copies in replicates:
+            training = base_training.replicate(num_copies)
+            for num_workers in workers:
+                spec.setdefault('problem', {})['num_workers'] = num_workers
+                configuration = Configuration(configuration_schema)
+                potential = Potential(potential_schema)
+                logger.info('(benchmark) fitting %d calculations with %d workers' % (len(training), num_workers))
+
+                potential_hash, run_id = write_run_initial(configuration.dbm, potential, training, configuration)
+                start_time = time.perf_counter()
+                try:
+                    _dftfit_internal(configuration, potential, training, run_id)
+                finally:
+                    write_run_final(configuration.dbm, run_id)
+                wall_time = time.perf_counter() - start_time
+
+                profile = run_profile(configuration.dbm, run_id)
+                num_evaluations = int(profile.loc['fitness', 'count'])
+                results.append({
+                    'num_calculations': len(training),
+                    'num_workers': num_workers,
+                    'steps': steps,
+                    'num_evaluations': num_evaluations,
+                    'wall_time': wall_time,
+                    'evaluations_per_second': num_evaluations / profile.loc['fitness', 'total'],
+                    **stage_fractions(profile, num_workers)
+                })
+
+    df = pd.DataFrame(results, columns=[
+        'num_calculations', 'num_workers', 'steps', 'num_evaluations', 'wall_time',
+        'evaluations_per_second', 'lammps_fraction', 'ipc_fraction'])
+    df.insert(6, 'parallel_efficiency', parallel_efficiency(df))
+    return df
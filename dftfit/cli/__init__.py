@@ -4,6 +4,7 @@ import sys
 from . import train
 from . import test
 from . import db
+from . import bench
 
 
 def init_parser():
@@ -12,6 +13,7 @@ def init_parser():
     train.add_subcommand_train(subparsers)
     test.add_subcommand_test(subparsers)
     db.add_subcommand_db(subparsers)
+    bench.add_subcommand_bench(subparsers)
     return parser
 
 
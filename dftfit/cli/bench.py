@@ -0,0 +1,48 @@
+import json
+
+from ..benchmark import scaling_benchmark
+from .utils import load_filename, is_file_type
+
+
+def add_subcommand_bench(subparsers):
+    parser = subparsers.add_parser('bench', help='benchmark dftfit performance')
+    sub_subparsers = parser.add_subparsers()
+    add_subcommand_bench_scaling(sub_subparsers)
+
+
+def add_subcommand_bench_scaling(subparsers):
+    parser = subparsers.add_parser('scaling', help='evaluations per second and parallel efficiency for number of workers and training set sizes')
+    parser.set_defaults(func=handle_subcommand_bench_scaling)
+    parser.add_argument('-t', '--training', help='training set filename in yaml/json format', type=is_file_type, required=True)
+    parser.add_argument('-p', '--potential', help='potential filename in in yaml/json format', type=is_file_type, required=True)
+    parser.add_argument('-c', '--config', help='configuration filename in yaml/json format', type=is_file_type, required=True)
+    parser.add_argument('-w', '--workers', help='number of workers to benchmark', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('-r', '--replicate', help='training set sizes as multiples of training calculations', type=int, nargs='+', default=[1])
+    parser.add_argument('--steps', help='number of steps of each fit', type=int, default=3)
+    parser.add_argument('--seed', help='seed of each fit', type=int, default=0)
+    parser.add_argument('-f', '--format', help='output format (default from output filename or csv)', choices=['csv', 'json'])
+    parser.add_argument('-o', '--output-filename', help='write results to filename instead of stdout')
+
+
+def handle_subcommand_bench_scaling(args):
+    df = scaling_benchmark(
+        configuration_schema=load_filename(args.config),
+        potential_schema=load_filename(args.potential),
+        training_schema=load_filename(args.training),
+        workers=args.workers, replicates=args.replicate,
+        steps=args.steps, seed=args.seed)
+
+    output_format = args.format
+    if output_format is None:
+        output_format = 'json' if args.output_filename and args.output_filename.endswith('.json') else 'csv'
+
+    if output_format == 'json':
+        output = json.dumps(df.to_dict(orient='records'), indent=2)
+    else:
+        output = df.to_csv(index=False)
+
+    if args.output_filename:
+        with open(args.output_filename, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
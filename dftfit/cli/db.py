@@ -6,7 +6,7 @@ from ..db import DatabaseManager
 from ..db import (
     copy_database_to_database,
     potential_from_evaluation,
-    list_runs
+    list_runs, run_profile
 )
 from ..visualize import visualize_progress
 
@@ -18,6 +18,7 @@ def add_subcommand_db(subparsers):
     add_subcommand_db_potential(sub_subparsers)
     add_subcommand_db_progress(sub_subparsers)
     add_subcommand_db_summary(sub_subparsers)
+    add_subcommand_db_profile(sub_subparsers)
 
 
 def add_subcommand_db_merge(subparsers):
@@ -53,6 +54,13 @@ def add_subcommand_db_summary(subparsers):
     parser.add_argument('database', type=is_file_type, help='database to summarize')
 
 
+def add_subcommand_db_profile(subparsers):
+    parser = subparsers.add_parser('profile', help='timing breakdown of fitness evaluations of run')
+    parser.set_defaults(func=handle_subcommand_db_profile)
+    parser.add_argument('database', type=is_file_type, help='database to get profile from')
+    parser.add_argument('run_id', type=int, help='run id to profile')
+
+
 def handle_subcommand_db_merge(args):
     if os.path.isfile(args.output_database) and not args.force:
         print(f'path {args.output_database} is an existing file use -f to force writting to existing db')
@@ -83,3 +91,12 @@ def handle_subcommand_db_summary(args):
     dbm = DatabaseManager(args.database)
     df = list_runs(dbm)
     print(df.to_string())
+
+
+def handle_subcommand_db_profile(args):
+    dbm = DatabaseManager(args.database)
+    df = run_profile(dbm, args.run_id)
+    if len(df) == 0:
+        print(f'run {args.run_id} has no profile (profiles are written when a run finishes)')
+        return
+    print(df.to_string(float_format=lambda v: '%.4g' % v))
@@ -1,4 +1,3 @@
-import os
 import itertools
 
 from pymatgen.io.cif import CifParser
@@ -56,7 +55,7 @@ def add_subcommand_test_training(subparsers):
     parser.add_argument('plot', help='what to plot', choices=['energy', 'forces', 'stress'])
     parser.add_argument('--software', default='lammps', help='md calculator to use')
     parser.add_argument('--command', help='md calculator command has sensible defaults')
-    parser.add_argument('--cache', default='~/.cache/dftfit/cache.db', help='dft cache', type=is_file_type)
+    parser.add_argument('--cache', default='~/.cache/dftfit/training', help='dft cache directory')
     parser.add_argument('--hide', dest='show', action='store_false', help='do not show plot')
     parser.add_argument('-o', '--output-filename', type=is_not_file_type, help='filename to write visualization to')
 
@@ -66,7 +65,7 @@ def add_subcommand_test_radial(subparsers):
     parser.set_defaults(func=handle_subcommand_test_radial)
     parser.add_argument('-t', '--training', help='training set to use for comparison', type=is_file_type, required=True)
     parser.add_argument('--distance', default=10.0, help='distance to calculate radial distribution function', type=float)
-    parser.add_argument('--cache', default='~/.cache/dftfit/cache.db', help='dft cache', type=is_file_type)
+    parser.add_argument('--cache', default='~/.cache/dftfit/training', help='dft cache directory')
     parser.add_argument('--hide', dest='show', action='store_false', help='do not show plot')
     parser.add_argument('-o', '--output-filename', type=is_not_file_type, help='filename to write visualization to')
 
@@ -157,10 +156,9 @@ def handle_subcommand_test_training(args):
         'lammps': 'lammps'
     }
     command = args.command if args.command else default_commands.get(args.software)
-    cache_filename = os.path.expanduser(args.cache)
     predict = Predict(calculator=args.software, command=command, num_workers=1)
     potential = Potential.from_file(args.potential)
-    training = Training.from_file(args.training, cache_filename=cache_filename)
+    training = Training.from_file(args.training, cache_directory=args.cache, cache_filename='~/.cache/dftfit/cache.db')
 
     import warnings
     warnings.filterwarnings("ignore") # yes I have sinned
@@ -177,8 +175,7 @@ def handle_subcommand_test_training(args):
 
 
 def handle_subcommand_test_radial(args):
-    cache_filename = os.path.expanduser(args.cache)
-    training = Training.from_file(args.training, cache_filename=cache_filename)
+    training = Training.from_file(args.training, cache_directory=args.cache, cache_filename='~/.cache/dftfit/cache.db')
     visualize_radial_pair_distribution(training.calculations, distance=args.distance, show=args.show, filename=args.output_filename)
 
 
@@ -38,6 +38,7 @@ class Configuration:
 
         # Training
         self.training_kwargs = self.schema['spec'].get('training', {
+            'cache_directory': '~/.cache/dftfit/training',
             'cache_filename': '~/.cache/dftfit/cache.db'})
 
         # Algorithm
@@ -51,7 +52,13 @@ class Configuration:
         self.steps = _algorithm_kwargs['steps']
         self.population = _algorithm_kwargs['population']
         self.include_initial_guess = _algorithm_kwargs.get('include_initial_guess', False)
-        self.algorithm_kwargs = {k:v for k,v in _algorithm_kwargs.items() if k not in {'name', 'steps', 'population', 'include_initial_guess'}}
+        # gradient based refinement of best individual after optimization
+        self.refine = _algorithm_kwargs.get('refine')
+        if self.refine is True:
+            self.refine = {}
+        elif self.refine is False:
+            self.refine = None
+        self.algorithm_kwargs = {k:v for k,v in _algorithm_kwargs.items() if k not in {'name', 'steps', 'population', 'include_initial_guess', 'refine'}}
 
         # Problem
         _problem_kwargs = self.schema['spec'].get('problem', {
@@ -66,6 +73,35 @@ class Configuration:
             self.weights.append(_problem_kwargs['weights'][feature])
         self.problem_kwargs = {k:v for k,v in _problem_kwargs.items() if k not in {'weights'}}
 
+        # Fidelity schedule
+        self.fidelity = self._fidelity_schedule(self.problem_kwargs.get('fidelity'))
+        if self.fidelity:
+            self.problem_kwargs['fidelity'] = self.fidelity
+
+    @staticmethod
+    def _fidelity_schedule(fidelity):
+        """Normalize fidelity schedule of reduced accuracy levels
+
+        Levels are ordered from lowest to highest fidelity. Full
+        fidelity follows the last level.
+        """
+        if not fidelity:
+            return None
+
+        levels = fidelity.get('levels', [])
+        if not levels:
+            raise ValueError('fidelity schedule requires at least one level')
+        for level in levels:
+            unknown_keys = set(level) - {'kspace_tollerance', 'coulomb_cutoff'}
+            if unknown_keys:
+                raise ValueError('fidelity level keys %s not recognized' % unknown_keys)
+
+        return {
+            'levels': [{k: float(v) for k, v in level.items()} for level in levels],
+            'convergence': float(fidelity.get('convergence', 0.05)),
+            'rescore': int(fidelity.get('rescore', 1)),
+        }
+
     @classmethod
     def from_file(cls, filename, format=None):
         if format not in {'json', 'yaml'}:
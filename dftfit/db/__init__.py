@@ -1,12 +1,12 @@
 from .table import DatabaseManager
 
 from .actions import (
-    write_run_initial, write_run_final,
+    write_run_initial, write_run_final, write_run_profile,
     write_evaluation, write_evaluations_batch
 )
 
 from .query import (
-    list_run_evaluations, list_runs,
+    list_run_evaluations, list_runs, run_profile,
     filter_evaluations, potential_from_evaluation,
     copy_database_to_database,
 )
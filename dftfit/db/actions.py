@@ -76,18 +76,43 @@ def write_run_final(dbm, run_id):
         ''', (dt.datetime.utcnow(), run_id))
 
 
-def write_evaluation(dbm, run_id, potential, errors, value):
+def write_run_profile(dbm, run_id, profile):
+    """ Write timing summary of fitness evaluation stages of run
+
+    profile is a dictionary of stage to statistics see
+    :func:`dftfit.timing.summarize_timings`.
+    """
+    with dbm.connection:
+        dbm.connection.execute('''
+        UPDATE run SET profile = ?
+        WHERE id = ?
+        ''', (profile, run_id))
+
+
+def write_evaluation(dbm, run_id, potential, errors, value, kind='full', fidelity='full'):
     with dbm.connection:
         dbm.connection.execute('''
-        INSERT INTO evaluation (run_id, parameters, errors, value)
-        VALUES (?, ?, ?, ?)
-        ''', (run_id, potential.optimization_parameters.tolist(), errors, value))
+        INSERT INTO evaluation (run_id, parameters, errors, value, kind, fidelity)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (run_id, potential.optimization_parameters.tolist(), errors, value, kind, fidelity))
 
 
 def write_evaluations_batch(dbm, run_id, eval_batch):
+    """ Write evaluations (potential, errors, value[, kind[, fidelity]]) in single transaction
+
+    kind is either 'full' (default), 'mini-batch' for evaluations on
+    a subset of the training calculations, 'aborted' for
+    evaluations stopped early, or 'failed' for evaluations scored with
+    a penalty after a calculator failure. fidelity is either 'full' (default) or
+    'reduced-<level>' for evaluations with reduced accuracy.
+    """
     with dbm.connection:
-        evaluations = [(run_id, potential.optimization_parameters.tolist(), errors, value) for potential, errors, value in eval_batch]
+        evaluations = []
+        for potential, errors, value, *tags in eval_batch:
+            kind = tags[0] if len(tags) > 0 else 'full'
+            fidelity = tags[1] if len(tags) > 1 else 'full'
+            evaluations.append((run_id, potential.optimization_parameters.tolist(), errors, value, kind, fidelity))
         dbm.connection.executemany('''
-        INSERT INTO evaluation (run_id, parameters, errors, value)
-        VALUES (?, ?, ?, ?)
+        INSERT INTO evaluation (run_id, parameters, errors, value, kind, fidelity)
+        VALUES (?, ?, ?, ?, ?, ?)
         ''', evaluations)
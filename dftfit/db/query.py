@@ -47,7 +47,8 @@ def list_runs(dbm, parameters=True, stats=True):
     -------
     pandas.DataFrame:
         dataframe with fields: id, name, potential_hash, training_hash,
-        start_time, end_time, features, weights, num_evaluations, min_value
+        start_time, end_time, features, weights, num_evaluations, min_value,
+        num_failures
     """
     SELECT_RUNS = '''
     SELECT id as run_id, name,
@@ -59,7 +60,9 @@ def list_runs(dbm, parameters=True, stats=True):
 
     if stats:
         SELECT_RUN_EVAL_AGG_MIN_COUNT = '''
-        SELECT run_id, count(*) as num_evaluations, min(value) as min_value
+        SELECT run_id, count(*) as num_evaluations,
+               min(CASE WHEN kind = 'full' AND fidelity = 'full' THEN value END) as min_value,
+               sum(CASE WHEN kind = 'failed' THEN 1 ELSE 0 END) as num_failures
         FROM evaluation
         GROUP BY run_id
         '''
@@ -105,7 +108,8 @@ def list_run_evaluations(dbm, run_id, min_evaluation=None):
     -------
     pandas.DataFrame:
         dataframe with fields: evaluation_id, potential parameters,
-        all features with error, and value
+        all features with error, value, kind (full, mini-batch, or
+        aborted), and fidelity
     """
     run = dbm.connection.execute(
         'SELECT features FROM run WHERE id = ?', (run_id,)).fetchone()
@@ -114,7 +118,7 @@ def list_run_evaluations(dbm, run_id, min_evaluation=None):
     features = run['features']
 
     SELECT_EVALUATIONS = '''
-    SELECT id as evaluation_id, parameters, errors, value
+    SELECT id as evaluation_id, parameters, errors, value, kind, fidelity
     FROM evaluation
     WHERE run_id = {}
     '''.format(run_id)
@@ -125,6 +129,37 @@ def list_run_evaluations(dbm, run_id, min_evaluation=None):
     return df.drop('errors', axis=1)
 
 
+def run_profile(dbm, run_id):
+    """Create pandas dataframe of timing profile of run
+
+    Parameters
+    ----------
+    dbm: dftfit.db.table.DatabaseManager
+       dftfit database access class
+    run_id: int
+       identifier of run
+
+    Returns
+    -------
+    pandas.DataFrame:
+        dataframe indexed by stage with fields: count, total, mean,
+        percentiles (p50, p90, p99), and fraction of total fitness
+        time. Empty when the run has no profile.
+    """
+    run = dbm.connection.execute(
+        'SELECT profile FROM run WHERE id = ?', (run_id,)).fetchone()
+    if run is None:
+        raise ValueError('run with run_id {} does not exist'.format(run_id))
+
+    df = pd.DataFrame.from_dict(run['profile'] or {}, orient='index')
+    df.index.name = 'stage'
+    percentiles = sorted((c for c in df.columns if c.startswith('p')), key=lambda c: float(c[1:]))
+    df = df[[c for c in ['count', 'total', 'mean'] if c in df.columns] + percentiles]
+    if 'fitness' in df.index:
+        df['fraction'] = df['total'] / df.loc['fitness', 'total']
+    return df.sort_values('total', ascending=False) if len(df) else df
+
+
 def filter_evaluations(dbm, potential=None, limit=10, condition='best', run_id=None, labels=None, include_potentials=False):
     cursor = dbm.connection.execute('SELECT id FROM run')
     run_ids = {_['id'] for _ in cursor}
@@ -171,7 +206,7 @@ def filter_evaluations(dbm, potential=None, limit=10, condition='best', run_id=N
     SELECT_EVALUATIONS = '''
     SELECT id as evaluation_id, run_id, parameters, errors, value
     FROM evaluation
-    WHERE {}
+    WHERE ({}) AND kind = 'full' AND fidelity = 'full'
     ORDER BY value LIMIT {}
     '''.format(' OR '.join(['run_id = %d' % run_id for run_id in run_ids]), limit)
     df = pd.read_sql(SELECT_EVALUATIONS, dbm.connection, index_col='evaluation_id')
@@ -187,13 +222,13 @@ def filter_evaluations(dbm, potential=None, limit=10, condition='best', run_id=N
 
 def copy_database_to_database(src_dbm, dest_dbm, only_unique=False):
     SELECT_RUNS = 'SELECT id FROM run'
-    SELECT_RUN = 'SELECT id, name, potential_hash, training_hash, configuration, start_time, end_time, initial_parameters, indicies, bounds, features, weights FROM run WHERE id = ?'
+    SELECT_RUN = 'SELECT id, name, potential_hash, training_hash, configuration, start_time, end_time, initial_parameters, indicies, bounds, features, weights, profile FROM run WHERE id = ?'
     SELECT_RUN_LABELS = 'SELECT label.key, label.value FROM run_label JOIN label ON run_label.label_id = label.id WHERE run_label.run_id = ?'
     SELECT_RUN_POTENTIAL = 'SELECT potential.hash, potential.schema FROM potential JOIN run ON run.potential_hash = potential.hash WHERE run.id = ?'
     SELECT_RUN_TRAINING = 'SELECT training.hash, training.schema FROM training JOIN run ON run.training_hash = training.hash WHERE run.id = ?'
     SELECT_RUN_EVALUATION_COUNT = 'SELECT count(*) as num_evaluations FROM evaluation WHERE run_id = ?'
     SELECT_RUN_EVALUATION = '''
-    SELECT parameters, errors, value FROM evaluation
+    SELECT parameters, errors, value, kind, fidelity FROM evaluation
     WHERE run_id = ? ORDER BY id LIMIT ? OFFSET ?
     '''
 
@@ -210,8 +245,8 @@ def copy_database_to_database(src_dbm, dest_dbm, only_unique=False):
 
     INSERT_RUN_POTENTIAL = 'INSERT INTO potential (hash, schema) VALUES (?, ?)'
     INSERT_RUN_TRAINING = 'INSERT INTO training (hash, schema) VALUES (?, ?)'
-    INSERT_RUN = 'INSERT INTO run (name, potential_hash, training_hash, configuration, start_time, end_time, initial_parameters, indicies, bounds, features, weights) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
-    INSERT_RUN_EVALUATION = 'INSERT INTO evaluation (run_id, parameters, errors, value) VALUES (?, ?, ?, ?)'
+    INSERT_RUN = 'INSERT INTO run (name, potential_hash, training_hash, configuration, start_time, end_time, initial_parameters, indicies, bounds, features, weights, profile) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+    INSERT_RUN_EVALUATION = 'INSERT INTO evaluation (run_id, parameters, errors, value, kind, fidelity) VALUES (?, ?, ?, ?, ?, ?)'
 
     for run in src_dbm.connection.execute(SELECT_RUNS):
         # Potential
@@ -243,7 +278,8 @@ def copy_database_to_database(src_dbm, dest_dbm, only_unique=False):
                 cursor = dest_dbm.connection.execute(INSERT_RUN, (
                     query_result['name'], potential_hash, training_hash, query_result['configuration'],
                     query_result['start_time'], query_result['end_time'],
-                    query_result['initial_parameters'], query_result['indicies'], query_result['bounds'], query_result['features'], query_result['weights']))
+                    query_result['initial_parameters'], query_result['indicies'], query_result['bounds'], query_result['features'], query_result['weights'],
+                    query_result['profile']))
                 run_id = cursor.lastrowid
 
             # Evaluation
@@ -252,7 +288,7 @@ def copy_database_to_database(src_dbm, dest_dbm, only_unique=False):
             evaluation_limit = 1000
             for offset in range(0, num_evaluations, evaluation_limit):
                 cursor = src_dbm.connection.execute(SELECT_RUN_EVALUATION, (run['id'], evaluation_limit, offset))
-                evaluations = [(run_id, row['parameters'], row['errors'], row['value']) for row in cursor]
+                evaluations = [(run_id, row['parameters'], row['errors'], row['value'], row['kind'], row['fidelity']) for row in cursor]
                 with dest_dbm.connection:
                     dest_dbm.connection.executemany(INSERT_RUN_EVALUATION, evaluations)
 
@@ -35,6 +35,7 @@ CREATE TABLE IF NOT EXISTS run (
     bounds             JSON NOT NULL,
     features           JSON NOT NULL,
     weights            JSON NOT NULL,
+    profile            JSON,
 
     FOREIGN KEY(potential_hash) REFERENCES potential(hash),
     FOREIGN KEY(training_hash) REFERENCES training(hash)
@@ -69,11 +70,25 @@ CREATE TABLE IF NOT EXISTS evaluation (
     parameters         JSON NOT NULL,
     errors             JSON NOT NULL,
     value              REAL,
+    kind               TEXT NOT NULL DEFAULT 'full',
+    fidelity           TEXT NOT NULL DEFAULT 'full',
 
     FOREIGN KEY(run_id) REFERENCES run(id)
 )
 """
 
+# progress of running batch jobs is counted per run
+EVALUATION_RUN_INDEX = """
+CREATE INDEX IF NOT EXISTS evaluation_run_id ON evaluation(run_id)
+"""
+
+# columns added after the initial table definitions (table, column, definition)
+COLUMN_MIGRATIONS = [
+    ('evaluation', 'kind', "TEXT NOT NULL DEFAULT 'full'"),
+    ('evaluation', 'fidelity', "TEXT NOT NULL DEFAULT 'full'"),
+    ('run', 'profile', 'JSON'),
+]
+
 
 class DatabaseManager:
     def __init__(self, filename=None):
@@ -114,6 +129,16 @@ class DatabaseManager:
         self.connection.execute(RUN_LABEL_TABLE)
         self.connection.execute(LABEL_TABLE)
         self.connection.execute(EVALUATION_TABLE)
+        self.connection.execute(EVALUATION_RUN_INDEX)
+        self.migrate_tables()
+
+    def migrate_tables(self):
+        """Add columns missing from databases created by older versions"""
+        for table, column, definition in COLUMN_MIGRATIONS:
+            columns = {row['name'] for row in self.connection.execute(f'PRAGMA table_info({table})')}
+            if column not in columns:
+                with self.connection:
+                    self.connection.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
 
     @property
     def connection(self):
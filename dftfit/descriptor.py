@@ -0,0 +1,196 @@
+""" Structure descriptors used to compare training calculations
+
+"""
+import itertools
+import collections
+
+import numpy as np
+
+from .io.base import CalculationRecord
+from .io.utils import element_type_to_symbol
+
+
+def lattice_descriptor(lattice_matrix):
+    """ Rotation invariant lengths of lattice vectors a, b, c, a+b,
+    a+c, b+c, and a+b+c in [Angstroms]
+
+    """
+    a, b, c = np.asarray(lattice_matrix)
+    return np.linalg.norm([a, b, c, a+b, a+c, b+c, a+b+c], axis=1)
+
+
+def _site_arrays(structure):
+    """ Element symbols, lattice matrix, and fractional coordinates of
+    a pymatgen.Structure or CalculationRecord
+
+    CalculationRecord arrays are used directly without building a
+    pymatgen.Structure.
+    """
+    symbols = np.array([element_type_to_symbol(s) for s in structure.species])
+    if isinstance(structure, CalculationRecord):
+        frac_coords = np.linalg.solve(structure.lattice.T, structure.positions.T).T
+        return symbols, structure.lattice, frac_coords
+    return symbols, structure.lattice.matrix, structure.frac_coords
+
+
+def minimum_image_distances(lattice_matrix, frac_coords):
+    """ Minimum image distances between each pair of sites i < j
+
+    Fractional differences are wrapped into [-0.5, 0.5] and the 27
+    neighboring images are searched.
+
+    Returns
+    -------
+    tuple:
+        (i, j, distances) where distances is in [Angstroms]
+    """
+    lattice_matrix = np.asarray(lattice_matrix, dtype=float)
+    frac_coords = np.asarray(frac_coords, dtype=float)
+    i, j = np.triu_indices(len(frac_coords), k=1)
+    delta = frac_coords[j] - frac_coords[i]
+    delta -= np.round(delta)
+    distances = np.full(len(i), np.inf)
+    for image in itertools.product((-1, 0, 1), repeat=3):
+        distances = np.minimum(distances, np.linalg.norm((delta + image) @ lattice_matrix, axis=1))
+    return i, j, distances
+
+
+def element_pair_distances(structure):
+    """ Minimum image distances for each pair of elements
+
+    Element pairs are ordered alphabetically.
+
+    Parameters
+    ----------
+    structure: pymatgen.Structure or CalculationRecord
+        structure to compute distances of
+
+    Returns
+    -------
+    list:
+        list of ((element, element), numpy.ndarray of distances)
+    """
+    symbols, lattice_matrix, frac_coords = _site_arrays(structure)
+    i, j, pair_distances = minimum_image_distances(lattice_matrix, frac_coords)
+
+    element_pairs = []
+    for e1, e2 in itertools.combinations_with_replacement(sorted(set(symbols)), 2):
+        mask = ((symbols[i] == e1) & (symbols[j] == e2)) | ((symbols[i] == e2) & (symbols[j] == e1))
+        element_pairs.append(((e1, e2), pair_distances[mask]))
+    return element_pairs
+
+
+def sorted_pair_distances(structure):
+    """ Sorted minimum image distances for each pair of elements
+
+    Distances are invariant to rotation, translation, and
+    permutation of sites.
+    """
+    descriptor = [np.sort(distances) for elements, distances in element_pair_distances(structure)]
+    return np.concatenate(descriptor) if descriptor else np.zeros(0)
+
+
+def structure_fingerprint(structure):
+    """ Fingerprint of structure for detecting duplicates
+
+    Returns
+    -------
+    tuple:
+        (key, descriptor) where structures can only be duplicates if
+        key is equal and descriptor is a numpy.ndarray in [Angstroms]
+    """
+    symbols, lattice_matrix, frac_coords = _site_arrays(structure)
+    key = tuple(sorted(collections.Counter(symbols.tolist()).items()))
+    descriptor = np.concatenate([
+        lattice_descriptor(lattice_matrix),
+        sorted_pair_distances(structure)
+    ])
+    return key, descriptor
+
+
+def pair_distribution_histogram(structure, cutoff=6.0, bins=24):
+    """ Histogram of minimum image pair distances for each pair of
+    elements normalized by the number of sites
+
+    """
+    descriptor = []
+    for elements, distances in element_pair_distances(structure):
+        histogram, edges = np.histogram(distances, bins=bins, range=(0.0, cutoff))
+        descriptor.append(histogram / len(structure))
+    return np.concatenate(descriptor) if descriptor else np.zeros(0)
+
+
+def force_statistics(forces):
+    """ Mean, standard deviation, and maximum of force magnitudes """
+    magnitudes = np.linalg.norm(forces, axis=1)
+    return np.array([magnitudes.mean(), magnitudes.std(), magnitudes.max()])
+
+
+def calculation_descriptor(structure, forces, cutoff=6.0, bins=24):
+    """ Descriptor of a single calculation used for selecting diverse
+    training calculations
+
+    """
+    return np.concatenate([
+        pair_distribution_histogram(structure, cutoff=cutoff, bins=bins),
+        force_statistics(forces)
+    ])
+
+
+def _standardize(descriptors):
+    descriptors = np.asarray(descriptors, dtype=float)
+    std = descriptors.std(axis=0)
+    std[std == 0] = 1.0
+    return (descriptors - descriptors.mean(axis=0)) / std
+
+
+def farthest_point_sampling(descriptors, num_samples):
+    """ Greedily select descriptors that are farthest from all
+    previously selected descriptors. Starts from the first descriptor.
+
+    Returns
+    -------
+    numpy.ndarray:
+        sorted indicies of selected descriptors
+    """
+    descriptors = _standardize(descriptors)
+    num_samples = min(num_samples, len(descriptors))
+    if num_samples <= 0:
+        return np.zeros(0, dtype=int)
+
+    selected = [0]
+    min_distances = np.linalg.norm(descriptors - descriptors[0], axis=1)
+    for _ in range(num_samples - 1):
+        index = int(np.argmax(min_distances))
+        if min_distances[index] == 0.0:  # remaining descriptors are duplicates
+            break
+        selected.append(index)
+        min_distances = np.minimum(min_distances, np.linalg.norm(descriptors - descriptors[index], axis=1))
+    return np.array(sorted(selected), dtype=int)
+
+
+def kmeans_sampling(descriptors, num_samples, seed=0):
+    """ Cluster descriptors with k-means and select the descriptor
+    closest to each cluster center
+
+    Returns
+    -------
+    numpy.ndarray:
+        sorted indicies of selected descriptors
+    """
+    from sklearn.cluster import KMeans
+
+    descriptors = _standardize(descriptors)
+    num_samples = min(num_samples, len(descriptors))
+    if num_samples <= 0:
+        return np.zeros(0, dtype=int)
+
+    kmeans = KMeans(n_clusters=num_samples, random_state=seed, n_init=10).fit(descriptors)
+    selected = set()
+    for label, center in enumerate(kmeans.cluster_centers_):
+        members = np.flatnonzero(kmeans.labels_ == label)
+        if len(members) == 0:
+            continue
+        distances = np.linalg.norm(descriptors[members] - center, axis=1)
+        selected.add(int(members[np.argmin(distances)]))
+    return np.array(sorted(selected), dtype=int)
@@ -5,7 +5,7 @@ from .potential import Potential
 from .training import Training
 from .config import Configuration
 from .optimize import Optimize
-from .batch import apply_batch_schema_on_schemas, naive_scheduler
+from .batch import apply_batch_schema_on_schemas, batch_scheduler
 
 from .db import write_run_initial, write_run_final
 
@@ -27,15 +27,21 @@ def dftfit(configuration_schema, potential_schema, training_schema):
     return run_id
 
 
-def dftfit_process(full_schema, task_id, result_queue):
+def dftfit_process(full_schema, connection):
+    """ Run single batch job reporting ("started"|"completed", database_filename, run_id) to scheduler"""
     configuration = Configuration(full_schema['configuration'])
     potential = Potential(full_schema['potential'])
     training = Training(full_schema['training'], **configuration.training_kwargs)
 
-    potential_hash, run_id = write_run_initial(configuration.dbm, potential, training, configuration)
-    _dftfit_internal(configuration, potential, training, run_id)
     database_filename = os.path.expanduser(configuration.schema['spec']['database']['filename'])
-    result_queue.put((task_id, database_filename, run_id))
+    potential_hash, run_id = write_run_initial(configuration.dbm, potential, training, configuration)
+    connection.send(('started', database_filename, run_id))
+    try:
+        _dftfit_internal(configuration, potential, training, run_id)
+    finally:
+        write_run_final(configuration.dbm, run_id)
+    connection.send(('completed', database_filename, run_id))
+    connection.close()
 
 
 def _dftfit_internal(configuration, potential, training, run_id):
@@ -66,7 +72,13 @@ def _dftfit_internal(configuration, potential, training, run_id):
         logger.info('(population) including initial potential guess')
         population.push_back(potential.optimization_parameters)
 
-    optimize.optimize(population, steps=configuration.steps, seed=configuration.seed)
+    population = optimize.optimize(population, steps=configuration.steps, seed=configuration.seed)
+
+    if configuration.refine is not None:
+        logger.info('(refine) refining best individual')
+        parameters, value = optimize.refine(optimize.champion_x, **configuration.refine)
+        logger.info('(refine) refined individual value %.6g parameters %s' % (value, parameters.tolist()))
+    optimize.finalize()
 
 
 def dftfit_batch(configuration_schema, potential_schema, training_schema, batch_schema):
@@ -85,6 +97,9 @@ def dftfit_batch(configuration_schema, potential_schema, training_schema, batch_
         potential_schema,
         training_schema,
         batch_schema)
-    scheduler_frequency = batch_schema.get('scheduler_frequency', 5)
-    monitor_interval = batch_schema.get('monitor_interval', 60)
-    return naive_scheduler(full_schemas, scheduler_frequency, monitor_interval)
+    batch_spec = batch_schema.get('spec', {})
+    return batch_scheduler(
+        full_schemas,
+        monitor_interval=batch_spec.get('monitor_interval', 60),
+        max_cpus=batch_spec.get('max_cpus'),
+        max_retries=batch_spec.get('max_retries', 1))
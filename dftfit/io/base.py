@@ -1,4 +1,12 @@
+import asyncio
+
+import numpy as np
+import pymatgen as pmg
+
+
 class DFTReader:
+    __slots__ = ()
+
     @property
     def forces(self):
         """ return numpy.ndarray X x 3 in units [eV/Angstom] """
@@ -20,6 +28,78 @@ class DFTReader:
         raise NotImplementedError()
 
 
+class CalculationRecord(DFTReader):
+    """ Array backed calculation
+
+    Only stores species, lattice matrix, and cartesian positions. The
+    pymatgen.Structure is built on first access of ``structure``
+    which saves memory and load time for large training sets.
+
+    Parameters
+    ----------
+    species: list
+        specie string of each site
+    lattice: numpy.ndarray
+        3 x 3 lattice matrix in [Angstroms]
+    positions: numpy.ndarray
+        X x 3 cartesian positions in [Angstroms]
+    forces: numpy.ndarray
+        X x 3 forces in [eV/Angstrom]
+    stress: numpy.ndarray
+        3 x 3 stress in [bar]
+    energy: float
+        energy in [eV]
+    """
+    __slots__ = ('species', 'lattice', 'positions', '_forces', '_stress', '_energy', '_structure')
+
+    def __init__(self, species, lattice, positions, forces, stress, energy):
+        self.species = species
+        self.lattice = np.asarray(lattice, dtype=float)
+        self.positions = np.asarray(positions, dtype=float)
+        self._forces = np.asarray(forces, dtype=float)
+        self._stress = np.asarray(stress, dtype=float)
+        self._energy = float(energy)
+        self._structure = None
+
+    @classmethod
+    def from_structure(cls, structure, forces, stress, energy):
+        calculation = cls([str(site.specie) for site in structure], structure.lattice.matrix,
+                          structure.cart_coords, forces, stress, energy)
+        calculation._structure = structure
+        return calculation
+
+    def __getstate__(self):
+        # structure is rebuilt on demand after unpickling
+        return (self.species, self.lattice, self.positions, self._forces, self._stress, self._energy)
+
+    def __setstate__(self, state):
+        self.species, self.lattice, self.positions, self._forces, self._stress, self._energy = state
+        self._structure = None
+
+    def __len__(self):
+        return len(self.species)
+
+    @property
+    def forces(self):
+        return self._forces
+
+    @property
+    def stress(self):
+        return self._stress
+
+    @property
+    def energy(self):
+        return self._energy
+
+    @property
+    def structure(self):
+        if self._structure is None:
+            self._structure = pmg.Structure(
+                pmg.Lattice(self.lattice), list(self.species), self.positions,
+                coords_are_cartesian=True)
+        return self._structure
+
+
 class MDReader:
     def __init__(self, forces, stress, energy, structure):
         self._forces = forces
@@ -48,6 +128,10 @@ class MDReader:
         return self._structure
 
 
+class CalculatorFailure(Exception):
+    """Calculation of potential failed (worker crashed, timed out, or raised an error)"""
+
+
 class DFTFITCalculator:
     """DFTFIT interface. Should have a simple api. Only `__init__`
     interface may change.
@@ -59,10 +143,27 @@ class DFTFITCalculator:
     async def create(self):
         raise NotImplementedError()
 
-    async def submit(self, potential, properties=None):
+    async def submit(self, potential, properties=None, indicies=None):
+        """Calculate properties of structures with indicies (default all)"""
         properties = properties or {'stress', 'energy', 'forces'}
         raise NotImplementedError()
 
+    def set_fidelity(self, fidelity):
+        """Reduce accuracy of following calculations (``None`` for full accuracy)"""
+        raise NotImplementedError('calculator does not support reduced fidelity')
+
+    async def submit_batch(self, potentials, properties=None, indicies=None):
+        """Calculate properties of structures for each potential"""
+        return await asyncio.gather(*[self.submit(potential, properties, indicies) for potential in potentials])
+
+    def stage_timings(self):
+        """Return and reset durations of calculator stages (see :class:`dftfit.timing.StageTimer`)"""
+        return {}
+
+    def worker_status(self):
+        """Status of each worker with keys busy_seconds, failures, and rss_bytes"""
+        return []
+
 
 class MDCalculator:
     async def submit(self, structure, potential):
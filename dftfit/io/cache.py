@@ -0,0 +1,132 @@
+""" Content addressed cache of training data
+
+Each entry is a directory of numpy ``.npy`` arrays named by the
+sha256 of its key. Calculations are stored as columns (species,
+lattice, cartesian positions, forces, stress, energy) with sites of
+all calculations concatenated. Arrays are memory mapped on load so
+reading a cached training set does not unpickle any pymatgen objects.
+
+Entries are written to a temporary directory and renamed into place
+so multiple processes may share a cache.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+from .base import CalculationRecord
+
+
+CALCULATION_ARRAYS = ('num_sites', 'species', 'lattice', 'positions', 'forces', 'stress', 'energy')
+
+
+class TrainingCache:
+    """ Content addressed array cache
+
+    Parameters
+    ----------
+    directory: str
+        directory to store cache entries
+    """
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def __contains__(self, key):
+        return os.path.isdir(self._path(key))
+
+    def get(self, key, mmap_mode='r'):
+        """ Arrays stored under key or None if not cached """
+        path = self._path(key)
+        if not os.path.isdir(path):
+            return None
+        with open(os.path.join(path, 'index.json')) as f:
+            names = json.load(f)['arrays']
+        return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in names}
+
+    def set(self, key, arrays):
+        """ Store dictionary of arrays under key """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(temporary_path, name + '.npy'), np.asarray(array))
+            with open(os.path.join(temporary_path, 'index.json'), 'w') as f:
+                json.dump({'key': key, 'arrays': sorted(arrays)}, f)
+            os.rename(temporary_path, path)
+        except OSError:
+            # another process stored the same entry first
+            if not os.path.isdir(path):
+                raise
+        finally:
+            if os.path.isdir(temporary_path):
+                shutil.rmtree(temporary_path)
+
+    def get_calculations(self, key):
+        arrays = self.get(key)
+        if arrays is None:
+            return None
+        return arrays_to_calculations(arrays)
+
+    def set_calculations(self, key, calculations):
+        self.set(key, calculations_to_arrays(calculations))
+
+
+def file_cache_key(reader, filename, selector=None):
+    """ Cache key of parsed output file by path, mtime, and size
+
+    Any change to the file or to the selector results in a new key.
+    """
+    filename = os.path.abspath(str(filename))
+    stat = os.stat(filename)
+    return 'file.%s.%s.%d.%d.%s' % (
+        reader, filename, stat.st_mtime_ns, stat.st_size,
+        json.dumps(selector or {}, sort_keys=True))
+
+
+def _structure_arrays(calculation):
+    if isinstance(calculation, CalculationRecord):
+        return calculation.species, calculation.lattice, calculation.positions
+    structure = calculation.structure
+    return [str(site.specie) for site in structure], structure.lattice.matrix, structure.cart_coords
+
+
+def calculations_to_arrays(calculations):
+    """ Convert calculations to columnar arrays """
+    species, lattices, positions = zip(*[_structure_arrays(c) for c in calculations]) if calculations else ((), (), ())
+    return {
+        'num_sites': np.array([len(s) for s in species], dtype=int),
+        'species': np.array([s for _species in species for s in _species], dtype=str),
+        'lattice': np.array(lattices, dtype=float).reshape(-1, 3, 3),
+        'positions': np.concatenate(positions) if calculations else np.zeros((0, 3)),
+        'forces': np.concatenate([np.asarray(c.forces, dtype=float) for c in calculations]) if calculations else np.zeros((0, 3)),
+        'stress': np.array([c.stress for c in calculations], dtype=float).reshape(-1, 3, 3),
+        'energy': np.array([c.energy for c in calculations], dtype=float),
+    }
+
+
+def arrays_to_calculations(arrays):
+    """ Convert columnar arrays to calculations
+
+    Array slices are views of the (memory mapped) cache arrays.
+    """
+    calculations = []
+    offsets = np.concatenate([[0], np.cumsum(arrays['num_sites'])])
+    for i in range(len(arrays['num_sites'])):
+        sites = slice(offsets[i], offsets[i+1])
+        calculations.append(CalculationRecord(
+            species=arrays['species'][sites].tolist(),
+            lattice=arrays['lattice'][i],
+            positions=arrays['positions'][sites],
+            forces=arrays['forces'][sites],
+            stress=arrays['stress'][i],
+            energy=arrays['energy'][i]))
+    return calculations
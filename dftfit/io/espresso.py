@@ -1,113 +1,167 @@
-# TODO: update to new interface
-
+from pathlib import Path
 import re
-import xml.etree.ElementTree as ET
-from collections import defaultdict
-from math import cos, radians, sqrt
+import glob
 
 import numpy as np
-from ase import Atoms
-from ase.geometry import cell_to_cellpar
 
-# Heavily used constants
-double_regex = r'[-+]?\d+\.\d+(?:[eE][-+]?\d+)?'
-int_regex = '[+-]?\d+'
+from .base import CalculationRecord
+from .selector import select_steps
+
+
+bohr = 0.52917721067 # Angstrom/bohr
+Ry = 13.605693009 # eV/Rydberg
+
+UNITS_REGEX = re.compile(r'[({]\s*(\w+)')
+SPECIES_REGEX = re.compile(r'[A-Z][a-z]?')
+ALAT_REGEX = re.compile(r'alat\s*=\s*([-+\d.eE]+)')
+
+
+def _parenthesis_numbers(line):
+    return line[line.index('(', line.index('=')) + 1:line.rindex(')')].split()
+
 
-bohr = 0.529 #Ang/bohr
-Ry = 13.60569 #eV/Rydberg
-KBar = 0.1 #GPa/KBar
+def _read_lines(lines, count, keep=lambda line: True):
+    """ Read next count lines that are not blank and satisfy keep"""
+    block = []
+    while len(block) < count:
+        line = next(lines)
+        if line.strip() and keep(line):
+            block.append(line)
+    return block
 
 
+def _block_units(line, default):
+    match = UNITS_REGEX.search(line)
+    return match.group(1).lower() if match else default
 
 
-def read_qe_outfile(filename):
-    """Reads the output file for a Quantum Espresso run to extract the
-    forces on each atom, unit cell, and atom positions.
+def _convert_positions(lines, units, alat, lattice):
+    # species labels may have suffixes e.g. Fe1
+    symbols = [SPECIES_REGEX.match(line.split()[0]).group(0) for line in lines]
+    positions = np.array([line.split()[1:4] for line in lines], dtype=float)
+    if units == 'bohr':
+        positions = positions * bohr
+    elif units == 'alat':
+        positions = positions * alat * bohr
+    elif units == 'crystal':
+        positions = positions.dot(lattice)
+    elif units != 'angstrom':
+        raise ValueError('unsupported ATOMIC_POSITIONS units %s' % units)
+    return symbols, positions
 
-    Will only output the last scf step. Meaning that if a molecular
-    dynamics run was performed only the last step is used.
+
+def iter_qe_steps(filename, indicies=None):
+    """ Stream scf steps from Quantum Espresso pw.x output file
+
+    The file is read line by line in a single pass. Each step is
+    made of the positions and cell (initial or latest
+    ``ATOMIC_POSITIONS``/``CELL_PARAMETERS``) along with the following
+    total energy, forces, and stress. Numbers are only converted for
+    steps in indicies.
+
+    Parameters
+    ----------
+    filename: str
+        pw.x output filename
+    indicies: set, optional
+        steps to convert. ``None`` converts all steps.
+
+    Yields
+    ------
+    tuple:
+        (index, step) for every step with energy, forces, and stress.
+        step is a dictionary with keys species, lattice, positions
+        (cartesian), energy [eV], stress [bar], and forces [eV/Angstrom]
+        (``None`` if step not in indicies).
     """
-    with open(filename, "r") as f:
-        out_str = f.read()
-
-        alat_regex = r"lattice parameter \(alat\)\s+=\s+({0})".format(double_regex)
-
-        lattice_regex = (
-            r"crystal axes: \(cart\. coord\. in units of alat\)\s+"
-            r"a\(1\) = \(\s+({0})\s+({0})\s+({0})\s+\)\s+"
-            r"a\(2\) = \(\s+({0})\s+({0})\s+({0})\s+\)\s+"
-            r"a\(3\) = \(\s+({0})\s+({0})\s+({0})\s+\)\s+"
-        ).format(double_regex)
-
-        alat = float(re.search(alat_regex, out_str).group(1))
-
-        basis = np.array([float(_) for _ in re.search(
-            lattice_regex, out_str).groups()]) * alat * bohr
-        basis.shape = (3, 3)
-
-        force_regex = (
-            'atom\s+{1}\s+type\s+{1}\s+force\s+=\s+({0})\s+({0})\s+({0})\s+'
-        ).format(double_regex, int_regex)
-
-        force_block_regex = (
-            r'Forces acting on atoms \(Ry/au\):\s+'
-            r'((?:atom\s+{1}\s+type\s+{1}\s+force\s+=\s+{0}\s+{0}\s+{0}\s+)+)'
-        ).format(double_regex, int_regex)
-
-        position_regex = (
-            '([A-Z][a-z]?)\s+({0})\s+({0})\s+({0})\s+'
-        ).format(double_regex, int_regex)
-
-        position_block_regex = (
-            r'ATOMIC_POSITIONS \(angstrom\)\s+'
-            r'((?:[A-Z][a-z]?\s+{0}\s+{0}\s+{0}\s+)+)'
-        ).format(double_regex)
-
-        stresses_regex = (
-            r"total\s+stress\s+\(Ry/bohr\*\*3\)\s+\(kbar\)\s+P=\s+{0}\s+"
-            r"({0})\s+({0})\s+({0})\s+{0}\s+{0}\s+{0}\s+"
-            r"({0})\s+({0})\s+({0})\s+{0}\s+{0}\s+{0}\s+"
-            r"({0})\s+({0})\s+({0})\s+{0}\s+{0}\s+{0}\s+"
-        ).format(double_regex)
-
-        total_energy_regex = "!\s+total energy\s+=\s+({0})\s+Ry".format(double_regex)
-
-        steps = []
-        for forces_block, positions_block, stresses, total_energy in zip(
-                re.findall(force_block_regex, out_str),
-                re.findall(position_block_regex, out_str),
-                re.findall(stresses_regex, out_str),
-                re.findall(total_energy_regex, out_str)):
-
-            positions = []
-            symbols = []
-            forces = []
-
-            for position, force in zip(
-                    re.findall(position_regex, positions_block),
-                    re.findall(force_regex, forces_block)):
-
-                symbols.append(position[0])
-                positions.append([float(_) for _ in position[1:4]])
-                forces.append([float(_) for _ in force])
-
-            forces = np.array(forces)
-
-            stresses = np.array([float(_) for _ in stresses])
-            stresses.shape = (3, 3)
-
-            total_energy = float(total_energy)
-
-            steps.append({
-                'system': Atoms(symbols=symbols, positions=positions, cell=basis, pbc=True),
-                'dft': {
-                    'forces': forces * Ry / bohr,
-                    'stresses': stresses * Ry / (bohr**3),
-                    'total-energy': total_energy * Ry
-                }
-            })
-
-        if re.search("Molecular Dynamics Calculation", out_str):
-            return steps
+    alat, lattice, num_atoms = None, None, None
+    positions = None # (units, lines)
+    energy, forces, stress = None, None, None
+    index = 0
+
+    with open(filename) as f:
+        lines = iter(f)
+        for line in lines:
+            if 'lattice parameter (alat)' in line:
+                alat = float(line.split('=')[1].split()[0])
+            elif 'number of atoms/cell' in line:
+                num_atoms = int(line.split('=')[1])
+            elif 'crystal axes: (cart. coord. in units of alat)' in line:
+                block = _read_lines(lines, 3)
+                lattice = np.array([_parenthesis_numbers(l) for l in block], dtype=float) * alat * bohr
+            elif 'site n.' in line and 'positions (alat units)' in line:
+                block = _read_lines(lines, num_atoms)
+                positions = ('alat', ['%s %s' % (l.split()[1], ' '.join(_parenthesis_numbers(l))) for l in block])
+            elif line.startswith('!') and 'total energy' in line:
+                energy = line
+            elif 'Forces acting on atoms' in line:
+                forces = _read_lines(lines, num_atoms, keep=lambda l: 'force =' in l)
+            elif 'total   stress' in line:
+                stress = _read_lines(lines, 3)
+            elif line.startswith('CELL_PARAMETERS'):
+                units = _block_units(line, 'alat')
+                block = np.array(' '.join(_read_lines(lines, 3)).split(), dtype=float).reshape(3, 3)
+                if units.startswith('alat'):
+                    match = ALAT_REGEX.search(line)
+                    alat = float(match.group(1)) if match else alat
+                    lattice = block * alat * bohr
+                elif units == 'bohr':
+                    lattice = block * bohr
+                else:
+                    lattice = block
+            elif line.startswith('ATOMIC_POSITIONS'):
+                positions = (_block_units(line, 'alat'), _read_lines(lines, num_atoms))
+
+            if energy is not None and forces is not None and stress is not None:
+                step = None
+                if indicies is None or index in indicies:
+                    symbols, cartesian_positions = _convert_positions(positions[1], positions[0], alat, lattice)
+                    step = {
+                        'species': symbols,
+                        'lattice': lattice,
+                        'positions': cartesian_positions,
+                        'energy': float(energy.split('=')[1].split()[0]) * Ry,
+                        'forces': np.array([l.split('=')[1].split()[:3] for l in forces], dtype=float) * Ry / bohr,
+                        'stress': np.array(' '.join(stress).split(), dtype=float).reshape(3, 6)[:, 3:] * 1e3, # kbar -> bar
+                    }
+                yield index, step
+                index += 1
+                energy, forces, stress = None, None, None
+
+
+class QEReader(CalculationRecord):
+    __slots__ = ()
+
+    @classmethod
+    def from_step(cls, step):
+        return cls(step['species'], step['lattice'], step['positions'], step['forces'], step['stress'], step['energy'])
+
+    @classmethod
+    def from_file(cls, filename, step=-1):
+        if step < 0:
+            step = sum(1 for _ in iter_qe_steps(filename, set())) + step
+        for index, qe_step in iter_qe_steps(filename, {step}):
+            if qe_step is not None:
+                return cls.from_step(qe_step)
+        raise IndexError('step %d not in quantum espresso output %s' % (step, filename))
+
+    @classmethod
+    def from_selector(cls, selector):
+        data = []
+        if 'filename' in selector:
+            filename = selector['filename']
+            data.extend(cls._from_selector_with_filename(filename, selector))
+        elif 'fileglob' in selector:
+            for filename in sorted(glob.glob(selector['fileglob'], recursive=True)):
+                data.extend(cls._from_selector_with_filename(filename, selector))
         else:
-            return steps[-1]
+            raise ValueError('no way for selector to select data need filename or fileglob')
+        return data
+
+    @classmethod
+    def _from_selector_with_filename(cls, filename, selector):
+        filename = Path(filename)
+        if not filename.is_file():
+            raise ValueError('path %s must exist and be file' % filename)
+
+        return select_steps(selector, lambda indicies: iter_qe_steps(filename, indicies), cls.from_step)
@@ -155,12 +155,16 @@ class LammpsLocalDFTFITCalculator(DFTFITCalculator):
                 structure=structure
             )
 
-    async def submit(self, potential, properties=None):
+    async def submit(self, potential, properties=None, indicies=None):
         lammps_set = lammps_dftfit_set
         properties = properties or {'stress', 'energy', 'forces'}
+        if indicies is None:
+            structures = self.structures
+        else:
+            structures = [self.structures[i] for i in sorted(indicies)]
 
         futures = []
-        for structure in self.structures:
+        for structure in structures:
             lammps_input = LammpsInput(
                 LammpsScript(lammps_set),
                 LammpsData.from_structure(structure))
@@ -171,7 +175,7 @@ class LammpsLocalDFTFITCalculator(DFTFITCalculator):
             futures.append(await self.lammps_local_client.submit(
                 stdin, files, properties))
         results = await asyncio.gather(*futures)
-        return [self._convert_to_reader(s, r) for s, r in zip(self.structures, results)]
+        return [self._convert_to_reader(s, r) for s, r in zip(structures, results)]
 
     def shutdown(self):
         self.lammps_local_client.shutdown()
@@ -2,8 +2,11 @@ import math
 import itertools
 import functools
 import multiprocessing
+import multiprocessing.connection
 import asyncio
 import uuid
+import time
+import logging
 
 import numpy as np
 import pymatgen as pmg
@@ -20,20 +23,42 @@ from lammps.potential import (
 )
 
 from ..potential import Potential
-from .base import DFTFITCalculator, MDCalculator, MDReader
+from ..timing import StageTimer
+from ..metrics import process_rss
+from .base import DFTFITCalculator, MDCalculator, MDReader, CalculatorFailure
 
+logger = logging.getLogger(__name__)
 
 class LammpsCythonWorker:
     """A lammps cython worker
 
     All input and output is fully serializable.
+
+    When ``fast_run`` is enabled the training structures are assumed
+    to never move. Neighbor lists are built without a skin, ``run 0``
+    skips the post run statistics, and evaluations with parameters
+    identical to the previous evaluation reuse the previous results.
+    Pair and kspace setup is still done every run since LAMMPS only
+    recomputes derived pair coefficients on setup (``run 0 pre no``
+    would return stale forces).
     """
-    def __init__(self, structures, elements, potential_schema, unique_id=1):
+    FAST_RUN_COMMAND = 'run 0 post no'
+    DEFAULT_NEIGHBOR_COMMAND = 'neighbor 2.0 bin'  # metal units default
+    FAST_NEIGHBOR_COMMAND = 'neighbor 0.0 bin'
+
+    def __init__(self, structures, elements, potential_schema, unique_id=1, fast_run=False):
         self.structures = structures
         self.elements = elements
         self.potential = Potential(potential_schema)
         self.unique_id = unique_id
+        self.fast_run = fast_run
         self.lammps_systems = []
+        self._lammps_commands = None
+        self._results = {}
+        self._parameters_md5hash = None
+        self.fidelity = None
+        self.timer = StageTimer()
+        self.busy_time = 0.0
 
     def _initialize_lammps(self, structure):
         lmp = lammps.Lammps(units='metal', style='full', args=[
@@ -43,51 +68,191 @@ class LammpsCythonWorker:
         lmp.thermo.add('my_ke', 'ke', 'all')
         return lmp
 
+    def _optimized_cutoff(self):
+        """Whether any pair cutoff is an optimization parameter"""
+        for pair_potential in self.potential.schema['spec'].get('pair', []):
+            for cutoff in pair_potential.get('cutoff', []):
+                if not cutoff.fixed:
+                    return True
+        return False
+
+    def _calibrate_fast_run(self):
+        """Measure time of a full and fast run over all structures
+
+        Potential must already be applied to all lammps systems.
+        """
+        timings = {}
+        for mode, neighbor_command, run_command in [
+                ('full', self.DEFAULT_NEIGHBOR_COMMAND, 'run 0'),
+                ('fast', self.FAST_NEIGHBOR_COMMAND, self.FAST_RUN_COMMAND)]:
+            for lmp in self.lammps_systems:
+                lmp.command(neighbor_command)
+                lmp.command(run_command)  # warmup
+            start_time = time.perf_counter()
+            for lmp in self.lammps_systems:
+                lmp.command(run_command)
+            timings[mode] = time.perf_counter() - start_time
+
+        if self._optimized_cutoff():
+            logger.info('(lammps-cython) cutoff is optimized pair styles will be reinitialized on each cutoff change')
+        logger.info('(lammps-cython) fast run %.3f [ms] full run %.3f [ms] per evaluation: saving %.1f%%' % (
+            timings['fast'] * 1e3, timings['full'] * 1e3,
+            100.0 * (timings['full'] - timings['fast']) / timings['full'] if timings['full'] else 0.0))
+        return timings
+
     def create(self):
         for structure in self.structures:
             self.lammps_systems.append(self._initialize_lammps(structure))
+        self._lammps_commands = None
+
+    def _changed_commands(self, lammps_commands, filenames=()):
+        """Commands that need to be issued since last applied potential
+
+        Re-issuing ``pair_style`` resets all pair coefficients so the
+        full command set is only issued when a style changes. Commands
+        that reference potential ``filenames`` are always issued since
+        the file contents change between evaluations.
+        """
+        if self._lammps_commands is None or len(self._lammps_commands) != len(lammps_commands):
+            return lammps_commands
+
+        changed_commands = []
+        for command, last_command in zip(lammps_commands, self._lammps_commands):
+            if command.startswith('pair_style') and command != last_command:
+                return lammps_commands
+            elif command != last_command or any(filename in command for filename in filenames):
+                changed_commands.append(command)
+        return changed_commands
 
     def _apply_potential(self, potential):
-        lammps_commands = write_potential(potential, elements=self.elements, unique_id=self.unique_id)
-        for command in lammps_commands:
+        # each worker has its own potential files
+        with self.timer('write_potential_files'):
+            potential_files = write_potential_files(potential, elements=self.elements, unique_id=self.unique_id)
+            for filename, content in potential_files.items():
+                with open(filename, 'w') as f:
+                    f.write(content)
+
+        lammps_commands = write_potential(potential, elements=self.elements, unique_id=self.unique_id, fidelity=self.fidelity)
+        for command in self._changed_commands(lammps_commands, potential_files.keys()):
             for lmp in self.lammps_systems:
                 lmp.command(command)
+        self._lammps_commands = lammps_commands
+
+    def stage_timings(self):
+        """Return and reset durations of stages since last call"""
+        return self.timer.pop()
+
+    def status(self):
+        """Busy time and memory of worker (failures are counted by the
+        calculator since they restart the worker)"""
+        return {'busy_seconds': self.busy_time, 'rss_bytes': process_rss()}
 
     def worker_multiprocessing_loop(self, pipe):
         while True:
             message = pipe.recv()
             if isinstance(message, str) and message == 'quit':
                 break
-            results = self.compute(message)
+            method, *args = message
+            results = getattr(self, method)(*args)
             pipe.send(results)
         pipe.close()
 
-    def compute(self, parameters):
+    def set_fidelity(self, fidelity):
+        """Set reduced fidelity (``None`` for full fidelity) of
+        following computations see :func:`write_potential`"""
+        self.fidelity = fidelity
+        self._parameters_md5hash = None # cached results are for other fidelity
+
+    def compute_batch(self, parameters_batch, indicies=None):
+        """Compute structures for each parameters in batch
+
+        Batches avoid a round trip between the workers and the
+        calculator for each parameters.
+        """
+        start_time = time.perf_counter()
+        try:
+            return [self.compute(parameters, indicies) for parameters in parameters_batch]
+        finally:
+            self.busy_time += time.perf_counter() - start_time
+
+    def compute(self, parameters, indicies=None):
+        """Compute forces, stress, and energy of structures
+
+        Parameters
+        ----------
+        parameters: numpy.ndarray
+            optimization parameters of potential
+        indicies: list, optional
+            indicies of structures to compute (default all). Lammps
+            systems of all structures are kept so that subsets may
+            change between evaluations.
+        """
+        if indicies is None:
+            indicies = range(len(self.lammps_systems))
+
         self.potential.optimization_parameters = parameters
-        self._apply_potential(self.potential)
+        if self.fast_run and self._parameters_md5hash == self.potential.parameters_md5hash:
+            if all(i in self._results for i in indicies):
+                return [self._results[i] for i in indicies]
+        else:
+            self._results = {}
+
+        calibrate = self.fast_run and self._lammps_commands is None
+        with self.timer('apply_potential'):
+            self._apply_potential(self.potential)
+        if calibrate:
+            self._calibrate_fast_run()
+
         results = []
-        for lmp in self.lammps_systems:
-            lmp.run(0)
-            S = lmp.thermo.computes['thermo_press'].vector
-            results.append({
-                'forces': lmp.system.forces.copy(),
-                'energy': lmp.thermo.computes['thermo_pe'].scalar + lmp.thermo.computes['my_ke'].scalar,
-                'stress': np.array([
-                    [S[0], S[3], S[5]],
-                    [S[3], S[1], S[4]],
-                    [S[5], S[4], S[2]]
-                ])
-            })
+        with self.timer('lammps_run'):
+            for i in indicies:
+                lmp = self.lammps_systems[i]
+                if self.fast_run:
+                    lmp.command(self.FAST_RUN_COMMAND)
+                else:
+                    lmp.run(0)
+                S = lmp.thermo.computes['thermo_press'].vector
+                results.append({
+                    'forces': lmp.system.forces.copy(),
+                    'energy': lmp.thermo.computes['thermo_pe'].scalar + lmp.thermo.computes['my_ke'].scalar,
+                    'stress': np.array([
+                        [S[0], S[3], S[5]],
+                        [S[3], S[1], S[4]],
+                        [S[5], S[4], S[2]]
+                    ])
+                })
+
+        if self.fast_run:
+            self._results.update(zip(indicies, results))
+            self._parameters_md5hash = self.potential.parameters_md5hash
         return results
 
 
+def _run_worker(structures, elements, potential_schema, pipe, unique_id, fast_run, fidelity):
+    worker = LammpsCythonWorker(structures, elements, potential_schema, unique_id, fast_run=fast_run)
+    worker.create()
+    worker.set_fidelity(fidelity)
+    pipe.send('ready')
+    worker.worker_multiprocessing_loop(pipe)
+
+
 class LammpsCythonDFTFITCalculator(DFTFITCalculator):
     """This is not a general purpose lammps calculator. Only for dftfit
     evaluations. For now there are not plans to generalize it.
+
+    Worker processes are supervised. A worker that crashes (e.g. lammps
+    segfault), raises an error, or does not respond within
+    ``worker_timeout`` seconds per potential is restarted (rebuilding
+    its lammps systems) and the calculation raises
+    :class:`CalculatorFailure`. Workers run in separate processes when
+    ``num_workers > 1`` or a ``worker_timeout`` is set.
     """
-    def __init__(self, structures, potential, num_workers=1):
+    def __init__(self, structures, potential, num_workers=1, fast_run=False, worker_timeout=None):
         self.unique_id = str(uuid.uuid1())
         self.structures = structures
+        self.fast_run = fast_run
+        self.worker_timeout = worker_timeout
+        self._fidelity = None
 
         # ensure element indexes are the same between all lammps calculations
         self.elements = set()
@@ -96,70 +261,215 @@ class LammpsCythonDFTFITCalculator(DFTFITCalculator):
         self.elements = list(self.elements)
 
         self.workers = []
-        potential_schema = potential.as_dict()
-        if num_workers == 1:
-            self.workers.append(LammpsCythonWorker(structures, self.elements, potential_schema, self.unique_id))
+        self.timer = StageTimer()
+        self._worker_failures = [0] * num_workers
+        # busy seconds of restarted workers (as last reported) are
+        # carried so that the exported counter never decreases
+        self._worker_busy_seconds = [0.0] * num_workers
+        self._worker_reported_busy_seconds = [0.0] * num_workers
+        self._potential_schema = potential.as_dict()
+        self._multiprocessing = num_workers > 1 or worker_timeout is not None
+        if not self._multiprocessing:
+            self.workers.append(LammpsCythonWorker(structures, self.elements, self._potential_schema, self.unique_id, fast_run=fast_run))
         else:
-            def create_worker(structures, elements, potential_schema, pipe):
-                worker = LammpsCythonWorker(structures, elements, potential_schema, self.unique_id)
-                worker.create()
-                worker.worker_multiprocessing_loop(pipe)
-
-            self.workers = []
+            self._worker_structures = []
+            self._worker_offsets = []
             structure_index = 0
             rem = len(structures) % num_workers
             n = math.floor(len(structures) / num_workers)
             for i in range(num_workers):
-                p_conn, c_conn = multiprocessing.Pipe()
-                # hand out remaining to first rem < i
-                if num_workers - rem >= i:
-                    subset_structures = structures[structure_index: structure_index+n+1]
-                    structure_index += n + 1
-                else:
-                    subset_structures = structures[structure_index: structure_index+n]
-                    structure_index += n
-                p = multiprocessing.Process(target=create_worker, args=(subset_structures, self.elements, potential_schema, c_conn))
-                p.start()
-                self.workers.append((p, p_conn))
+                # hand out remaining to first rem workers
+                subset_structures = structures[structure_index: structure_index + n + (1 if i < rem else 0)]
+                self._worker_offsets.append((structure_index, structure_index + len(subset_structures)))
+                self._worker_structures.append(subset_structures)
+                structure_index += len(subset_structures)
+
+            self.workers = [self._spawn_worker(i) for i in range(num_workers)]
+            for i in range(num_workers):
+                self._wait_worker_ready(i)
+
+    def _spawn_worker(self, i):
+        p_conn, c_conn = multiprocessing.Pipe()
+        p = multiprocessing.Process(target=_run_worker, args=(
+            self._worker_structures[i], self.elements, self._potential_schema, c_conn,
+            '%s.%d' % (self.unique_id, i), self.fast_run, self._fidelity))
+        p.start()
+        c_conn.close() # recv raises EOFError instead of blocking if worker dies
+        return p, p_conn
+
+    def _wait_worker_ready(self, i):
+        p, p_conn = self.workers[i]
+        ready = multiprocessing.connection.wait([p_conn, p.sentinel])
+        if p_conn not in ready or p_conn.recv() != 'ready':
+            raise ValueError('lammps-cython worker %d failed to create lammps systems' % i)
+
+    def _restart_worker(self, i):
+        """Kill (if still running) and respawn worker with new lammps systems"""
+        self._worker_failures[i] += 1
+        if not self._multiprocessing:
+            self._worker_reported_busy_seconds[i] = self.workers[i].busy_time
+        self._worker_busy_seconds[i] += self._worker_reported_busy_seconds[i]
+        self._worker_reported_busy_seconds[i] = 0.0
+        if not self._multiprocessing:
+            worker = LammpsCythonWorker(self.structures, self.elements, self._potential_schema, self.unique_id, fast_run=self.fast_run)
+            worker.create()
+            worker.set_fidelity(self._fidelity)
+            self.workers[0] = worker
+        else:
+            p, p_conn = self.workers[i]
+            if p.is_alive():
+                p.terminate()
+            p.join()
+            p_conn.close()
+            logger.warning('(lammps-cython) worker %d exited with %s' % (i, p.exitcode))
+            self.workers[i] = self._spawn_worker(i)
+            self._wait_worker_ready(i)
+        logger.warning('(lammps-cython) restarted worker %d (%d failures)' % (i, self._worker_failures[i]))
 
     async def create(self):
         # otherwise seperate process calls this method
-        if len(self.workers) == 1:
+        if not self._multiprocessing:
             self.workers[0].create()
 
-    def _apply_potential_files(self, potential):
-        lammps_files = write_potential_files(potential, elements=self.elements, unique_id=self.unique_id)
-        for filename, content in lammps_files.items():
-            with open(filename, 'w') as f:
-                f.write(content)
+    def _compute_batch(self, parameters_batch, indicies):
+        if not self._multiprocessing:
+            try:
+                return self.workers[0].compute_batch(parameters_batch, indicies)
+            except Exception as error:
+                logger.warning('(lammps-cython) worker 0 failed: %s' % error)
+                self._restart_worker(0)
+                raise CalculatorFailure('lammps-cython worker 0 failed: %s' % error) from error
+
+        # send potentials and local structure indicies to each worker
+        messages = [('compute_batch', parameters_batch, [i - start for i in indicies if start <= i < stop]) for start, stop in self._worker_offsets]
+        timeout = None if self.worker_timeout is None else self.worker_timeout * len(parameters_batch)
+        replies, failed = self._request_workers(messages, timeout, timed=True)
+        if failed:
+            raise CalculatorFailure('lammps-cython workers %s' % ', '.join('%d %s' % f for f in failed))
+
+        results = [[] for _ in parameters_batch]
+        for worker_results in replies:
+            for batch_results, structure_results in zip(results, worker_results):
+                batch_results.extend(structure_results)
+        return results
 
-    async def submit(self, potential, properties=None):
-        properties = properties or {'stress', 'energy', 'forces'}
-        parameters = potential.optimization_parameters
-        self._apply_potential_files(potential)
+    def _request_workers(self, messages, timeout=None, timed=False):
+        """Send a message to each worker process and receive the replies
+
+        Workers that are dead, exit before replying, or do not reply
+        within ``timeout`` seconds are restarted once all other
+        workers have replied so that the pipes stay in sync.
+
+        Returns
+        -------
+        tuple:
+            (replies, failed) where replies of failed workers are
+            ``None`` and failed is a list of (worker index, reason)
+        """
+        failed = []
+        sent = []
+        start_time = time.perf_counter()
+        for i, ((p, p_conn), message) in enumerate(zip(self.workers, messages)):
+            if p.is_alive():
+                try:
+                    p_conn.send(message)
+                    sent.append(i)
+                    continue
+                except OSError:
+                    pass # worker died before receiving message
+            failed.append((i, 'crashed'))
+
+        # includes waiting on workers
+        recv_time = time.perf_counter()
+        deadline = None if timeout is None else recv_time + timeout
+        replies = [None] * len(self.workers)
+        for i in sent:
+            p, p_conn = self.workers[i]
+            ready = multiprocessing.connection.wait([p_conn, p.sentinel], None if deadline is None else max(deadline - time.perf_counter(), 0))
+            if p_conn in ready:
+                try:
+                    replies[i] = p_conn.recv()
+                    continue
+                except (EOFError, OSError):
+                    pass # worker exited without replying
+            failed.append((i, 'crashed' if ready else 'timed out'))
+        if timed:
+            self.timer.add('pipe_send', recv_time - start_time)
+            self.timer.add('pipe_recv', time.perf_counter() - recv_time)
+
+        for i, reason in failed:
+            logger.warning('(lammps-cython) worker %d %s' % (i, reason))
+            self._restart_worker(i)
+        return replies, failed
+
+    def stage_timings(self):
+        """Return and reset durations of calculator and worker stages
+
+        Worker stages are prefixed with ``worker.``. Timings of failed
+        workers are lost.
+        """
+        timer = StageTimer()
+        timer.update(self.timer.pop())
+        if not self._multiprocessing:
+            timer.update(self.workers[0].stage_timings(), prefix='worker.')
+        else:
+            replies, failed = self._request_workers([('stage_timings',)] * len(self.workers), self.worker_timeout)
+            for timings in replies:
+                if timings is not None:
+                    timer.update(timings, prefix='worker.')
+        return timer.pop()
+
+    def _md_readers(self, results, indicies):
+        md_readers = []
+        for i, result in zip(indicies, results):
+            md_readers.append(MDReader(energy=result['energy'], forces=result['forces'], stress=result['stress'], structure=self.structures[i]))
+        return md_readers
 
+    def worker_status(self):
+        if not self._multiprocessing:
+            statuses = [self.workers[0].status()]
+        else:
+            replies, failed = self._request_workers([('status',)] * len(self.workers), self.worker_timeout)
+            # restarted workers have not done any work yet
+            statuses = [status or {'busy_seconds': 0.0, 'rss_bytes': 0} for status in replies]
+
+        # failures restart workers so they (and busy seconds before
+        # the restart) are counted by calculator
         results = []
-        if len(self.workers) == 1:
-            results = self.workers[0].compute(parameters)
+        for i, status in enumerate(statuses):
+            self._worker_reported_busy_seconds[i] = status['busy_seconds']
+            results.append({**status, 'busy_seconds': self._worker_busy_seconds[i] + status['busy_seconds'], 'failures': self._worker_failures[i]})
+        return results
+
+    def set_fidelity(self, fidelity):
+        self._fidelity = fidelity # restarted workers use current fidelity
+        if not self._multiprocessing:
+            self.workers[0].set_fidelity(fidelity)
         else:
-            # send potential to each worker
-            for p, p_conn in self.workers:
-                p_conn.send(parameters)
+            self._request_workers([('set_fidelity', fidelity)] * len(self.workers), self.worker_timeout)
 
-            # recv calculation results from each worker
-            for p, p_conn in self.workers:
-                results.extend(p_conn.recv())
+    async def submit(self, potential, properties=None, indicies=None):
+        properties = properties or {'stress', 'energy', 'forces'}
+        indicies = sorted(range(len(self.structures)) if indicies is None else indicies)
+        results, = self._compute_batch([potential.optimization_parameters], indicies)
+        return self._md_readers(results, indicies)
 
-        md_readers = []
-        for structure, result in zip(self.structures, results):
-            md_readers.append(MDReader(energy=result['energy'], forces=result['forces'], stress=result['stress'], structure=structure))
-        return md_readers
+    async def submit_batch(self, potentials, properties=None, indicies=None):
+        """Calculate structures for several potentials with a single
+        message to each worker"""
+        properties = properties or {'stress', 'energy', 'forces'}
+        indicies = sorted(range(len(self.structures)) if indicies is None else indicies)
+        batch_results = self._compute_batch([potential.optimization_parameters for potential in potentials], indicies)
+        return [self._md_readers(results, indicies) for results in batch_results]
 
     def shutdown(self):
         # nothing is needed if not using multiprocessing module
-        if len(self.workers) > 1:
+        if self._multiprocessing:
             for p, p_conn in self.workers:
-                p_conn.send('quit')
+                try:
+                    p_conn.send('quit')
+                except OSError:
+                    pass # worker already exited
                 p.join()
 
 
@@ -397,7 +707,7 @@ def write_potential_files(potential, elements, unique_id=1):
     return lammps_files
 
 
-def write_potential(potential, elements, unique_id=1):
+def write_potential(potential, elements, unique_id=1, fidelity=None):
     """Generate lammps commands required by specified potential
 
     Parameters
@@ -408,6 +718,10 @@ def write_potential(potential, elements, unique_id=1):
         list specifying the index of each element
     unique_id: str
         an id that can be used for files to guarentee uniqueness
+    fidelity: dict, optional
+        reduced accuracy of long range coulomb interactions with keys
+        ``kspace_tollerance`` and ``coulomb_cutoff``. The kspace
+        tollerance is never tighter than the potential's.
 
     Supported Potentials:
 
@@ -428,11 +742,13 @@ def write_potential(potential, elements, unique_id=1):
     potentials = []
     lammps_commands = []
     if ('charge' in spec) and ('kspace' in spec):
-        lammps_commands.append('kspace_style %s %f' % (spec['kspace']['type'], spec['kspace']['tollerance']))
+        fidelity = fidelity or {}
+        tollerance = max(float(spec['kspace']['tollerance']), fidelity.get('kspace_tollerance', 0.0))
+        lammps_commands.append('kspace_style %s %f' % (spec['kspace']['type'], tollerance))
         for element, charge in spec['charge'].items():
             lammps_commands.append('set type %d charge %f' % (element_map[element], float(charge)))
         potentials.append(({
-            'pair_style': 'coul/long %f' % 10.0,
+            'pair_style': 'coul/long %f' % fidelity.get('coulomb_cutoff', 10.0),
             'pair_coeff': [('* *', 'coul/long', '')]
         }))
 
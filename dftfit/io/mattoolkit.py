@@ -3,13 +3,28 @@ import os
 
 import numpy as np
 
-from .base import DFTReader
+from .base import DFTReader, MDReader
+from .cache import TrainingCache
+
+
+def read_legacy_cache(cache_filename, key):
+    """ Read key from a shelve cache written by earlier versions of
+    dftfit. Returns None if the cache or key does not exist.
+
+    """
+    if not cache_filename:
+        return None
+    cache_filename = os.path.expanduser(cache_filename)
+    if not any(os.path.exists(cache_filename + suffix) for suffix in ['', '.db', '.dat', '.dir']):
+        return None
+    with shelve.open(cache_filename, flag='r') as cache:
+        return cache.get(key)
 
 
 class MTKReader(DFTReader):
-    def __init__(self, calculation_id, cache_filename=None):
+    def __init__(self, calculation_id, cache_filename=None, cache_directory=None):
         self.calculation_id = calculation_id
-        self._load(cache_filename=cache_filename)
+        self._load(cache_filename=cache_filename, cache_directory=cache_directory)
 
     def _download(self, calculation_id):
         from mattoolkit.api.calculation import CalculationResourceItem
@@ -28,37 +43,30 @@ class MTKReader(DFTReader):
         else:
             raise ValueError('unable to use calculation type %s' % calculation.type)
 
-    def _load(self, cache_filename):
-        if cache_filename:
-            cache_directory, filename = os.path.split(cache_filename)
-            os.makedirs(cache_directory, exist_ok=True)
-            key = f'mattoolkit.calculation.{self.calculation_id}'
-            with shelve.open(cache_filename) as cache:
-                if key in cache:
-                    results = cache[key]
-                else:
-                    results = self._download(self.calculation_id)
-                    cache[key] = results
+    def _load(self, cache_filename=None, cache_directory=None):
+        key = f'mattoolkit.calculation.{self.calculation_id}'
+        cache = TrainingCache(cache_directory) if cache_directory else None
+        calculations = cache.get_calculations(key) if cache else None
+        if calculations:
+            self._calculation, = calculations
         else:
-            results = self._download(self.calculation_id)
-
-        self._forces = results['forces']
-        self._stress = results['stress']
-        self._energy = results['energy']
-        self._structure = results['structure']
+            results = read_legacy_cache(cache_filename, key) or self._download(self.calculation_id)
+            self._calculation = MDReader(**results)
+            if cache:
+                cache.set_calculations(key, [self._calculation])
 
     @property
     def forces(self):
-        return self._forces
+        return self._calculation.forces
 
     @property
     def stress(self):
-        return self._stress
+        return self._calculation.stress
 
     @property
     def energy(self):
-        return self._energy
+        return self._calculation.energy
 
     @property
     def structure(self):
-        return self._structure
+        return self._calculation.structure
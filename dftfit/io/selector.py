@@ -0,0 +1,52 @@
+""" Selection of steps from multi-step (MD, relaxation) output files
+
+"""
+import numpy as np
+
+
+def select_steps(selector, iter_steps, from_step):
+    """ Select calculations from a streamed output file
+
+    Parameters
+    ----------
+    selector: dict
+        training selector with optional ``num_samples`` and ``strategy``
+    iter_steps: callable
+        ``iter_steps(indicies)`` yields (index, step) for every step
+        of the file where step is ``None`` if index not in indicies
+        (all steps converted if indicies is ``None``)
+    from_step: callable
+        converts a step to a calculation
+
+    Returns
+    -------
+    list:
+        selected calculations in order of selection
+    """
+    # avoid circular import dftfit.descriptor -> dftfit.io
+    from ..descriptor import calculation_descriptor, farthest_point_sampling, kmeans_sampling
+
+    strategy = selector.get('strategy', 'max-separation')
+    if ('num_samples' in selector) and strategy == 'max-separation':
+        num_steps = sum(1 for _ in iter_steps(set()))
+        indicies = np.linspace(0, num_steps-1, selector['num_samples']).astype('int')
+    elif ('num_samples' in selector) and strategy in {'farthest-point', 'kmeans'}:
+        # first pass only keeps descriptors of each step computed
+        # from the record arrays (no pymatgen.Structure is built)
+        descriptors = []
+        for index, step in iter_steps(None):
+            calculation = from_step(step)
+            descriptors.append(calculation_descriptor(calculation, calculation.forces))
+        descriptors = np.array(descriptors)
+        if strategy == 'farthest-point':
+            indicies = farthest_point_sampling(descriptors, selector['num_samples'])
+        else:
+            indicies = kmeans_sampling(descriptors, selector['num_samples'])
+    elif ('num_samples' not in selector) and strategy == 'all':
+        return [from_step(step) for index, step in iter_steps(None)]
+    else:
+        raise ValueError('not able to handle selector type yet')
+
+    selected = sorted(set(indicies))
+    calculations = dict(zip(selected, [from_step(step) for index, step in iter_steps(set(selected)) if step is not None]))
+    return [calculations[i] for i in indicies]
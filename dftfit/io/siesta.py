@@ -5,15 +5,171 @@ import glob
 import numpy as np
 import pymatgen as pmg
 
-from .base import DFTReader
+from .base import CalculationRecord
+from .selector import select_steps
+
+
+XML_NAMESPACE = '{http://www.xml-cml.org/schema}'
+eVA32GPa = 160.21766208 # http://greif.geo.berkeley.edu/~driver/conversions.html
+GPa2Bar = 1e4 # GPa -> Bar
+
+
+def _parse_matrix(text, shape):
+    """ Bulk conversion of whitespace separated numbers"""
+    return np.array(text.split(), dtype=float).reshape(shape)
+
+
+def _parse_atom_array(element):
+    symbols = [atom.get('elementType') for atom in element]
+    coordinates = np.array([(atom.get('x3'), atom.get('y3'), atom.get('z3')) for atom in element], dtype=float)
+    return symbols, coordinates.reshape(-1, 3)
+
+
+def _parse_lattice_parameters(element):
+    lengths, angles = None, None
+    for cell_parameter in element:
+        if cell_parameter.tag != XML_NAMESPACE + 'cellParameter':
+            continue
+        if lengths is None and cell_parameter.get('parameterType') == 'length':
+            lengths = _parse_matrix(cell_parameter.text, (3,))
+        elif angles is None and cell_parameter.get('parameterType') == 'angle':
+            angles = _parse_matrix(cell_parameter.text, (3,))
+    return lengths, angles
+
+
+def iter_xml_steps(filename, indicies=None):
+    """ Stream md steps from siesta xml output file
+
+    Matches the same elements as
+    :meth:`SiestaReader.xml_parts_from_root` but never holds the full
+    document in memory. Elements are cleared as soon as they are
+    read and only steps in ``indicies`` are converted to arrays.
+
+    Parameters
+    ----------
+    filename: str
+        siesta xml output filename
+    indicies: set, optional
+        steps to convert. ``None`` converts all steps.
+
+    Yields
+    ------
+    tuple:
+        (index, step) for every step with a calculation. step is a
+        dictionary with keys symbols, coordinates, lattice_lengths,
+        lattice_angles, energy, stress, and forces (``None`` if step
+        not in indicies).
+    """
+    kinds = ('structure', 'lattice', 'energy', 'stress', 'forces')
+    counts = dict.fromkeys(kinds, 0)
+    pending = {}
+    next_index = 0
+
+    def selected(index):
+        return indicies is None or index in indicies
+
+    # stack of [element, child tag counts, index among siblings with same tag]
+    stack = []
+    for event, element in ElementTree.iterparse(str(filename), events=('start', 'end')):
+        if event == 'start':
+            index = 1
+            if stack:
+                child_counts = stack[-1][1]
+                index = child_counts[element.tag] = child_counts.get(element.tag, 0) + 1
+            stack.append([element, {}, index])
+            continue
+
+        _, _, sibling_index = stack.pop()
+        parent = stack[-1][0] if stack else None
+        grandparent = stack[-2][0] if len(stack) > 1 else None
+        tag = element.tag[len(XML_NAMESPACE):] if element.tag.startswith(XML_NAMESPACE) else element.tag
+        parent_tag = parent.tag[len(XML_NAMESPACE):] if parent is not None else None
+
+        kind, value = None, None
+        if tag == 'atomArray' and parent_tag == 'molecule' and stack[-1][2] == 1 and \
+           grandparent is not None and grandparent.tag == XML_NAMESPACE + 'module' and \
+           grandparent.get('dictRef') == 'MD':
+            kind = 'structure'
+            if selected(counts[kind]):
+                value = _parse_atom_array(element)
+        elif tag == 'crystal' and element.get('title') == 'Lattice Parameters':
+            kind = 'lattice'
+            if selected(counts[kind]):
+                value = _parse_lattice_parameters(element)
+        elif tag == 'scalar' and parent_tag == 'property' and parent.get('dictRef') == 'siesta:E_KS' and \
+             grandparent is not None and grandparent.tag == XML_NAMESPACE + 'propertyList' and \
+             grandparent.get('title') == 'Final KS Energy':
+            kind = 'energy'
+            if selected(counts[kind]):
+                value = float(element.text)
+        elif tag == 'matrix' and parent_tag == 'property' and parent.get('title') == 'Total Stress':
+            kind = 'stress'
+            if selected(counts[kind]):
+                value = _parse_matrix(element.text, (3, 3)) * eVA32GPa * GPa2Bar
+        elif tag == 'matrix' and parent_tag == 'property' and \
+             grandparent is not None and grandparent.tag == XML_NAMESPACE + 'propertyList' and \
+             grandparent.get('title') == 'Forces':
+            kind = 'forces'
+            if selected(counts[kind]):
+                value = _parse_matrix(element.text, (-1, 3))
+
+        if kind is not None:
+            if value is not None:
+                pending.setdefault(counts[kind], {})[kind] = value
+            counts[kind] += 1
+
+            # last structure and lattice have no calculation
+            while counts['structure'] > next_index + 1 and counts['lattice'] > next_index + 1 and \
+                  all(counts[k] > next_index for k in ('energy', 'stress', 'forces')):
+                step = pending.pop(next_index, None)
+                if step is not None:
+                    (symbols, coordinates), (lengths, angles) = step['structure'], step['lattice']
+                    step = {
+                        'symbols': symbols, 'coordinates': coordinates,
+                        'lattice_lengths': lengths, 'lattice_angles': angles,
+                        'energy': step['energy'], 'stress': step['stress'], 'forces': step['forces']
+                    }
+                yield next_index, step
+                next_index += 1
+
+        # children of atomArray and crystal are needed when parent ends
+        if parent is not None and parent_tag not in {'atomArray', 'crystal'}:
+            element.clear()
+            parent.remove(element)
+
+
+def count_xml_steps(filename):
+    """ Number of md steps with a calculation in siesta xml output file"""
+    return sum(1 for _ in iter_xml_steps(filename, indicies=set()))
+
+
+class SiestaReader(CalculationRecord):
+    __slots__ = ()
 
+    @classmethod
+    def from_xml_parts(cls, xml_structure, xml_lattice, xml_energy, xml_stress, xml_forces):
+        symbols, coordinates = _parse_atom_array(xml_structure)
+        lengths, angles = _parse_lattice_parameters(xml_lattice)
+        return cls.from_step({
+            'symbols': symbols, 'coordinates': coordinates,
+            'lattice_lengths': lengths, 'lattice_angles': angles,
+            'energy': float(xml_energy.text),
+            'stress': _parse_matrix(xml_stress.text, (3, 3)) * eVA32GPa * GPa2Bar,
+            'forces': _parse_matrix(xml_forces.text, (-1, 3))
+        })
+
+    @classmethod
+    def from_step(cls, step):
+        lattice = pmg.Lattice.from_parameters(*step['lattice_lengths'], *step['lattice_angles'])
+        return cls(step['symbols'], lattice.matrix, step['coordinates'], step['forces'], step['stress'], step['energy'])
+
+    @classmethod
+    def from_xml_steps(cls, filename, indicies=None):
+        """ Stream selected steps from siesta xml output in order of
+        step index
 
-class SiestaReader(DFTReader):
-    def __init__(self, xml_structure, xml_lattice, xml_energy, xml_stress, xml_forces):
-        self._structure = self._parse_structure(xml_structure, xml_lattice)
-        self._energy = self._parse_energy(xml_energy)
-        self._stress = self._parse_stress(xml_stress)
-        self._forces = self._parse_forces(xml_forces)
+        """
+        return [cls.from_step(step) for index, step in iter_xml_steps(filename, indicies) if step is not None]
 
     @classmethod
     def from_file(cls, directory, output_filename='output.xml', step=-1):
@@ -21,8 +177,12 @@ class SiestaReader(DFTReader):
         if not directory.is_dir():
             raise ValueError('path %s must exist and be directory' % directory)
         filename = directory / output_filename
-        xml_structures, xml_lattices, xml_energies, xml_stresses, xml_forces = cls.xml_parts_from_root(filename)
-        return cls(xml_structures[step], xml_lattices[step], xml_energies[step], xml_stresses[step], xml_forces[step])
+        if step < 0:
+            step = count_xml_steps(filename) + step
+        calculations = cls.from_xml_steps(filename, {step})
+        if not calculations:
+            raise IndexError('step %d not in siesta output %s' % (step, filename))
+        return calculations[0]
 
     @classmethod
     def from_selector(cls, selector):
@@ -31,7 +191,7 @@ class SiestaReader(DFTReader):
             filename = selector['filename']
             data.extend(cls._from_selector_with_filename(filename, selector))
         elif 'fileglob' in selector:
-            for filename in glob.glob(selector['fileglob'], recursive=True):
+            for filename in sorted(glob.glob(selector['fileglob'], recursive=True)):
                 data.extend(cls._from_selector_with_filename(filename, selector))
         else:
             raise ValueError('no way for selector to select data need filename or fileglob')
@@ -43,18 +203,7 @@ class SiestaReader(DFTReader):
         if not filename.is_file():
             raise ValueError('path %s must exist and be file' % filename)
 
-        xml_structures, xml_lattices, xml_energies, xml_stresses, xml_forces = xml_parts = cls.xml_parts_from_root(filename)
-        results = []
-        if ('num_samples' in selector) and selector.get('strategy', 'max-separation') == 'max-separation':
-            indicies = np.linspace(0, len(xml_structures)-1, selector['num_samples']).astype('int')
-            for i in indicies:
-                results.append(cls(xml_structures[i], xml_lattices[i], xml_energies[i], xml_stresses[i], xml_forces[i]))
-        elif ('num_samples' not in selector) and selector['strategy'] == 'all':
-            for xml_parts in zip(xml_structures, xml_lattices, xml_energies, xml_stresses, xml_forces):
-                results.append(cls(*xml_parts))
-        else:
-            raise ValueError('not able to handle selector type yet')
-        return results
+        return select_steps(selector, lambda indicies: iter_xml_steps(filename, indicies), cls.from_step)
 
     @staticmethod
     def xml_parts_from_root(filename):
@@ -78,47 +227,3 @@ class SiestaReader(DFTReader):
         xml_forces = root.findall(XML_FORCES, namespaces=namespaces)
 
         return (xml_structures, xml_lattices, xml_energies, xml_stresses, xml_forces)
-
-    def _parse_structure(self, xml_structure, xml_lattice):
-        coordinates = []
-        symbols = []
-        for atom in xml_structure:
-            symbols.append(atom.attrib["elementType"])
-            coordinates.append([atom.attrib["x3"], atom.attrib["y3"], atom.attrib["z3"]])
-        coordinates = np.array(coordinates).reshape(-1, 3).astype(float)
-
-        namespaces = {'xml': 'http://www.xml-cml.org/schema'}
-        XML_LATTICE_LENGTHS = './xml:cellParameter[@parameterType="length"]'
-        XML_LATTICE_ANGLES = './xml:cellParameter[@parameterType="angle"]'
-        lattice_lengths = [float(_) for _ in xml_lattice.find(XML_LATTICE_LENGTHS, namespaces=namespaces).text.split()]
-        lattice_angles = [float(_) for _ in xml_lattice.find(XML_LATTICE_ANGLES, namespaces=namespaces).text.split()]
-
-        lattice = pmg.Lattice.from_parameters(*lattice_lengths, *lattice_angles)
-        return pmg.Structure(lattice, symbols, coordinates, coords_are_cartesian=True)
-
-    def _parse_energy(self, xml_energy):
-        return float(xml_energy.text)
-
-    def _parse_stress(self, xml_stress):
-        eVA32GPa = 160.21766208 # http://greif.geo.berkeley.edu/~driver/conversions.html
-        GPa2Bar = 1e4 # GPa -> Bar
-        return np.array([float(_) for _ in xml_stress.text.split()]).reshape(3, 3) * eVA32GPa * GPa2Bar
-
-    def _parse_forces(self, xml_forces):
-        return np.array([float(_) for _ in xml_forces.text.split()]).reshape(-1, 3)
-
-    @property
-    def forces(self):
-        return self._forces
-
-    @property
-    def stress(self):
-        return self._stress
-
-    @property
-    def energy(self):
-        return self._energy
-
-    @property
-    def structure(self):
-        return self._structure
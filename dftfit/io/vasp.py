@@ -1,9 +1,85 @@
 from pathlib import Path
+from xml.etree import ElementTree
+import glob
 
 import numpy as np
-from pymatgen.io.vasp import Vasprun
 
-from .base import DFTReader
+from .base import DFTReader, CalculationRecord
+from .selector import select_steps
+
+
+def _parse_varray(element):
+    """ Bulk conversion of varray vectors"""
+    return np.array(' '.join(v.text for v in element).split(), dtype=float).reshape(-1, 3)
+
+
+def _named_child(element, tag, name):
+    for child in element:
+        if child.tag == tag and child.get('name') == name:
+            return child
+    return None
+
+
+def iter_vasprun_steps(filename, indicies=None):
+    """ Stream ionic steps from vasprun.xml file
+
+    Only the species, lattice, positions, forces, stress, and energy
+    of each ionic step are read. Eigenvalues, density of states, and
+    projections are cleared as soon as they are parsed.
+
+    Parameters
+    ----------
+    filename: str
+        vasprun.xml filename
+    indicies: set, optional
+        steps to convert. ``None`` converts all steps.
+
+    Yields
+    ------
+    tuple:
+        (index, step) for every ionic step. step is a dictionary with
+        keys species, lattice, positions (cartesian), energy, stress
+        [bar], and forces (``None`` if step not in indicies).
+    """
+    species = None
+    index = 0
+    stack = []
+    for event, element in ElementTree.iterparse(str(filename), events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            continue
+
+        stack.pop()
+        if not stack:
+            continue
+        parent = stack[-1]
+        # tags from top level element to current element
+        path = [e.tag for e in stack[1:]] + [element.tag]
+        if path == ['atominfo']:
+            atoms = _named_child(element, 'array', 'atoms')
+            species = [rc[0].text.strip() for rc in atoms.find('set')]
+        elif path == ['calculation']:
+            step = None
+            if indicies is None or index in indicies:
+                structure = element.find('structure')
+                lattice = _parse_varray(_named_child(structure.find('crystal'), 'varray', 'basis'))
+                frac_coords = _parse_varray(_named_child(structure, 'varray', 'positions'))
+                step = {
+                    'species': species,
+                    'lattice': lattice,
+                    'positions': frac_coords.dot(lattice),
+                    'forces': _parse_varray(_named_child(element, 'varray', 'forces')),
+                    'stress': _parse_varray(_named_child(element, 'varray', 'stress')) * 1e3, # kbar -> bar
+                    # e_0_energy of ionic step is zero in some vasp versions
+                    'energy': float(_named_child(element.find('energy'), 'i', 'e_wo_entrp').text)
+                }
+            yield index, step
+            index += 1
+        elif path[0] == 'atominfo' or (path[0] == 'calculation' and path[1] in {'structure', 'varray', 'energy'}):
+            continue # needed when top level element ends
+
+        element.clear()
+        parent.remove(element)
 
 
 class VaspReader(DFTReader):
@@ -21,24 +97,52 @@ class VaspReader(DFTReader):
         elif len(vasprun_path) == 0:
             raise ValueError('could not find vasprun.xml file within directory')
 
-        vasprun = Vasprun(str(vasprun_path[0]))
-        self._forces = np.array(vasprun.ionic_steps[-1]['forces'])
-        self._stress = np.array(vasprun.ionic_steps[-1]['stress']) * 1e3 # kbar -> bar
-        self._energy = float(vasprun.final_energy)
-        self._structure = vasprun.final_structure
+        # only the final ionic step is kept
+        last_step = None
+        for index, step in iter_vasprun_steps(vasprun_path[0]):
+            last_step = step
+        if last_step is None:
+            raise ValueError('no ionic steps found in %s' % vasprun_path[0])
+        self._calculation = self.from_step(last_step)
+
+    @staticmethod
+    def from_step(step):
+        return CalculationRecord(step['species'], step['lattice'], step['positions'],
+                                 step['forces'], step['stress'], step['energy'])
+
+    @classmethod
+    def from_selector(cls, selector):
+        data = []
+        if 'filename' in selector:
+            filename = selector['filename']
+            data.extend(cls._from_selector_with_filename(filename, selector))
+        elif 'fileglob' in selector:
+            for filename in sorted(glob.glob(selector['fileglob'], recursive=True)):
+                data.extend(cls._from_selector_with_filename(filename, selector))
+        else:
+            raise ValueError('no way for selector to select data need filename or fileglob')
+        return data
+
+    @classmethod
+    def _from_selector_with_filename(cls, filename, selector):
+        filename = Path(filename)
+        if not filename.is_file():
+            raise ValueError('path %s must exist and be file' % filename)
+
+        return select_steps(selector, lambda indicies: iter_vasprun_steps(filename, indicies), cls.from_step)
 
     @property
     def forces(self):
-        return self._forces
+        return self._calculation.forces
 
     @property
     def stress(self):
-        return self._stress
+        return self._calculation.stress
 
     @property
     def energy(self):
-        return self._energy
+        return self._calculation.energy
 
     @property
     def structure(self):
-        return self._structure
+        return self._calculation.structure
@@ -0,0 +1,176 @@
+""" Prometheus style metrics of long running fits
+
+Metrics are rendered in the prometheus text exposition format and
+exported either with a local http endpoint or a periodically rewritten
+file for the node exporter textfile collector. Metrics are only
+gathered in the main process (worker status requires the worker
+pipes) every ``interval`` seconds. The http endpoint serves the last
+rendered metrics.
+"""
+import os
+import collections
+import resource
+import threading
+import time
+import logging
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def process_rss():
+    """ Resident set size of current process in [bytes]
+
+    Uses ``/proc/self/statm`` and falls back to peak resident set size
+    on systems without procfs.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (key, value) for key, value in sorted(labels.items())) + '}'
+
+
+def render_metrics(metrics):
+    """ Render metrics in prometheus text exposition format
+
+    Parameters
+    ----------
+    metrics: list
+        (name, type, help, samples) where samples is a list of
+        (labels, value)
+    """
+    lines = []
+    for name, metric_type, help_text, samples in metrics:
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for labels, value in samples:
+            lines.append('%s%s %s' % (name, _format_labels(labels), repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        content = self.server.content.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass # do not log each scrape to stderr
+
+
+class RunMetrics:
+    """ Metrics of a dftfit run
+
+    Parameters
+    ----------
+    port: int, optional
+        serve metrics on http://<address>:<port>/metrics
+    address: str
+        address of http endpoint (default localhost)
+    textfile: str, optional
+        filename rewritten atomically with metrics
+    interval: float
+        minimum seconds between updates of metrics
+    window: int
+        number of recent evaluations for median value
+    """
+    def __init__(self, port=None, address='127.0.0.1', textfile=None, interval=10.0, window=100):
+        if port is None and textfile is None:
+            raise ValueError('metrics requires either a port or textfile')
+        self.textfile = textfile
+        self.interval = interval
+        self.num_evaluations = collections.Counter()
+        self.best_value = None
+        self.recent_values = collections.deque(maxlen=window)
+        self.content = ''
+        self._last_update = None
+        self._last_num_evaluations = 0
+        self.evaluations_per_second = 0.0
+
+        self.server = None
+        if port is not None:
+            self.server = HTTPServer((address, port), _MetricsHandler)
+            self.server.content = self.content
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            logger.info('(metrics) serving metrics on http://%s:%d/metrics' % (address, self.server.server_port))
+        if textfile is not None:
+            logger.info('(metrics) writing metrics to %s' % textfile)
+
+    def observe_evaluation(self, value, kind='full', fidelity='full'):
+        self.num_evaluations[kind] += 1
+        if kind == 'full' and fidelity == 'full':
+            self.recent_values.append(value)
+            if self.best_value is None or value < self.best_value:
+                self.best_value = value
+
+    def due(self):
+        return self._last_update is None or time.time() - self._last_update >= self.interval
+
+    def update(self, workers, db_queue_depth):
+        """ Render and export metrics
+
+        Parameters
+        ----------
+        workers: list
+            status of each worker with keys busy_seconds, failures,
+            and rss_bytes
+        db_queue_depth: int
+            number of evaluations waiting to be written to database
+        """
+        now = time.time()
+        total_evaluations = sum(self.num_evaluations.values())
+        if self._last_update is not None and now > self._last_update:
+            self.evaluations_per_second = (total_evaluations - self._last_num_evaluations) / (now - self._last_update)
+        self._last_update, self._last_num_evaluations = now, total_evaluations
+
+        metrics = [
+            ('dftfit_evaluations_total', 'counter', 'Number of fitness evaluations',
+             [({'kind': kind}, count) for kind, count in sorted(self.num_evaluations.items())]),
+            ('dftfit_evaluations_per_second', 'gauge', 'Fitness evaluations per second since last update',
+             [({}, self.evaluations_per_second)]),
+            ('dftfit_best_value', 'gauge', 'Best full fidelity objective value',
+             [({}, self.best_value)] if self.best_value is not None else []),
+            ('dftfit_median_value', 'gauge', 'Median objective value of recent full fidelity evaluations',
+             [({}, np.median(self.recent_values))] if self.recent_values else []),
+            ('dftfit_db_queue_depth', 'gauge', 'Evaluations waiting to be written to database',
+             [({}, db_queue_depth)]),
+            ('dftfit_worker_busy_seconds_total', 'counter', 'Time each worker spent computing',
+             [({'worker': i}, w['busy_seconds']) for i, w in enumerate(workers)]),
+            ('dftfit_worker_lammps_failures_total', 'counter', 'Failed calculations (restarts) of each worker',
+             [({'worker': i}, w['failures']) for i, w in enumerate(workers)]),
+            ('dftfit_worker_rss_bytes', 'gauge', 'Resident memory of each worker',
+             [({'worker': i}, w['rss_bytes']) for i, w in enumerate(workers)]),
+            ('dftfit_rss_bytes', 'gauge', 'Resident memory of main process',
+             [({}, process_rss())]),
+        ]
+        self.content = render_metrics(metrics)
+
+        if self.server is not None:
+            self.server.content = self.content
+        if self.textfile is not None:
+            # textfile collector may read at any time
+            temporary_filename = self.textfile + '.tmp'
+            with open(temporary_filename, 'w') as f:
+                f.write(self.content)
+            os.replace(temporary_filename, self.textfile)
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
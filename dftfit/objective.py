@@ -1,66 +1,181 @@
 """Defines objective functions used in DFTFIT
 
+Forces, stress, and energy objective functions compare md calculations
+with packed DFT reference data (:class:`ReferenceData`). Reference
+data is built once (see ``Training.reference``) along with optional
+per calculation weights (for example the multiplicity of deduplicated
+training calculations).
 """
 import numpy
 import numba
 
 
-def force_objective_function(md_calculations, dft_calculations):
-    md_calculations = numpy.array([_.forces for _ in md_calculations])
-    dft_calculations = numpy.array([_.forces for _ in dft_calculations])
+def _readonly(array):
+    array = numpy.ascontiguousarray(array, dtype=numpy.float64)
+    array.flags.writeable = False
+    return array
+
+
+class ReferenceData:
+    """ Packed immutable DFT reference data of training calculations
+
+    Parameters
+    ----------
+    calculations: list
+        list of DFTReader
+    weights: list, optional
+        weight of each calculation (default 1)
+    atom_weights: list, optional
+        relative weight of each atom force for each calculation. Entries
+        may be ``None`` for equal weights.
+
+    Attributes
+    ----------
+    forces: numpy.ndarray
+        forces of all calculations concatenated (num_atoms x 3)
+    stress: numpy.ndarray
+        stacked stresses (num_calculations x 3 x 3)
+    energy: numpy.ndarray
+        energy of each calculation
+    weights: numpy.ndarray
+        weight of each calculation
+    atom_weights: numpy.ndarray
+        weight of each atom force (calculation weight times relative
+        atom weight)
+    """
+    def __init__(self, calculations, weights=None, atom_weights=None):
+        num_atoms = numpy.array([len(c.forces) for c in calculations], dtype=int)
+        weights = _calculation_weights(weights, len(calculations))
+        _atom_weights = numpy.repeat(weights, num_atoms)
+        if atom_weights is not None:
+            _atom_weights = _atom_weights * numpy.concatenate([
+                numpy.ones(n) if w is None else numpy.asarray(w, dtype=numpy.float64)
+                for n, w in zip(num_atoms, atom_weights)] or [numpy.zeros(0)])
+
+        self._initialize(
+            num_atoms,
+            numpy.concatenate([c.forces for c in calculations]) if calculations else numpy.zeros((0, 3)),
+            numpy.array([c.stress for c in calculations]).reshape(-1, 3, 3),
+            [c.energy for c in calculations],
+            weights, _atom_weights)
+
+    def _initialize(self, num_atoms, forces, stress, energy, weights, atom_weights):
+        self.num_atoms = numpy.array(num_atoms, dtype=int)
+        self.num_atoms.flags.writeable = False
+        self.forces = _readonly(forces)
+        self.stress = _readonly(stress)
+        self.energy = _readonly(energy)
+        self.weights = _readonly(weights)
+        self.atom_weights = _readonly(atom_weights)
+
+        self.force_normalizer = float(numpy.sum(self.atom_weights * numpy.sum(self.forces**2.0, axis=1)))
+        self.stress_normalizer = float(numpy.sum(self.weights * numpy.sum(self.stress**2.0, axis=(1, 2))))
+        self.energy_normalizer = float(_weighted_pair_sum(self.energy, self.weights))
+
+    def __len__(self):
+        return len(self.energy)
+
+    def subset(self, indicies, normalize=True):
+        """ Reference data of a subset of calculations
+
+        Used for mini-batch evaluations. Normalizers are computed from
+        the subset alone.
+
+        Parameters
+        ----------
+        indicies: list
+            indicies of calculations in subset
+        normalize: bool
+            compute normalizers from the subset. Otherwise the
+            normalizers of all calculations are kept and objective
+            functions of the subset are lower bounds of the objective
+            functions of all calculations.
+        """
+        indicies = numpy.asarray(indicies, dtype=int)
+        offsets = numpy.concatenate([[0], numpy.cumsum(self.num_atoms)])
+        atoms = numpy.concatenate([
+            numpy.arange(offsets[i], offsets[i+1]) for i in indicies] or [numpy.zeros(0, dtype=int)])
+        reference = ReferenceData.__new__(ReferenceData)
+        reference._initialize(
+            self.num_atoms[indicies], self.forces[atoms], self.stress[indicies],
+            self.energy[indicies], self.weights[indicies], self.atom_weights[atoms])
+        if not normalize:
+            reference.force_normalizer = self.force_normalizer
+            reference.stress_normalizer = self.stress_normalizer
+            reference.energy_normalizer = self.energy_normalizer
+        return reference
+
+
+def _calculation_weights(weights, num_calculations):
+    if weights is None:
+        return numpy.ones(num_calculations)
+    return numpy.asarray(weights, dtype=numpy.float64)
+
+
+def _reference_data(dft_calculations, weights):
+    if isinstance(dft_calculations, ReferenceData):
+        if weights is not None:
+            raise ValueError('weights are already included in reference data')
+        return dft_calculations
+    return ReferenceData(dft_calculations, weights)
+
+
+def force_objective_function(md_calculations, dft_calculations, weights=None):
+    reference = _reference_data(dft_calculations, weights)
+    md_forces = numpy.concatenate([_.forces for _ in md_calculations])
+    return _force_objective_function(md_forces, reference.forces, reference.atom_weights, reference.force_normalizer)
 
-    return _force_objective_function(md_calculations, dft_calculations)
 
-
-def _force_objective_function(md_calculations, dft_calculations):
+@numba.njit
+def _force_objective_function(md_forces, dft_forces, atom_weights, normalizer):
     n_force_sq_error = 0.0
-    d_force_sq_error = 0.0
-    for i in range(len(md_calculations)):
-        n_force_sq_error += numpy.sum((md_calculations[i] - dft_calculations[i])**2.0)
-        d_force_sq_error += numpy.sum(dft_calculations[i]**2.0)
-    return numpy.sqrt(n_force_sq_error / d_force_sq_error)
+    for i in range(len(md_forces)):
+        n_force_sq_error += atom_weights[i] * numpy.sum((md_forces[i] - dft_forces[i])**2.0)
+    return numpy.sqrt(n_force_sq_error / normalizer)
 
 
-def stress_objective_function(md_calculations, dft_calculations):
-    md_calculations = numpy.array([_.stress for _ in md_calculations])
-    dft_calculations = numpy.array([_.stress for _ in dft_calculations])
-
-    return _stress_objective_function(md_calculations, dft_calculations)
+def stress_objective_function(md_calculations, dft_calculations, weights=None):
+    reference = _reference_data(dft_calculations, weights)
+    md_stress = numpy.array([_.stress for _ in md_calculations], dtype=numpy.float64)
+    return _stress_objective_function(md_stress, reference.stress, reference.weights, reference.stress_normalizer)
 
 
 @numba.njit
-def _stress_objective_function(md_calculations, dft_calculations):
+def _stress_objective_function(md_stress, dft_stress, weights, normalizer):
     n_stress_sq_error = 0.0
-    d_stress_sq_error = 0.0
-    for i in range(len(md_calculations)):
-        n_stress_sq_error += numpy.sum((md_calculations[i] - dft_calculations[i])**2.0)
-        d_stress_sq_error += numpy.sum(dft_calculations[i]**2.0)
-    return numpy.sqrt(n_stress_sq_error / d_stress_sq_error)
+    for i in range(len(md_stress)):
+        n_stress_sq_error += weights[i] * numpy.sum((md_stress[i] - dft_stress[i])**2.0)
+    return numpy.sqrt(n_stress_sq_error / normalizer)
 
 
-def energy_objective_function(md_calculations, dft_calculations):
+def energy_objective_function(md_calculations, dft_calculations, weights=None):
     # cannot calculate energy error if only one set of calculations
     if len(md_calculations) == 1:
         return 0.0
 
-    md_calculations = numpy.array([_.energy for _ in md_calculations])
-    dft_calculations = numpy.array([_.energy for _ in dft_calculations])
+    reference = _reference_data(dft_calculations, weights)
+    md_energy = numpy.array([_.energy for _ in md_calculations], dtype=numpy.float64)
+    return _energy_objective_function(md_energy, reference.energy, reference.weights, reference.energy_normalizer)
+
 
-    return _energy_objective_function(md_calculations, dft_calculations)
+@numba.njit
+def _weighted_pair_sum(values, weights):
+    """ sum_{i<j} w_i w_j (v_i - v_j)^2 computed in O(n) as
+    W sum_i w_i (v_i - mean)^2 with weighted mean
+
+    """
+    total_weight = numpy.sum(weights)
+    if total_weight == 0.0:
+        return 0.0
+    mean = numpy.sum(weights * values) / total_weight
+    return total_weight * numpy.sum(weights * (values - mean)**2.0)
 
 
 @numba.njit
-def _energy_objective_function(md_calculations, dft_calculations):
-    n_energy_sq_error: float = 0.0
-    d_energy_sq_error: float = 0.0
-
-    for i in range(len(md_calculations)):
-        for j in range(i, len(dft_calculations)):
-            md_calc_i, dft_calc_i = md_calculations[i], dft_calculations[i]
-            md_calc_j, dft_calc_j = md_calculations[j], dft_calculations[j]
-            n_energy_sq_error += ((md_calc_i - md_calc_j) - (dft_calc_i - dft_calc_j))**2.0
-            d_energy_sq_error += (dft_calc_i - dft_calc_j)**2.0
-    return numpy.sqrt(n_energy_sq_error / d_energy_sq_error)
+def _energy_objective_function(md_energy, dft_energy, weights, normalizer):
+    # energy differences between all pairs of calculations
+    n_energy_sq_error = _weighted_pair_sum(md_energy - dft_energy, weights)
+    return numpy.sqrt(n_energy_sq_error / normalizer)
 
 
 # material properties
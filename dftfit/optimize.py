@@ -1,9 +1,12 @@
 import functools
 import logging
 
+import numpy as np
 import pygmo
 
 from .problem import DFTFITSingleProblem, DFTFITMultiProblem
+from .surrogate import SurrogateAlgorithm
+from .refine import refine
 
 logger = logging.getLogger(__name__)
 
@@ -26,8 +29,14 @@ available_algorithms = {
     'nlopt.bobyqa': (functools.partial(pygmo.nlopt, solver='bobyqa'), 'S'), # S-U
     'nlopt.newuoa': (functools.partial(pygmo.nlopt, solver='newuoa'), 'S'), # S-U
     'nlopt.sbplx': (functools.partial(pygmo.nlopt, solver='sbplx'), 'S'),   # S-U
+    'dftfit.surrogate': (SurrogateAlgorithm, 'S'),                         # S-U
 }
 
+# algorithms that keep adaptive state (F/CR, velocities, covariance)
+# between evolve calls only with memory=True
+memory_algorithms = {'pygmo.sade', 'pygmo.de1220', 'pygmo.pso', 'pygmo.cmaes', 'pygmo.xnes'}
+stateless_algorithms = {'pygmo.de', 'pygmo.sea', 'pygmo.sga', 'pygmo.nsga2', 'dftfit.surrogate'}
+
 
 class Optimize:
     def __init__(self, potential, training,
@@ -52,23 +61,120 @@ class Optimize:
             internal_problem = DFTFITSingleProblem(**_problem_kwargs)
         else:
             internal_problem = DFTFITMultiProblem(**_problem_kwargs)
+        # nlopt algorithms are not evolved by generation
+        if 'nlopt' in self.algorithm_name and internal_problem.mini_batch:
+            raise ValueError(f'algorithm {self.algorithm_name} does not support mini_batch')
+        if 'nlopt' in self.algorithm_name and internal_problem.fidelity:
+            raise ValueError(f'algorithm {self.algorithm_name} does not support fidelity')
         self._internal_problem = internal_problem
         self._problem = pygmo.problem(internal_problem)
         self.algorithm_kwargs = algorithm_kwargs or {}
+        self.champion_x = None
 
     def population(self, size, seed=None):
         return pygmo.population(self._problem, size, seed=seed)
 
     def optimize(self, population, steps, seed=None):
+        """Evolve population for number of steps
+
+        Reduced fidelity and mini-batch candidates are rescored with
+        full fidelity on all calculations and ``champion_x`` is the
+        best rescored candidate (single objective). Call
+        :meth:`finalize` once the run is done.
+        """
         algorithm_constructor = available_algorithms[self.algorithm_name][0]
+        problem = self._internal_problem
+        population_threshold = bool(problem.early_abort) and problem.early_abort['threshold'] == 'population'
+        # population threshold, fidelity, and mini-batch are updated between generations
+        by_generation = 'nlopt' not in self.algorithm_name and (population_threshold or bool(problem.fidelity) or bool(problem.mini_batch))
         if 'nlopt' in self.algorithm_name: # nlopt algorithms called differently.
             _algorithm = algorithm_constructor()
             _algorithm.maxeval = steps
             self._algorithm = pygmo.algorithm(_algorithm)
+        elif by_generation:
+            # evolved one generation at a time
+            algorithm_kwargs = dict(self.algorithm_kwargs)
+            if self.algorithm_name in memory_algorithms:
+                algorithm_kwargs.setdefault('memory', True)
+            elif self.algorithm_name not in stateless_algorithms:
+                logger.warning('(algorithm) %s does not keep its state between generations with early abort, fidelity, or mini-batch' % self.algorithm_name)
+            self._algorithm = pygmo.algorithm(algorithm_constructor(gen=1, seed=seed, **algorithm_kwargs))
         else:
             self._algorithm = pygmo.algorithm(algorithm_constructor(gen=steps, seed=seed, **self.algorithm_kwargs))
         logger.info('(algorithm) using %s algorithm with steps: %d seed: %d' % (self.algorithm_name, steps, seed))
 
-        results = self._algorithm.evolve(population)
-        self._internal_problem.finalize()
+        if by_generation:
+            for step in range(steps):
+                if step and problem.mini_batch:
+                    problem.next_generation()
+                    self._reevaluate(population)
+                if population_threshold:
+                    problem.abort_threshold = float(population.get_f()[:, 0].max())
+                population = self._algorithm.evolve(population)
+                if problem.fidelity:
+                    self._update_fidelity(population)
+            results = population
+        else:
+            results = self._algorithm.evolve(population)
+
+        # best candidates are only reported with full fidelity on all calculations
+        rescored = []
+        if problem.fidelity_level is not None:
+            best = np.argsort(results.get_f()[:, 0])[:problem.fidelity['rescore']]
+            logger.info('(algorithm) rescoring %d best candidates with full fidelity' % len(best))
+            problem.set_fidelity_level(None)
+            candidates = results.get_x()[best]
+            rescored = [(x, value) for x, (errors, value) in zip(candidates, problem.rescore(candidates))]
+        elif problem.mini_batch:
+            rescored = problem.evaluate_best_full()
+
+        if problem.get_nobj() == 1:
+            if rescored:
+                self.champion_x = np.array(min(rescored, key=lambda r: r[1])[0])
+            else:
+                self.champion_x = results.champion_x
         return results
+
+    def _update_fidelity(self, population):
+        """Tighten fidelity once population converged at current fidelity
+
+        The population is converged when the relative difference of
+        the median and best values is less than ``convergence``.
+        """
+        problem = self._internal_problem
+        if problem.fidelity_level is None:
+            return
+
+        values = population.get_f()[:, 0]
+        best = values.min()
+        if (np.median(values) - best) / max(abs(best), 1e-12) < problem.fidelity['convergence']:
+            problem.set_fidelity_level(problem.fidelity_level + 1)
+            self._reevaluate(population)
+
+    def _reevaluate(self, population):
+        """Evaluate population again after the objective changed
+
+        Values are only comparable at the same fidelity and on the
+        same mini-batch.
+        """
+        problem = self._internal_problem
+        abort_threshold, problem.abort_threshold = problem.abort_threshold, None
+        for i, x in enumerate(population.get_x()):
+            population.set_x(i, x)
+        problem.abort_threshold = abort_threshold
+
+    def refine(self, parameters, steps=20, step=1e-3, tolerance=1e-8):
+        """Gradient based refinement of parameters see :func:`dftfit.refine.refine`
+
+        ``champion_x`` is set to the refined parameters.
+        """
+        if available_algorithms[self.algorithm_name][1] != 'S':
+            raise ValueError('refine is only supported for single objective algorithms')
+        logger.info('(algorithm) refining parameters with L-BFGS-B steps: %d' % steps)
+        parameters, value = refine(self._internal_problem, parameters, steps=steps, step=step, tolerance=tolerance)
+        self.champion_x = np.array(parameters)
+        return parameters, value
+
+    def finalize(self):
+        """Write remaining evaluations, profile, and metrics of run"""
+        self._internal_problem.finalize()
@@ -9,20 +9,18 @@ class FloatParameter:
         bounds = bounds or (-sys.float_info.max, sys.float_info.max)
         self.current = float(initial)
         self._bounds = [float(_) for _ in bounds]
-        self.computed = None
+        self.computed = False  # value set by potential constraints
         self._fixed = fixed
 
     @property
     def fixed(self):
-        return self._fixed or self.computed != None
+        return self._fixed or self.computed
 
     @property
     def bounds(self):
         return self._bounds
 
     def __float__(self):
-        if self.computed:
-            return self.computed()
         return self.current
 
     def __str__(self):
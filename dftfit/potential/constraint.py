@@ -0,0 +1,145 @@
+""" Compiles potential constraints into a linear map
+
+All constraints currently supported (charge_balance and equations)
+are linear in the potential parameters. Thus they can be expressed as
+
+    parameters = matrix @ optimization_parameters + offset
+
+where matrix is sparse (number of parameters x number of optimization
+parameters) and offset holds the fixed parameter contributions.
+"""
+import numpy as np
+import scipy.sparse
+import pymatgen as pmg
+
+from ..parameter import FloatParameter
+from ..utils import get_naive_attr_path
+
+
+class ConstraintMap:
+    """ Linear map from optimization parameters to all parameters
+
+    Parameters
+    ----------
+    matrix: scipy.sparse.csr_matrix
+        shape (number of parameters, number of optimization parameters)
+    offset: numpy.ndarray
+        contribution of fixed parameters to each parameter
+    computed_indicies: numpy.ndarray
+        indicies of parameters that are determined by a constraint
+    """
+    def __init__(self, matrix, offset, computed_indicies):
+        self.matrix = matrix
+        self.offset = offset
+        self.computed_indicies = computed_indicies
+
+    def __call__(self, optimization_parameters):
+        return self.matrix.dot(np.asarray(optimization_parameters, dtype=float)) + self.offset
+
+
+def linear_constraints(spec):
+    """ Collect the constraints in potential spec as linear equations
+
+    Each constrained parameter is marked as computed.
+
+    Returns
+    -------
+    list:
+        list of (parameter, [(parameter, coefficient), ...]) where the
+        first parameter is equal to the sum of the terms
+    """
+    constraints = []
+    for constraint, value in spec.get('constraint', {}).items():
+        if constraint == 'charge_balance':
+            composition = pmg.core.Composition(value)
+            charges = spec.get('charge', {})
+            if not {e.symbol for e in composition.keys()} <= charges.keys():
+                raise ValueError('charge ballance constrains requires all elements to be defined in charge')
+            for charge_element in sorted(charges):
+                parameter = charges[charge_element]
+                if isinstance(parameter, FloatParameter) and not parameter.fixed:
+                    break
+            else:
+                if abs(sum(float(charges[element.symbol]) * amount for element, amount in composition.items())) > 1e-8:
+                    raise ValueError('no parameters to apply charge constraint and charge does ballance')
+                continue
+            terms = [(charges[element.symbol], -amount) for element, amount in composition.items() if element.symbol != charge_element]
+            parameter.computed = True
+            constraints.append((parameter, terms))
+        elif constraint == 'equations':
+            for equation in value:
+                left = get_naive_attr_path(spec, equation['left'])
+                terms = [(get_naive_attr_path(spec, path), float(coefficient)) for path, coefficient in equation['right']]
+                left.computed = True
+                constraints.append((left, terms))
+        else:
+            raise ValueError('contraint %s not implemented' % constraint)
+    return constraints
+
+
+def compile_constraints(parameters, constraints):
+    """ Compile constraints into a single sparse linear map
+
+    Parameters
+    ----------
+    parameters: list
+        ordered list of all FloatParameter in potential
+    constraints: list
+        linear constraints from :func:`linear_constraints`
+
+    Returns
+    -------
+    ConstraintMap
+    """
+    parameter_index = {id(p): i for i, p in enumerate(parameters)}
+    optimization_index = {}
+    for i, p in enumerate(parameters):
+        if not p.fixed:
+            optimization_index[id(p)] = len(optimization_index)
+    constraint_terms = {id(p): terms for p, terms in constraints}
+
+    for parameter, terms in constraints:
+        for term_parameter, term_coefficient in terms:
+            if id(term_parameter) not in parameter_index:
+                raise ValueError('constraint references value that is not a potential parameter')
+
+    # each parameter expressed as ({optimization index: coefficient}, offset)
+    expressions = {}
+    resolving = set()
+
+    def _resolve(parameter):
+        key = id(parameter)
+        if key in expressions:
+            return expressions[key]
+        if key in optimization_index:
+            expression = ({optimization_index[key]: 1.0}, 0.0)
+        elif key in constraint_terms:
+            if key in resolving:
+                raise ValueError('constraints contain a circular dependency')
+            resolving.add(key)
+            coefficients, offset = {}, 0.0
+            for term_parameter, term_coefficient in constraint_terms[key]:
+                term_coefficients, term_offset = _resolve(term_parameter)
+                for j, c in term_coefficients.items():
+                    coefficients[j] = coefficients.get(j, 0.0) + term_coefficient * c
+                offset += term_coefficient * term_offset
+            resolving.remove(key)
+            expression = (coefficients, offset)
+        else:
+            expression = ({}, parameter.current)
+        expressions[key] = expression
+        return expression
+
+    rows, columns, values = [], [], []
+    offset = np.zeros(len(parameters))
+    for i, parameter in enumerate(parameters):
+        coefficients, offset[i] = _resolve(parameter)
+        for j, c in coefficients.items():
+            rows.append(i)
+            columns.append(j)
+            values.append(c)
+
+    matrix = scipy.sparse.csr_matrix(
+        (values, (rows, columns)), shape=(len(parameters), len(optimization_index)))
+    computed_indicies = np.array(sorted(parameter_index[id(p)] for p, terms in constraints), dtype=int)
+    return ConstraintMap(matrix, offset, computed_indicies)
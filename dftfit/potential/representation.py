@@ -12,44 +12,22 @@ import pymatgen as pmg
 
 from ..schema import PotentialSchema
 from ..parameter import FloatParameter
-from ..utils import get_naive_attr_path
+from .constraint import linear_constraints, compile_constraints
 
 
 class Potential:
     def __init__(self, schema):
         schema_load, errors = PotentialSchema().load(schema)
         self.schema = schema_load
+        self._structure_json = None
+        self._md5hash = None
+        self._parameters_md5hash = None
         self._apply_constraints()
         self._collect_parameters()
+        self._compile_constraints()
 
     def _apply_constraints(self):
-        for constraint, value in self.schema['spec'].get('constraint', {}).items():
-            if constraint == 'charge_balance':
-                composition = pmg.core.Composition(value)
-                charges = self.schema['spec'].get('charge', {})
-                if not {e.symbol for e in composition.keys()} <= charges.keys():
-                    raise ValueError('charge ballance constrains requires all elements to be defined in charge')
-                for charge_element in sorted(charges):
-                    parameter = charges[charge_element]
-                    if isinstance(parameter, FloatParameter) and not parameter.fixed:
-                        break
-                else:
-                    if abs(sum(float(charges[element.symbol]) * amount for element, amount in composition.items())) > 1e-8:
-                        raise ValueError('no parameters to apply charge constraint and charge does ballance')
-                    continue
-                parameter.computed = lambda: -sum(float(charges[element.symbol]) * amount for element, amount in composition.items() if element.symbol != charge_element)
-            elif constraint == 'equations':
-                for equation in value:
-                    left = get_naive_attr_path(self.schema['spec'], equation['left'])
-                    right_terms = []
-                    for right_term in equation['right']:
-                        v = get_naive_attr_path(self.schema['spec'], right_term[0])
-                        right_terms.append([v, right_term[1]])
-
-                    left.computed = lambda: sum(float(v[0]) * v[1] for v in right_terms)
-            else:
-                raise ValueError('contraint %s not implemented' % constraint)
-
+        self._constraints = linear_constraints(self.schema['spec'])
 
     def _collect_parameters(self):
         self._parameters = []
@@ -72,6 +50,23 @@ class Potential:
                 self._optimization_parameters.append(p)
                 self._optimization_parameter_indicies.append(i)
 
+    def _compile_constraints(self):
+        self._constraint_map = compile_constraints(self._parameters, self._constraints)
+        self._computed_parameters = [self._parameters[i] for i in self._constraint_map.computed_indicies]
+        self._update_parameters(np.array([p.current for p in self._optimization_parameters]))
+
+    def _update_parameters(self, optimization_parameters):
+        """ Evaluate all parameters from optimization parameters with a
+        single sparse matrix-vector product
+
+        """
+        self._parameter_values = self._constraint_map(optimization_parameters)
+        self._parameters_md5hash = None
+        for parameter, value in zip(self._optimization_parameters, optimization_parameters):
+            parameter.current = float(value)
+        for parameter, i in zip(self._computed_parameters, self._constraint_map.computed_indicies):
+            parameter.current = float(self._parameter_values[i])
+
     @classmethod
     def from_file(cls, filename, format=None):
         if format not in {'json', 'yaml'}:
@@ -142,34 +137,61 @@ class Potential:
 
     @property
     def md5hash(self):
-        potential_str = json.dumps(self.as_dict(with_parameters=False), sort_keys=True)
-        return hashlib.md5(potential_str.encode('utf-8')).hexdigest()
+        """ md5 hash of potential structure (excluding parameter values)
 
-    def as_dict(self, with_parameters=True):
-        if with_parameters:
-            schema_dump, errors = PotentialSchema().dump(self.schema)
-            return schema_dump
-        else:
+        Structure is invariant under parameter updates so it is
+        only computed once.
+        """
+        if self._md5hash is None:
+            self._md5hash = hashlib.md5(self._structure_str.encode('utf-8')).hexdigest()
+        return self._md5hash
+
+    @property
+    def parameters_md5hash(self):
+        """ md5 fingerprint of current parameter values
+
+        """
+        if self._parameters_md5hash is None:
+            self._parameters_md5hash = hashlib.md5(self._parameter_values.tobytes()).hexdigest()
+        return self._parameters_md5hash
+
+    @property
+    def _structure_str(self):
+        if self._structure_json is None:
             class CustomEncoder(json.JSONEncoder):
                 def default(self, obj):
                     if isinstance(obj, FloatParameter):
                         return "FloatParameter"
                     else:
                         return super().default(obj)
-            return json.loads(json.dumps(self.schema, cls=CustomEncoder))
+            structure = json.loads(json.dumps(self.schema, cls=CustomEncoder))
+            self._structure_json = json.dumps(structure, sort_keys=True)
+        return self._structure_json
+
+    def as_dict(self, with_parameters=True):
+        if with_parameters:
+            schema_dump, errors = PotentialSchema().dump(self.schema)
+            return schema_dump
+        else:
+            return json.loads(self._structure_str)
 
     def write_file(self, filename):
         with open(filename, 'w') as f:
             f.write(str(self))
 
     def __copy__(self):
-        return type(self)(self.as_dict())
+        potential = type(self)(self.as_dict())
+        potential._structure_json = self._structure_json
+        potential._md5hash = self._md5hash
+        return potential
 
     def copy(self):
         return self.__copy__()
 
     def __hash__(self):
-        return hash(json.dumps(self.as_dict(with_parameters=False), sort_keys=True))
+        # structural only so hash is stable under parameter updates
+        # (use parameters_md5hash to key results on parameter values)
+        return hash(self.md5hash)
 
     def __eq__(self, other):
         return hash(self) == hash(other) and np.all(np.isclose(self.parameters, other.parameters, rtol=1e-16))
@@ -179,11 +201,11 @@ class Potential:
         """ Returns parameters for potentials as a list of float values
 
         """
-        return np.array([float(parameter) for parameter in self._parameters])
+        return self._parameter_values.copy()
 
     @property
     def optimization_parameters(self):
-        return np.array([float(parameter) for parameter in self._optimization_parameters])
+        return self._parameter_values[self._optimization_parameter_indicies]
 
     @optimization_parameters.setter
     def optimization_parameters(self, parameters):
@@ -193,8 +215,7 @@ class Potential:
         if len(parameters) != len(self._optimization_parameters):
             raise ValueError('updating parameters does not match length of potential parameters')
 
-        for parameter, update_parameter in zip(self._optimization_parameters, parameters):
-            parameter.current = float(update_parameter)
+        self._update_parameters(np.asarray(parameters, dtype=float))
 
     @property
     def optimization_bounds(self):
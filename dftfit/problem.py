@@ -1,18 +1,26 @@
 import asyncio
 import logging
+import math
 import time
 
-from .db import write_evaluations_batch
+import numpy as np
+
+from .db import write_evaluations_batch, write_run_profile, list_run_evaluations
 from .io.lammps import LammpsLocalDFTFITCalculator
 from .io.lammps_cython import LammpsCythonDFTFITCalculator
+from .io.base import CalculatorFailure
 from .predict import Predict
+from .timing import StageTimer, summarize_timings
+from .metrics import RunMetrics
 from . import objective
 
 logger = logging.getLogger(__name__)
 
+STRUCTURE_FEATURES = {'forces', 'stress', 'energy'}
+
 
 class DFTFITProblemBase:
-    def __init__(self, potential, training, features, weights, calculator='lammps_cython', dbm=None, db_write_interval=10, run_id=None, loop=None, **kwargs):
+    def __init__(self, potential, training, features, weights, calculator='lammps_cython', dbm=None, db_write_interval=10, run_id=None, loop=None, mini_batch=None, early_abort=None, fidelity=None, metrics=None, failure_penalty=1e10, **kwargs):
         self.loop = loop or asyncio.get_event_loop()
 
         # Training Initialization
@@ -67,69 +75,359 @@ class DFTFITProblemBase:
         self._run_id = run_id
         self.db_write_interval = db_write_interval
         self._evaluation_buffer = []
+        self.last_evaluation_kind = None # full, mini-batch, aborted, or failed
 
         if self.dbm and not isinstance(self._run_id, int):
             raise ValueError('cannot write evaluation to database without integer run_id')
 
+        # Mini-batch Initialization
+        self.mini_batch = None
+        self._generation = 0 # advanced by optimizer
+        self._batch_indicies = None
+        self._batch_reference = None
+        self._batch_candidates = [] # (value, parameters) since last full evaluation
+        if mini_batch:
+            self.mini_batch = {'seed': 0, 'full_interval': 10, 'num_best': 1, **mini_batch}
+            if not isinstance(self.mini_batch.get('size'), int) or self.mini_batch['size'] < 1:
+                raise ValueError('mini_batch size must be a positive integer')
+            if self.mini_batch['size'] >= len(self.training.calculations):
+                logger.warning('(problem) mini_batch size %d not smaller than training set using full evaluations' % self.mini_batch['size'])
+                self.mini_batch = None
+            else:
+                logger.info('(problem) mini-batch of %d/%d calculations with full evaluation every %d generations' % (
+                    self.mini_batch['size'], len(self.training.calculations), self.mini_batch['full_interval']))
+                self._draw_mini_batch()
+
+        # Early Abort Initialization
+        self.early_abort = None
+        self.abort_threshold = None # worst of population set by optimizer
+        if early_abort:
+            self.early_abort = {'chunk_size': 100, 'threshold': 'population', **(early_abort if isinstance(early_abort, dict) else {})}
+            if self.get_nobj() != 1:
+                raise ValueError('early_abort is only supported for single objective algorithms')
+            if not isinstance(self.early_abort['chunk_size'], int) or self.early_abort['chunk_size'] < 1:
+                raise ValueError('early_abort chunk_size must be a positive integer')
+            if self.early_abort['threshold'] != 'population':
+                self.abort_threshold = float(self.early_abort['threshold'])
+            logger.info('(problem) early abort of evaluations in chunks of %d calculations' % self.early_abort['chunk_size'])
+
+        # Fidelity Initialization (schedule normalized by Configuration)
+        self.fidelity = fidelity
+        self.fidelity_level = None # full fidelity
+        if self.fidelity:
+            if self.get_nobj() != 1:
+                raise ValueError('fidelity schedule is only supported for single objective algorithms')
+            self.set_fidelity_level(0)
+
         # Timing
         self.start_time = time.time()
+        self._num_md_calculations = 0
+        self.timer = StageTimer()
+
+        # Failed calculations (see LammpsCythonDFTFITCalculator worker_timeout)
+        self.failure_penalty = float(failure_penalty)
+
+        # Metrics Initialization
+        self.metrics = RunMetrics(**metrics) if metrics else None
+
+    @property
+    def fidelity_tag(self):
+        return 'full' if self.fidelity_level is None else 'reduced-%d' % self.fidelity_level
+
+    def set_fidelity_level(self, level):
+        """Set level of fidelity schedule. Levels past the schedule
+        (or ``None``) are full fidelity."""
+        if level is not None and level >= len(self.fidelity['levels']):
+            level = None
+        self.fidelity_level = level
+        self.dftfit_calculator.set_fidelity(None if level is None else self.fidelity['levels'][level])
+        logger.info('(problem) evaluating with %s fidelity' % self.fidelity_tag)
+
+    def rescore(self, parameters_batch):
+        """Evaluate parameters with full fidelity on all training calculations"""
+        level = self.fidelity_level
+        if level is not None:
+            self.set_fidelity_level(None)
+        results = [self._evaluate(parameters) for parameters in parameters_batch]
+        if level is not None:
+            self.set_fidelity_level(level)
+        return results
+
+    def store_evaluation(self, potential, errors, value, kind='full'):
+        self.last_evaluation_kind = kind
+        if self.metrics:
+            self.metrics.observe_evaluation(value, kind, self.fidelity_tag)
+            if self.metrics.due():
+                self._update_metrics()
 
-    def store_evaluation(self, potential, errors, value):
         if self.dbm:
-            self._evaluation_buffer.append([potential, errors, value])
+            self._evaluation_buffer.append([potential, errors, value, kind, self.fidelity_tag])
             if len(self._evaluation_buffer) >= self.db_write_interval:
                 total_time = time.time() - self.start_time
-                logger.info('md evaluations per second: %f' % ((len(self._evaluation_buffer) * len(self.training.calculations)) / total_time))
+                logger.info('md evaluations per second: %f' % (self._num_md_calculations / total_time))
                 self.start_time = time.time()
+                self._num_md_calculations = 0
+                self._collect_stage_timings()
+                self._write_evaluations()
+
+    def _write_evaluations(self):
+        if self._evaluation_buffer:
+            with self.timer('db_write'):
                 write_evaluations_batch(self.dbm, self._run_id, self._evaluation_buffer)
-                self._evaluation_buffer = []
+            self._evaluation_buffer = []
+
+    def _update_metrics(self):
+        self.metrics.update(self.dftfit_calculator.worker_status(), len(self._evaluation_buffer))
+
+    def _collect_stage_timings(self):
+        # workers keep timings until collected
+        self.timer.update(self.dftfit_calculator.stage_timings(), prefix='calculator.')
+
+    def profile(self):
+        """Percentiles of durations of each stage of fitness evaluations
+
+        Stages are ``fitness`` (total), ``potential_copy``,
+        ``calculator`` (submit to dftfit calculator),
+        ``calculator.*`` (stages within calculator and workers),
+        ``objective.<feature>``, ``predict.<property>``, and
+        ``db_write``. See :func:`dftfit.timing.summarize_timings`.
+        """
+        self._collect_stage_timings()
+        return summarize_timings(self.timer.timings)
+
+    def evaluation_history(self):
+        """Parameters and values of all full evaluations of run stored
+        in database at the current fidelity
+
+        Mini-batch, aborted, and failed evaluations and evaluations at
+        other fidelities are excluded since their values are not
+        comparable.
+
+        Returns
+        -------
+        tuple:
+            (parameters, values) or ``None`` without database
+        """
+        if not self.dbm:
+            return None
+        self._write_evaluations()
+        df = list_run_evaluations(self.dbm, self._run_id)
+        df = df[(df['kind'] == 'full') & (df['fidelity'] == self.fidelity_tag)]
+        return np.array(df['parameters'].tolist()).reshape(len(df), -1), df['value'].values
+
+    def next_generation(self):
+        """Draw new mini-batch of calculations for next generation
+
+        Called by the optimizer between generations so that all
+        candidates of a generation are evaluated on the same
+        calculations. Every ``full_interval`` generations the best
+        candidates are evaluated on all training calculations.
+        """
+        self._generation += 1
+        if self._generation % self.mini_batch['full_interval'] == 0:
+            self.evaluate_best_full()
+        self._draw_mini_batch()
+
+    def _draw_mini_batch(self):
+        # fixed seed per generation so runs are reproducible
+        random_state = np.random.RandomState(self.mini_batch['seed'] + self._generation)
+        self._batch_indicies = np.sort(random_state.choice(len(self.training.calculations), self.mini_batch['size'], replace=False))
+        self._batch_reference = self.training.reference.subset(self._batch_indicies)
+
+    def evaluate_best_full(self):
+        """Evaluate best mini-batch candidates since last full
+        evaluation on all training calculations
+
+        Returns
+        -------
+        list:
+            (parameters, value) of each evaluated candidate
+        """
+        candidates = sorted(self._batch_candidates, key=lambda c: c[0])[:self.mini_batch['num_best']]
+        self._batch_candidates = []
+        results = []
+        for batch_value, parameters in candidates:
+            errors, value = self._evaluate(parameters)
+            logger.info(f'(problem) full evaluation = {value:10.4g} mini-batch evaluation = {batch_value:10.4g}')
+            results.append((parameters, value))
+        return results
 
     def _fitness(self, parameters):
-        potential = self.potential.copy()
-        potential.optimization_parameters = parameters
+        threshold = self.abort_threshold if self.early_abort else None
+        with self.timer('fitness'):
+            if self.mini_batch is None:
+                return self._evaluate(parameters, threshold=threshold)
 
-        # dftfit calculations
-        md_calculations = self.loop.run_until_complete(self.dftfit_calculator.submit(potential))
+            errors, value = self._evaluate(parameters, self._batch_indicies, self._batch_reference, kind='mini-batch', threshold=threshold)
+        self._batch_candidates.append((value, np.array(parameters)))
+        return errors, value
+
+    def _structure_errors(self, md_calculations, reference):
+        structure_errors = {}
+        for feature, func in zip(self.features, self.objective_functions):
+            if feature in STRUCTURE_FEATURES:
+                with self.timer('objective.' + feature):
+                    structure_errors[feature] = func(md_calculations, reference)
+        return structure_errors
+
+    def _structure_value(self, structure_errors):
+        return sum(structure_errors[feature] * weight for feature, weight in zip(self.features, self.weights) if feature in structure_errors and weight)
+
+    def _race(self, potential, indicies, reference, threshold):
+        """Evaluate calculations in chunks until candidate can not beat threshold
+
+        Chunks are strided over the calculations so that each chunk is
+        split between all workers. Structure errors of the evaluated
+        calculations with the normalizers of all calculations are a
+        lower bound of the final errors since each calculation (or
+        pair of calculations for energy) adds a positive term.
+
+        Returns
+        -------
+        tuple:
+            (md_calculations, structure_errors, aborted)
+        """
+        num_calculations = len(reference)
+        indicies = np.arange(num_calculations) if indicies is None else np.asarray(indicies)
+        num_chunks = math.ceil(num_calculations / self.early_abort['chunk_size'])
+        evaluated = {}
+        for i in range(num_chunks):
+            positions = np.arange(i, num_calculations, num_chunks)
+            with self.timer('calculator'):
+                md_calculations = self.loop.run_until_complete(self.dftfit_calculator.submit(potential, indicies=indicies[positions]))
+            self._num_md_calculations += len(md_calculations)
+            evaluated.update(zip(positions, md_calculations))
+
+            positions = sorted(evaluated)
+            md_calculations = [evaluated[_] for _ in positions]
+            if len(positions) == num_calculations:
+                structure_errors = self._structure_errors(md_calculations, reference)
+            else:
+                structure_errors = self._structure_errors(md_calculations, reference.subset(positions, normalize=False))
+            if self._structure_value(structure_errors) > threshold:
+                # property predictions are skipped for complete evaluations too
+                return md_calculations, structure_errors, (len(positions) < num_calculations or bool(self.md_calculations))
+        return md_calculations, structure_errors, False
+
+    def _evaluate(self, parameters, indicies=None, reference=None, kind='full', threshold=None):
+        if reference is None:
+            reference = self.training.reference
+        with self.timer('potential_copy'):
+            potential = self.potential.copy()
+            potential.optimization_parameters = parameters
 
+        # dftfit calculations
+        try:
+            if threshold is None:
+                with self.timer('calculator'):
+                    md_calculations = self.loop.run_until_complete(self.dftfit_calculator.submit(potential, indicies=indicies))
+                self._num_md_calculations += len(md_calculations)
+                structure_errors = self._structure_errors(md_calculations, reference)
+                aborted = False
+            else:
+                md_calculations, structure_errors, aborted = self._race(potential, indicies, reference, threshold)
+        except CalculatorFailure as error:
+            return self._penalize(potential, error)
+
+        if aborted:
+            # errors of features that were not evaluated are nan
+            errors = [structure_errors.get(feature, math.nan) for feature in self.features]
+            value = self._structure_value(structure_errors)
+            self.store_evaluation(potential, errors, value, 'aborted')
+            logger.debug(f'aborted evaluation >= {value:10.4g} threshold = {threshold:10.4g} after {len(md_calculations)} calculations')
+            return errors, value
+
+        return self._score(potential, structure_errors, kind)
+
+    def _penalize(self, potential, error):
+        """Score candidate whose calculation failed with penalty value"""
+        errors = [self.failure_penalty] * len(self.features)
+        self.store_evaluation(potential, errors, self.failure_penalty, 'failed')
+        logger.warning(f'(problem) failed evaluation scored {self.failure_penalty:10.4g}: {error}')
+        return errors, self.failure_penalty
+
+    def batch_evaluate(self, parameters_batch):
+        """Evaluate several parameters on all training calculations
+
+        All parameters are submitted to the calculator at once so that
+        the workers compute the whole batch without synchronizing
+        between parameters.
+
+        Returns
+        -------
+        list:
+            (errors, value) for each parameters
+        """
+        potentials = []
+        for parameters in parameters_batch:
+            with self.timer('potential_copy'):
+                potential = self.potential.copy()
+                potential.optimization_parameters = parameters
+            potentials.append(potential)
+
+        try:
+            with self.timer('calculator'):
+                md_batch = self.loop.run_until_complete(self.dftfit_calculator.submit_batch(potentials))
+        except CalculatorFailure:
+            # evaluate separately so only failing parameters are penalized
+            return [self._evaluate(parameters) for parameters in parameters_batch]
+        results = []
+        for potential, md_calculations in zip(potentials, md_batch):
+            self._num_md_calculations += len(md_calculations)
+            structure_errors = self._structure_errors(md_calculations, self.training.reference)
+            results.append(self._score(potential, structure_errors))
+        return results
+
+    def _score(self, potential, structure_errors, kind='full'):
         # material property calculations
         predict_calculations = {}
         if self.md_calculations:
             if 'lattice_constants' in self.md_calculations:
-                old_lattice, new_lattice = self.md_calculator.lattice_constant(self.training.reference_ground_state, potential)
+                with self.timer('predict.lattice_constants'):
+                    old_lattice, new_lattice = self.md_calculator.lattice_constant(self.training.reference_ground_state, potential)
                 predict_calculations['lattice_constants'] = new_lattice
             if 'elastic_constants' in self.md_calculations:
                 structure = self.training.reference_ground_state.copy()
                 structure.modify_lattice(predict_calculations['lattice_constants'])
-                predict_calculations['elastic_constants'] = self.md_calculator.elastic_constant(structure, potential)
+                with self.timer('predict.elastic_constants'):
+                    predict_calculations['elastic_constants'] = self.md_calculator.elastic_constant(structure, potential)
 
         value = 0.0
         errors = []
         for feature, weight, func in zip(self.features, self.weights, self.objective_functions):
-            if feature in {'forces', 'stress', 'energy'}:
-                v = func(md_calculations, self.training.calculations)
+            if feature in STRUCTURE_FEATURES:
+                v = structure_errors[feature]
             elif feature in {'lattice_constants'}:
-                v = func(predict_calculations['lattice_constants'], self.training.material_properties[feature])
+                with self.timer('objective.' + feature):
+                    v = func(predict_calculations['lattice_constants'], self.training.material_properties[feature])
             elif feature in {'elastic_constants', 'bulk_modulus', 'shear_modulus'}:
-                v = func(predict_calculations['elastic_constants'], self.training.material_properties[feature])
+                with self.timer('objective.' + feature):
+                    v = func(predict_calculations['elastic_constants'], self.training.material_properties[feature])
 
             if weight:
                 value += v * weight
             errors.append(v)
 
-        self.store_evaluation(potential, errors, value)
+        self.store_evaluation(potential, errors, value, kind)
         formatted_errors = ', '.join('{:10.4g}'.format(_) for _ in errors)
-        logger.debug(f'evaluation = {value:10.4g} errors = [ {formatted_errors} ]')
+        logger.debug(f'{kind} evaluation = {value:10.4g} errors = [ {formatted_errors} ]')
         return errors, value
 
     def __deepcopy__(self, memo):
         return self # override copy method
 
     def finalize(self):
-        if self._evaluation_buffer: # ensure that all evaluations have been written
-            write_evaluations_batch(self.dbm, self._run_id, self._evaluation_buffer)
-            self._evaluation_buffer = []
+        if self.mini_batch and self._batch_candidates:
+            self.evaluate_best_full()
+        self._write_evaluations() # ensure that all evaluations have been written
+        if self.dbm:
+            write_run_profile(self.dbm, self._run_id, self.profile())
+        if self.metrics:
+            self._update_metrics()
 
     def __del__(self):
+        if getattr(self, 'metrics', None):
+            self.metrics.close()
         self.dftfit_calculator.shutdown()
 
     def get_bounds(self):
@@ -0,0 +1,92 @@
+""" Gradient based local refinement of potentials
+
+Gradients are computed with central finite differences. The 2N
+perturbed parameters (and the center) of each gradient are evaluated
+as a single batch (see ``DFTFITProblemBase.batch_evaluate``) and the
+potential is refined with L-BFGS-B.
+"""
+import logging
+
+import numpy as np
+from scipy.optimize import minimize
+
+logger = logging.getLogger(__name__)
+
+
+def finite_difference_gradient(evaluate_batch, x, bounds, step=1e-3):
+    """ Central finite difference gradient
+
+    Perturbations are clipped to the bounds (one sided differences at
+    the bounds).
+
+    Parameters
+    ----------
+    evaluate_batch: callable
+        returns list of values for list of parameters
+    x: numpy.ndarray
+        parameters
+    bounds: tuple
+        (lower bounds, upper bounds) of parameters
+    step: float
+        perturbation relative to width of bounds
+
+    Returns
+    -------
+    tuple:
+        (value, gradient) at x
+    """
+    x = np.asarray(x, dtype=float)
+    lower, upper = np.asarray(bounds[0], dtype=float), np.asarray(bounds[1], dtype=float)
+    h = step * np.where(upper > lower, upper - lower, 1.0)
+    forward = np.minimum(x + h, upper)
+    backward = np.maximum(x - h, lower)
+
+    batch = [x]
+    for i in range(len(x)):
+        for perturbed_value in [forward[i], backward[i]]:
+            perturbed = x.copy()
+            perturbed[i] = perturbed_value
+            batch.append(perturbed)
+    values = np.asarray(evaluate_batch(batch), dtype=float)
+
+    delta = forward - backward
+    gradient = np.zeros(len(x))
+    nonzero = delta > 0
+    gradient[nonzero] = (values[1::2] - values[2::2])[nonzero] / delta[nonzero]
+    return values[0], gradient
+
+
+def refine(problem, x, steps=20, step=1e-3, tolerance=1e-8):
+    """ Refine parameters with L-BFGS-B and finite difference gradients
+
+    Parameters
+    ----------
+    problem: dftfit.problem.DFTFITProblemBase
+        problem to evaluate single objective value with
+    x: numpy.ndarray
+        initial parameters
+    steps: int
+        maximum number of L-BFGS-B iterations
+    step: float
+        finite difference perturbation relative to width of bounds
+    tolerance: float
+        relative reduction of value to stop refinement
+
+    Returns
+    -------
+    tuple:
+        (parameters, value) of refined parameters
+    """
+    lower, upper = problem.get_bounds()
+
+    def evaluate_batch(batch):
+        return [value for errors, value in problem.batch_evaluate(batch)]
+
+    def value_and_gradient(x):
+        return finite_difference_gradient(evaluate_batch, x, (lower, upper), step=step)
+
+    result = minimize(value_and_gradient, np.asarray(x, dtype=float), jac=True, method='L-BFGS-B',
+                      bounds=list(zip(lower, upper)),
+                      options={'maxiter': steps, 'ftol': tolerance})
+    logger.info('(refine) value %.6g after %d iterations: %s' % (result.fun, result.nit, result.message))
+    return result.x, result.fun
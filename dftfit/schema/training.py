@@ -5,8 +5,19 @@ from .base import BaseSchema
 from .fields import PolyField
 
 
+class WeightedSelectorSchema(BaseSchema):
+    weight = fields.Float(validate=validate.Range(min=0), required=False)
+    force_weights = fields.Dict(required=False)
+
+    @validates('force_weights')
+    def validate_force_weights(self, value):
+        for element, weight in value.items():
+            if not isinstance(element, str) or not isinstance(weight, (int, float)) or weight < 0:
+                raise ValidationError('force_weights must map element symbols to non negative weights')
+
+
 # Material Toolkit
-class MTKSelectorSchema(BaseSchema):
+class MTKSelectorSchema(WeightedSelectorSchema):
     labels = fields.List(fields.String(), required=True)
 
 
@@ -16,13 +27,13 @@ class MTKTrainingSetSchema(BaseSchema):
 
 
 # Siesta
-class SiestaSelectorSchema(BaseSchema):
+class SiestaSelectorSchema(WeightedSelectorSchema):
     filename = fields.String(required=False)
     fileglob = fields.String(required=False)
     num_samples = fields.Integer(
         default=-1, validate=validate.Range(min=-1), required=False)
     strategy = fields.String(default='max-separation',
-                             validate=validate.OneOf(['max-separation', 'all']),
+                             validate=validate.OneOf(['max-separation', 'farthest-point', 'kmeans', 'all']),
                              required=False)
 
     @validates
@@ -36,6 +47,26 @@ class SiestaTrainingSetSchema(BaseSchema):
     selector = fields.Nested(SiestaSelectorSchema, required=True)
 
 
+# VASP
+class VaspSelectorSchema(SiestaSelectorSchema):
+    pass
+
+
+class VaspTrainingSetSchema(BaseSchema):
+    type = fields.String(required=True, validate=validate.Equal('VASP'))
+    selector = fields.Nested(VaspSelectorSchema, required=True)
+
+
+# Quantum Espresso
+class QESelectorSchema(SiestaSelectorSchema):
+    pass
+
+
+class QETrainingSetSchema(BaseSchema):
+    type = fields.String(required=True, validate=validate.Equal('QE'))
+    selector = fields.Nested(QESelectorSchema, required=True)
+
+
 # reference ground state
 class GroundStateTrainingSetSchema(BaseSchema):
     type = fields.String(required=True, validate=validate.Equal('ground_state'))
@@ -99,6 +130,8 @@ class MeltingPointEnergiesTrainingSetSchema(BaseSchema):
 _TYPE_TO_SCHEMA = {
     'mattoolkit': MTKTrainingSetSchema,
     'Siesta': SiestaTrainingSetSchema,
+    'VASP': VaspTrainingSetSchema,
+    'QE': QETrainingSetSchema,
     'ground_state': GroundStateTrainingSetSchema,
     'lattice_constants': LatticeConstantTrainingSetSchema,
     'elastic_constants': ElasticConstantTrainingSetSchema,
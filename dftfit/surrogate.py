@@ -0,0 +1,189 @@
+""" Surrogate assisted optimization
+
+A cheap regression model (gaussian process or random forest) is
+trained on all previous evaluations of a run. Each generation many
+candidate parameters are screened with the model and only the most
+promising candidates are evaluated with the dftfit calculator.
+"""
+import logging
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import Matern, ConstantKernel, WhiteKernel
+
+logger = logging.getLogger(__name__)
+
+
+def surrogate_model(model='gp', seed=None):
+    """ Create regression model for surrogate
+
+    Parameters
+    ----------
+    model: str
+        "gp" gaussian process with matern kernel or "rf" random forest
+    """
+    if model == 'gp':
+        kernel = ConstantKernel() * Matern(nu=2.5) + WhiteKernel()
+        return GaussianProcessRegressor(kernel=kernel, normalize_y=True, random_state=seed)
+    elif model == 'rf':
+        return RandomForestRegressor(n_estimators=100, min_samples_leaf=2, random_state=seed)
+    raise ValueError(f'surrogate model {model} not available choose "gp" or "rf"')
+
+
+def predict(model, X):
+    """ Predicted mean and standard deviation of model at X """
+    if isinstance(model, RandomForestRegressor):
+        predictions = np.array([tree.predict(X) for tree in model.estimators_])
+        return predictions.mean(axis=0), predictions.std(axis=0)
+    return model.predict(X, return_std=True)
+
+
+def propose_candidates(model, X, y, bounds, num_evaluations, num_candidates=1000, kappa=1.0, sigma=0.1, random_state=None):
+    """ Screen random candidates with surrogate model
+
+    Half of the candidates are gaussian perturbations of the best
+    evaluated parameters and half are uniform within bounds. Candidates
+    are ranked by the lower confidence bound ``mean - kappa * std``.
+
+    Parameters
+    ----------
+    model:
+        unfitted sklearn regression model see :func:`surrogate_model`
+    X: numpy.ndarray
+        evaluated parameters (num_samples x num_parameters)
+    y: numpy.ndarray
+        objective value of each evaluated parameters
+    bounds: tuple
+        (lower bounds, upper bounds) of parameters
+    num_evaluations: int
+        number of candidates to return
+
+    Returns
+    -------
+    numpy.ndarray:
+        most promising candidates (num_evaluations x num_parameters)
+    """
+    random_state = random_state or np.random.RandomState()
+    lower, upper = np.asarray(bounds[0], dtype=float), np.asarray(bounds[1], dtype=float)
+    scale = np.where(upper > lower, upper - lower, 1.0)
+
+    # model is trained on parameters normalized to unit cube
+    model.fit((X - lower) / scale, y)
+
+    num_local = num_candidates // 2
+    best = X[np.argsort(y)[:max(1, num_evaluations)]]
+    local = best[random_state.randint(len(best), size=num_local)] + random_state.normal(scale=sigma, size=(num_local, len(lower))) * scale
+    uniform = lower + random_state.random_sample((num_candidates - num_local, len(lower))) * (upper - lower)
+    candidates = np.clip(np.vstack([local, uniform]), lower, upper)
+
+    mean, std = predict(model, (candidates - lower) / scale)
+    return candidates[np.argsort(mean - kappa * std)[:num_evaluations]]
+
+
+class SurrogateAlgorithm:
+    """ pygmo user defined algorithm with surrogate pre-screening
+
+    Each generation the surrogate model is trained on the evaluation
+    history, ``num_candidates`` candidates are screened and the best
+    ``num_evaluations`` are evaluated. Evaluated candidates replace
+    the worst members of the population if they are better.
+
+    The history is the run's full evaluations at the current fidelity
+    from the database when available otherwise the population. Failed
+    and aborted evaluations are never used to train the model.
+
+    Parameters
+    ----------
+    gen: int
+        number of generations
+    seed: int
+        random seed
+    model: str
+        "gp" or "rf" see :func:`surrogate_model`
+    num_evaluations: int
+        number of evaluations per generation (default population size)
+    num_candidates: int
+        number of candidates screened by surrogate per generation
+    kappa: float
+        exploration weight of lower confidence bound
+    sigma: float
+        standard deviation of perturbations relative to bounds
+    max_history: int
+        only the best ``max_history`` evaluations are used to train
+        the model (gaussian process training is cubic in samples)
+    """
+    def __init__(self, gen=1, seed=None, model='gp', num_evaluations=None, num_candidates=1000, kappa=1.0, sigma=0.1, max_history=1000):
+        surrogate_model(model) # check model name
+        self.gen = gen
+        self.seed = seed
+        self.model = model
+        self.num_evaluations = num_evaluations
+        self.num_candidates = num_candidates
+        self.kappa = kappa
+        self.sigma = sigma
+        self.max_history = max_history
+        self._random_state = np.random.RandomState(seed)
+
+    def _history(self, population):
+        """ Evaluations to train the surrogate model with
+
+        Returns
+        -------
+        tuple:
+            (dftfit problem or ``None``, parameters, values, kinds of
+            later evaluations that are comparable with values)
+        """
+        # avoid circular import dftfit.optimize -> dftfit.surrogate
+        from .problem import DFTFITSingleProblem
+
+        udp = population.problem.extract(DFTFITSingleProblem)
+        X, y = population.get_x(), population.get_f()[:, 0]
+        if udp is None:
+            return udp, X, y, None
+
+        history = udp.evaluation_history()
+        if history is not None and len(history[0]):
+            return udp, history[0], history[1], {'full'}
+        keep = y < udp.failure_penalty
+        if np.any(keep):
+            X, y = X[keep], y[keep]
+        return udp, X, y, {'full', 'mini-batch'}
+
+    def evolve(self, population):
+        if len(population) == 0:
+            return population
+
+        problem = population.problem
+        bounds = problem.get_bounds()
+        num_evaluations = self.num_evaluations or len(population)
+        udp, X, y, kinds = self._history(population)
+        X, y = np.array(X, dtype=float), np.array(y, dtype=float)
+
+        for generation in range(self.gen):
+            keep = np.argsort(y)[:self.max_history]
+            candidates = propose_candidates(
+                surrogate_model(self.model, self.seed), X[keep], y[keep], bounds, num_evaluations,
+                num_candidates=self.num_candidates, kappa=self.kappa, sigma=self.sigma,
+                random_state=self._random_state)
+
+            # failed (penalty) and aborted (lower bound) values would
+            # distort the model so only comparable evaluations are kept
+            evaluated, values = [], []
+            for x in candidates:
+                f = problem.fitness(x)
+                if udp is None or (f[0] < udp.failure_penalty and udp.last_evaluation_kind in kinds):
+                    evaluated.append(x)
+                    values.append(f[0])
+                worst = population.worst_idx()
+                if f[0] < population.get_f()[worst][0]:
+                    population.set_xf(worst, x, f)
+            if evaluated:
+                X = np.vstack([X, evaluated])
+                y = np.concatenate([y, values])
+            logger.info('(surrogate) generation %d kept %d/%d evaluations population best %.4g' % (
+                generation, len(values), len(candidates), population.champion_f[0]))
+        return population
+
+    def get_name(self):
+        return f'surrogate ({self.model})'
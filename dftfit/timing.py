@@ -0,0 +1,135 @@
+""" Timing of the stages of fitness evaluations
+
+Durations are aggregated as they are recorded so memory does not grow
+with the length of a run. Count and total are exact while percentiles
+are estimated from a fixed size uniform sample of the durations.
+"""
+import time
+import random
+import contextlib
+import collections
+
+import numpy as np
+
+
+class StageStatistics:
+    """ Streaming statistics of durations of a stage
+
+    Keeps count, total, and a reservoir sample of at most
+    ``max_samples`` durations for percentiles.
+    """
+    __slots__ = ('count', 'total', 'samples', 'max_samples', '_random')
+
+    def __init__(self, max_samples=1024, seed=0):
+        self.count = 0
+        self.total = 0.0
+        self.samples = []
+        self.max_samples = max_samples
+        self._random = random.Random(seed)
+
+    def __getstate__(self):
+        return (self.count, self.total, self.samples, self.max_samples, self._random.getstate())
+
+    def __setstate__(self, state):
+        self.count, self.total, self.samples, self.max_samples, random_state = state
+        self._random = random.Random()
+        self._random.setstate(random_state)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if len(self.samples) < self.max_samples:
+            self.samples.append(duration)
+        else:
+            i = self._random.randrange(self.count)
+            if i < self.max_samples:
+                self.samples[i] = duration
+
+    def merge(self, other):
+        """ Add durations of other statistics
+
+        Samples are drawn from both reservoirs in proportion to their
+        counts.
+        """
+        count = self.count + other.count
+        if len(self.samples) + len(other.samples) <= self.max_samples:
+            samples = self.samples + other.samples
+        else:
+            num_samples = min(self.max_samples, len(self.samples) + len(other.samples))
+            num_self = sum(self._random.random() * count < self.count for _ in range(num_samples))
+            num_self = min(max(num_self, num_samples - len(other.samples)), len(self.samples))
+            samples = self._random.sample(self.samples, num_self) + self._random.sample(other.samples, num_samples - num_self)
+        self.count, self.total, self.samples = count, self.total + other.total, samples
+
+
+class StageTimer:
+    """ Collect wall time of named stages
+
+    Usage::
+
+        timer = StageTimer()
+        with timer('objective.forces'):
+            ...
+    """
+    def __init__(self):
+        self.timings = collections.defaultdict(StageStatistics)
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage].add(time.perf_counter() - start_time)
+
+    def add(self, stage, duration):
+        self.timings[stage].add(duration)
+
+    def update(self, timings, prefix=''):
+        """ Add timings of another timer (or lists of durations) """
+        for stage, durations in timings.items():
+            if isinstance(durations, StageStatistics):
+                self.timings[prefix + stage].merge(durations)
+            else:
+                for duration in durations:
+                    self.timings[prefix + stage].add(duration)
+
+    def pop(self):
+        """ Return and reset timings """
+        timings, self.timings = dict(self.timings), collections.defaultdict(StageStatistics)
+        return timings
+
+
+def summarize_timings(timings, percentiles=(50, 90, 99)):
+    """ Summary statistics of durations of each stage
+
+    Parameters
+    ----------
+    timings: dict
+        stage to :class:`StageStatistics` or list of durations
+
+    Returns
+    -------
+    dict:
+        stage to dictionary with count, total, mean, and percentiles
+        (p50, p90, ...) in [seconds]
+    """
+    summary = {}
+    for stage, durations in timings.items():
+        if not isinstance(durations, StageStatistics):
+            statistics = StageStatistics(max_samples=max(len(durations), 1))
+            for duration in durations:
+                statistics.add(duration)
+            durations = statistics
+        if not durations.count:
+            continue
+        summary[stage] = {
+            'count': durations.count,
+            'total': float(durations.total),
+            'mean': float(durations.total / durations.count),
+            **{'p%d' % p: float(v) for p, v in zip(percentiles, np.percentile(durations.samples, percentiles))}
+        }
+    return summary
@@ -3,36 +3,201 @@
 Has a caching layer as to speed up future runs
 """
 import json
-import shelve
-import os
+import glob
+import copy
+import concurrent.futures
 import hashlib
 import collections
+import logging
 
 import yaml
+import numpy as np
 import pymatgen as pmg
 from pymatgen.io.cif import CifParser
 from pymatgen.io.vasp import Poscar
 
 from .schema import TrainingSchema
-from .io.mattoolkit import MTKReader
+from .io.mattoolkit import MTKReader, read_legacy_cache
 from .io.siesta import SiestaReader
+from .io.vasp import VaspReader
+from .io.espresso import QEReader
+from .io.base import CalculationRecord
+from .io.cache import TrainingCache, file_cache_key
+from .io.utils import element_type_to_symbol
+from .descriptor import structure_fingerprint
+from .objective import ReferenceData
 from . import utils
 
+logger = logging.getLogger(__name__)
+
+
+def deduplicate_calculations(calculations, tolerance=1e-3, weights=None):
+    """ Collapse calculations with (near) duplicate structures
+
+    Structures are duplicates if they have the same composition and
+    their lattice vector lengths and sorted pair distances all agree
+    within tolerance [Angstroms]. The first calculation of each
+    duplicate group is kept.
+
+    Returns
+    -------
+    tuple:
+        (unique calculations, multiplicity of each unique calculation)
+        where multiplicity is the sum of weights of duplicates if
+        weights are given
+    """
+    if weights is None:
+        weights = np.ones(len(calculations))
+    unique_calculations = []
+    multiplicities = []
+    representatives = collections.defaultdict(list)
+    for calculation, weight in zip(calculations, weights):
+        structure = calculation if isinstance(calculation, CalculationRecord) else calculation.structure
+        key, descriptor = structure_fingerprint(structure)
+        for index, representative in representatives[key]:
+            if len(representative) == len(descriptor) and np.all(np.abs(representative - descriptor) <= tolerance):
+                multiplicities[index] += weight
+                break
+        else:
+            representatives[key].append((len(unique_calculations), descriptor))
+            unique_calculations.append(calculation)
+            multiplicities.append(weight)
+    return unique_calculations, np.array(multiplicities, dtype=float)
+
+
+def element_force_weights(calculation, force_weights):
+    """ Weight of each atom force from weights of elements (default 1)
+
+    Uses the species of array backed calculations so the structure is
+    not built.
+    """
+    species = calculation.species if isinstance(calculation, CalculationRecord) else calculation.structure.species
+    return np.array([force_weights.get(element_type_to_symbol(specie), 1.0) for specie in species])
+
+
+_FILE_READERS = {
+    'Siesta': SiestaReader,
+    'VASP': VaspReader,
+    'QE': QEReader,
+}
+
+
+def _load_file(reader_type, filename, selector, cache_directory=None):
+    reader = _FILE_READERS[reader_type]
+    if cache_directory is None:
+        return reader._from_selector_with_filename(filename, selector)
+
+    cache = TrainingCache(cache_directory)
+    key = file_cache_key(reader_type, filename, selector)
+    calculations = cache.get_calculations(key)
+    if calculations is None:
+        calculations = reader._from_selector_with_filename(filename, selector)
+        cache.set_calculations(key, calculations)
+    return calculations
+
+
+def _load_mattoolkit_calculation(calculation_id, cache_filename=None, cache_directory=None):
+    return [MTKReader(calculation_id, cache_filename=cache_filename, cache_directory=cache_directory)]
+
+
+def load_calculations_per_task(tasks, num_workers=1):
+    """ Run calculation loading tasks with a process pool
+
+    Parameters
+    ----------
+    tasks: list
+        list of (function, args) where each function returns a list
+        of calculations
+    num_workers: int
+        number of processes. With one worker tasks are run in this
+        process.
+
+    Returns
+    -------
+    list:
+        list of calculations for each task in the same order as tasks
+    """
+    if num_workers <= 1 or len(tasks) <= 1:
+        results = []
+        for i, (function, args) in enumerate(tasks):
+            results.append(function(*args))
+            logger.debug('(training) loaded %d/%d training tasks' % (i+1, len(tasks)))
+        return results
+
+    results = [None] * len(tasks)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {executor.submit(function, *args): i for i, (function, args) in enumerate(tasks)}
+        for num_completed, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            logger.info('(training) loaded %d/%d training tasks' % (num_completed, len(tasks)))
+    return results
+
 
 class Training:
-    def __init__(self, schema, cache_filename=None):
+    def __init__(self, schema, cache_filename=None, cache_directory=None, deduplicate=False, deduplicate_tolerance=1e-3, num_workers=1):
         schema_load, errors = TrainingSchema().load(schema)
         self.schema = schema_load
-        self._gather_calculations(cache_filename=cache_filename)
+        if cache_filename and not cache_directory:
+            logger.warning('(training) cache_filename shelve cache is only read and calculations will not be cached. Set cache_directory instead')
+        self._gather_calculations(cache_filename=cache_filename, cache_directory=cache_directory, deduplicate=deduplicate, deduplicate_tolerance=deduplicate_tolerance, num_workers=num_workers)
         self._gather_material_properties()
 
-    def _gather_calculations(self, cache_filename=None):
-        self._calculations = []
+    def _calculation_tasks(self, cache_filename=None, cache_directory=None):
+        """ Split training calculations into independent loading tasks
+        (one per file or calculation id) in a deterministic order
+
+        Returns
+        -------
+        tuple:
+            (tasks, selector of each task)
+        """
+        tasks, task_selectors = [], []
         for calculation in self.schema['spec']:
+            if calculation['type'] not in {'mattoolkit'} | _FILE_READERS.keys():
+                continue
+
+            selector = calculation['selector']
+            # weights do not change the loaded calculations (or cache key)
+            load_selector = {k: v for k, v in selector.items() if k not in {'weight', 'force_weights'}}
             if calculation['type'] == 'mattoolkit':
-                self._calculations.extend(self.download_mattoolkit_calculations(calculation['selector'], cache_filename=cache_filename))
-            elif calculation['type'] == 'Siesta':
-                self._calculations.extend(SiestaReader.from_selector(calculation['selector']))
+                # ids are queried serially to reuse label cache
+                calc_ids = self.mattoolkit_calculation_ids(load_selector, cache_filename=cache_filename, cache_directory=cache_directory)
+                calculation_tasks = [(_load_mattoolkit_calculation, (calc_id, cache_filename, cache_directory)) for calc_id in calc_ids]
+            else:
+                if 'filename' in selector:
+                    filenames = [selector['filename']]
+                elif 'fileglob' in selector:
+                    filenames = sorted(glob.glob(selector['fileglob'], recursive=True))
+                else:
+                    raise ValueError('no way for selector to select data need filename or fileglob')
+                calculation_tasks = [(_load_file, (calculation['type'], filename, load_selector, cache_directory)) for filename in filenames]
+            tasks.extend(calculation_tasks)
+            task_selectors.extend([selector] * len(calculation_tasks))
+        return tasks, task_selectors
+
+    def _gather_calculations(self, cache_filename=None, cache_directory=None, deduplicate=False, deduplicate_tolerance=1e-3, num_workers=1):
+        tasks, task_selectors = self._calculation_tasks(cache_filename=cache_filename, cache_directory=cache_directory)
+        logger.info('(training) loading %d training tasks with %d workers' % (len(tasks), num_workers))
+        results = load_calculations_per_task(tasks, num_workers=num_workers)
+
+        self._calculations, calculation_weights, atom_weights = [], [], []
+        for calculations, selector in zip(results, task_selectors):
+            for calculation in calculations:
+                self._calculations.append(calculation)
+                calculation_weights.append(selector.get('weight', 1.0))
+                atom_weights.append(element_force_weights(calculation, selector['force_weights']) if selector.get('force_weights') else None)
+        self._calculation_weights = np.array(calculation_weights, dtype=float)
+
+        if deduplicate:
+            num_calculations = len(self._calculations)
+            calculation_index = {id(c): i for i, c in enumerate(self._calculations)}
+            self._calculations, self._calculation_weights = deduplicate_calculations(
+                self._calculations, deduplicate_tolerance, weights=self._calculation_weights)
+            atom_weights = [atom_weights[calculation_index[id(c)]] for c in self._calculations]
+            logger.info('(training) reduced %d calculations to %d unique calculations' % (num_calculations, len(self._calculations)))
+
+        self._atom_weights = atom_weights if any(w is not None for w in atom_weights) else None
+        self._reference = ReferenceData(self._calculations, self._calculation_weights, self._atom_weights)
 
     def _gather_material_properties(self):
         self._material_properties_reference_ground_state = None
@@ -70,6 +235,23 @@ class Training:
     def calculations(self):
         return self._calculations
 
+    @property
+    def calculation_weights(self):
+        """ weight of each calculation (selector weight times multiplicity
+        after deduplication) """
+        return self._calculation_weights
+
+    @property
+    def atom_weights(self):
+        """ relative weight of each atom force for each calculation
+        (``None`` when no selector has force_weights) """
+        return self._atom_weights
+
+    @property
+    def reference(self):
+        """ packed DFT reference data used by objective functions """
+        return self._reference
+
     @property
     def material_properties(self):
         return self._material_properties
@@ -78,34 +260,45 @@ class Training:
     def reference_ground_state(self):
         return self._material_properties_reference_ground_state
 
+    def replicate(self, num_copies):
+        """ Training with calculations repeated num_copies times
+
+        Used to measure scaling with training set size.
+        """
+        training = copy.copy(self)
+        training._calculations = self._calculations * num_copies
+        training._calculation_weights = np.tile(self._calculation_weights, num_copies)
+        training._atom_weights = None if self._atom_weights is None else self._atom_weights * num_copies
+        training._reference = ReferenceData(training._calculations, training._calculation_weights, training._atom_weights)
+        return training
+
     def __iter__(self):
         return iter(self._calculations)
 
     def __len__(self):
         return len(self._calculations)
 
-    def download_mattoolkit_calculations(self, selector, cache_filename=None):
-        if cache_filename:
-            cache_directory, filename = os.path.split(cache_filename)
-            os.makedirs(cache_directory, exist_ok=True)
-            key = f'mattoolkit.calculation.' + '.'.join(selector['labels'])
-            with shelve.open(cache_filename) as cache:
-                if key in cache:
-                    calc_ids = cache[key]
-                else:
-                    from mattoolkit.api import CalculationResourceList
+    def mattoolkit_calculation_ids(self, selector, cache_filename=None, cache_directory=None):
+        key = f'mattoolkit.calculation.' + '.'.join(selector['labels'])
+        cache = TrainingCache(cache_directory) if cache_directory else None
+        arrays = cache.get(key) if cache else None
+        if arrays is not None:
+            return arrays['calc_ids'].tolist()
 
-                    calculations = CalculationResourceList()
-                    calculations.get(params={'labels': selector['labels']})
-                    calc_ids = [c.id for c in calculations.items]
-                    cache[key] = calc_ids
-        else:
+        calc_ids = read_legacy_cache(cache_filename, key)
+        if calc_ids is None:
             from mattoolkit.api import CalculationResourceList
 
             calculations = CalculationResourceList()
             calculations.get(params={'labels': selector['labels']})
             calc_ids = [c.id for c in calculations.items]
-        return [MTKReader(calc_id, cache_filename=cache_filename) for calc_id in calc_ids]
+        if cache:
+            cache.set(key, {'calc_ids': np.array(calc_ids)})
+        return calc_ids
+
+    def download_mattoolkit_calculations(self, selector, cache_filename=None, cache_directory=None):
+        calc_ids = self.mattoolkit_calculation_ids(selector, cache_filename=cache_filename, cache_directory=cache_directory)
+        return [MTKReader(calc_id, cache_filename=cache_filename, cache_directory=cache_directory) for calc_id in calc_ids]
 
     @classmethod
     def from_file(cls, filename, format=None, **kwargs):
@@ -119,7 +312,7 @@ class Training:
 
         if format == 'json':
             with open(filename) as f:
-                return cls(json.load(f))
+                return cls(json.load(f), **kwargs)
         elif format in {'yaml', 'yml'}:
             with open(filename) as f:
                 return cls(yaml.safe_load(f), **kwargs)
@@ -0,0 +1,150 @@
+""" Benchmark suite for regression comparison between commits
+
+Run and save results as json with::
+
+    pytest tests/integration/test_benchmarks.py --benchmark-autosave
+
+and compare against a previous run with ``--benchmark-compare``.
+"""
+import glob
+
+import numpy as np
+import pymatgen as pmg
+import pytest
+
+from dftfit.potential import Potential
+from dftfit.problem import DFTFITSingleProblem
+from dftfit.objective import ReferenceData
+from dftfit.io.base import CalculationRecord, MDReader
+from dftfit.db import DatabaseManager, write_evaluations_batch, list_run_evaluations
+from dftfit import objective
+
+
+POTENTIAL_FILENAMES = sorted(glob.glob('test_files/potential/*.yaml') + glob.glob('test_files/potential/*.json'))
+
+
+class BenchmarkTraining:
+    """ Training set of random DFT calculations on given structures """
+    def __init__(self, structures, seed=0):
+        random_state = np.random.RandomState(seed)
+        self.calculations = [CalculationRecord.from_structure(
+            structure,
+            forces=random_state.normal(size=(len(structure), 3)),
+            stress=random_state.normal(size=(3, 3)) * 1e3,
+            energy=random_state.normal() * len(structure)) for structure in structures]
+        self.reference = ReferenceData(self.calculations)
+        self.material_properties = {}
+        self.reference_ground_state = None
+
+
+def perturbed_structures(elements, num_structures, grid=4, spacing=2.6, amplitude=0.05, seed=0):
+    """ Simple cubic grid of elements (cycled) with random displacements """
+    random_state = np.random.RandomState(seed)
+    lattice = pmg.Lattice.cubic(grid * spacing)
+    grid_positions = np.array([(i, j, k) for i in range(grid) for j in range(grid) for k in range(grid)], dtype=float) * spacing
+    species = [sorted(elements)[i % len(elements)] for i in range(len(grid_positions))]
+    return [pmg.Structure(lattice, species, grid_positions + random_state.uniform(-amplitude, amplitude, grid_positions.shape), coords_are_cartesian=True)
+            for _ in range(num_structures)]
+
+
+def fitness_problem(potential, structures, num_workers):
+    training = BenchmarkTraining(structures)
+    return DFTFITSingleProblem(
+        potential=potential, training=training,
+        features=['forces', 'stress', 'energy'], weights=[0.3, 0.6, 0.1],
+        calculator='lammps_cython', num_workers=num_workers)
+
+
+@pytest.mark.lammps_cython
+@pytest.mark.long
+@pytest.mark.parametrize('num_workers', [1, 2, 4])
+@pytest.mark.parametrize('filename', POTENTIAL_FILENAMES)
+@pytest.mark.benchmark(group='fitness-potential', min_rounds=5)
+def test_benchmark_fitness_potential(benchmark, filename, num_workers):
+    potential = Potential.from_file(filename)
+    structures = perturbed_structures(potential.elements, num_structures=8)
+    problem = fitness_problem(potential, structures, num_workers)
+    benchmark.extra_info.update({'potential': filename, 'num_workers': num_workers, 'num_structures': len(structures)})
+
+    benchmark(problem.fitness, potential.optimization_parameters)
+
+
+@pytest.mark.lammps_cython
+@pytest.mark.long
+@pytest.mark.parametrize('num_workers', [1, 2, 4])
+@pytest.mark.parametrize('num_structures', [10, 50, 200])
+@pytest.mark.benchmark(group='fitness-training-size', min_rounds=3)
+def test_benchmark_fitness_training_size(benchmark, num_structures, num_workers):
+    potential = Potential.from_file('test_files/potential/MgO-charge-buck-fitting.yaml')
+    structures = perturbed_structures(potential.elements, num_structures)
+    problem = fitness_problem(potential, structures, num_workers)
+    benchmark.extra_info.update({'num_workers': num_workers, 'num_structures': num_structures})
+
+    benchmark(problem.fitness, potential.optimization_parameters)
+
+
+@pytest.mark.long
+@pytest.mark.parametrize('objective_function', [
+    objective.force_objective_function,
+    objective.stress_objective_function,
+    objective.energy_objective_function
+])
+@pytest.mark.parametrize('num_atoms', [10**3, 10**4, 10**5])
+@pytest.mark.benchmark(group='objective-function-atoms', warmup=True)
+def test_benchmark_objective_function(benchmark, objective_function, num_atoms):
+    num_calculations = 100
+    atoms_per_calculation = num_atoms // num_calculations
+
+    def random_calculation():
+        return CalculationRecord(
+            ['H'] * atoms_per_calculation, np.eye(3), np.random.random((atoms_per_calculation, 3)),
+            np.random.random((atoms_per_calculation, 3)), np.random.random((3, 3)), np.random.random())
+
+    reference = ReferenceData([random_calculation() for _ in range(num_calculations)])
+    md_calculations = [MDReader(c.forces, c.stress, c.energy, None) for c in [random_calculation() for _ in range(num_calculations)]]
+    benchmark.extra_info.update({'num_atoms': num_atoms, 'num_calculations': num_calculations})
+
+    benchmark(objective_function, md_calculations, reference)
+
+
+class BenchmarkPotential:
+    def __init__(self, optimization_parameters):
+        self.optimization_parameters = optimization_parameters
+
+
+def _database_with_run(filename):
+    dbm = DatabaseManager(filename)
+    cursor = dbm.connection.execute('''
+    INSERT INTO run (potential_hash, training_hash, start_time, initial_parameters, indicies, bounds, features, weights)
+    VALUES ('benchmark', 'benchmark', '2018-01-01 00:00:00', '[]', '[]', '[]', '["forces", "stress", "energy"]', '[0.3, 0.6, 0.1]')
+    ''')
+    dbm.connection.commit()
+    return dbm, cursor.lastrowid
+
+
+def _evaluations(num_evaluations, num_parameters=20):
+    return [(BenchmarkPotential(np.random.random(num_parameters)), np.random.random(3).tolist(), float(np.random.random()))
+            for _ in range(num_evaluations)]
+
+
+@pytest.mark.long
+@pytest.mark.parametrize('num_evaluations', [10, 1000])
+@pytest.mark.benchmark(group='database-write')
+def test_benchmark_database_write(benchmark, tmpdir, num_evaluations):
+    dbm, run_id = _database_with_run(str(tmpdir.join('benchmark.db')))
+    evaluations = _evaluations(num_evaluations)
+    benchmark.extra_info.update({'num_evaluations': num_evaluations})
+
+    benchmark(write_evaluations_batch, dbm, run_id, evaluations)
+
+
+@pytest.mark.long
+@pytest.mark.parametrize('num_evaluations', [1000, 100000])
+@pytest.mark.benchmark(group='database-read', min_rounds=3)
+def test_benchmark_database_read(benchmark, tmpdir, num_evaluations):
+    dbm, run_id = _database_with_run(str(tmpdir.join('benchmark.db')))
+    write_evaluations_batch(dbm, run_id, _evaluations(num_evaluations))
+    benchmark.extra_info.update({'num_evaluations': num_evaluations})
+
+    df = benchmark(list_run_evaluations, dbm, run_id)
+    assert len(df) == num_evaluations
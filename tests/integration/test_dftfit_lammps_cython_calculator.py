@@ -33,6 +33,66 @@ def test_lammps_cython_calculator():
 
 
 
+@pytest.mark.lammps_cython
+@pytest.mark.calculator
+def test_lammps_cython_calculator_mini_batch():
+    # Read in configuration information
+    base_directory = 'test_files/dftfit_calculators/'
+    training_schema = load_filename(base_directory + 'training.yaml')
+    potential_schema = load_filename(base_directory + 'potential.yaml')
+    configuration_schema = load_filename(base_directory + 'configuration.yaml')
+    configuration_schema['spec']['algorithm']['steps'] = 2
+    configuration_schema['spec']['problem'].update({
+        'calculator': 'lammps_cython',
+        'num_workers': 2,
+        'mini_batch': {'size': 4, 'seed': 1, 'full_interval': 1}
+    })
+
+    # Run optimization
+    run_id = dftfit(training_schema=training_schema,
+                    potential_schema=potential_schema,
+                    configuration_schema=configuration_schema)
+
+    # every generation is a mini-batch (population evaluated again on
+    # each new mini-batch) with best candidate of each generation
+    # evaluated on full training set
+    configuration = Configuration(configuration_schema)
+    with configuration.dbm.connection:
+        counts = dict(configuration.dbm.connection.execute('''
+        SELECT kind, count(*) FROM evaluation WHERE run_id = ? GROUP BY kind
+        ''', (run_id,)).fetchall())
+        assert counts['mini-batch'] == configuration.population * 2 * configuration.steps
+        assert counts['full'] == configuration.steps
+
+
+@pytest.mark.lammps_cython
+@pytest.mark.calculator
+def test_lammps_cython_calculator_early_abort():
+    # Read in configuration information
+    base_directory = 'test_files/dftfit_calculators/'
+    training_schema = load_filename(base_directory + 'training.yaml')
+    potential_schema = load_filename(base_directory + 'potential.yaml')
+    configuration_schema = load_filename(base_directory + 'configuration.yaml')
+    configuration_schema['spec']['algorithm']['steps'] = 3
+    configuration_schema['spec']['problem'].update({
+        'calculator': 'lammps_cython',
+        'early_abort': {'chunk_size': 2}
+    })
+
+    # Run optimization
+    run_id = dftfit(training_schema=training_schema,
+                    potential_schema=potential_schema,
+                    configuration_schema=configuration_schema)
+
+    # aborted evaluations are still stored
+    configuration = Configuration(configuration_schema)
+    with configuration.dbm.connection:
+        query = configuration.dbm.connection.execute('''
+        SELECT count(*) FROM evaluation WHERE run_id = ?
+        ''', (run_id,)).fetchone()
+        assert query[0] == configuration.population * (configuration.steps + 1)
+
+
 @pytest.mark.lammps_cython
 @pytest.mark.calculator
 def test_lammps_cython_calculator_with_experimental():
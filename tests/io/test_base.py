@@ -0,0 +1,27 @@
+import pickle
+
+import numpy as np
+
+from dftfit.io.base import CalculationRecord
+
+
+def test_calculation_record_lazy_structure():
+    lattice = np.eye(3) * 4.2
+    positions = np.array([[0, 0, 0], [2.1, 2.1, 2.1]])
+    calculation = CalculationRecord(['Mg', 'O'], lattice, positions, np.zeros((2, 3)), np.eye(3), -1.0)
+    assert not hasattr(calculation, '__dict__')
+    assert calculation._structure is None
+    assert len(calculation) == 2
+
+    structure = calculation.structure
+    assert structure is calculation.structure
+    assert np.allclose(structure.cart_coords, positions)
+    assert np.allclose(structure.lattice.matrix, lattice)
+
+    calculation = pickle.loads(pickle.dumps(calculation))
+    assert calculation._structure is None
+    assert calculation.structure == structure
+
+    calculation = CalculationRecord.from_structure(structure, np.zeros((2, 3)), np.eye(3), -1.0)
+    assert calculation.species == ['Mg', 'O']
+    assert np.allclose(calculation.positions, positions)
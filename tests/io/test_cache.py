@@ -0,0 +1,37 @@
+import numpy as np
+import pymatgen as pmg
+
+from dftfit.io.base import MDReader
+from dftfit.io.cache import TrainingCache, file_cache_key
+
+
+def test_training_cache_calculations(tmpdir):
+    lattice = pmg.Lattice.from_parameters(4.2, 4.2, 4.2, 90, 90, 90)
+    calculations = [
+        MDReader(forces=np.random.random((2, 3)), stress=np.random.random((3, 3)), energy=-1.0,
+                 structure=pmg.Structure(lattice, ['Mg', 'O'], [[0, 0, 0], [0.5, 0.5, 0.5]])),
+        MDReader(forces=np.random.random((1, 3)), stress=np.random.random((3, 3)), energy=-2.0,
+                 structure=pmg.Structure(lattice, ['O'], [[0.1, 0.2, 0.3]])),
+    ]
+    cache = TrainingCache(str(tmpdir))
+    assert cache.get_calculations('example') is None
+    cache.set_calculations('example', calculations)
+    assert 'example' in cache
+    assert isinstance(cache.get('example')['forces'], np.memmap)
+
+    for calculation, cached_calculation in zip(calculations, cache.get_calculations('example')):
+        assert np.allclose(calculation.forces, cached_calculation.forces)
+        assert np.allclose(calculation.stress, cached_calculation.stress)
+        assert calculation.energy == cached_calculation.energy
+        assert calculation.structure == cached_calculation.structure
+
+
+def test_file_cache_key(tmpdir):
+    filename = tmpdir.join('output.xml')
+    filename.write('a')
+    key = file_cache_key('Siesta', str(filename), {'num_samples': 1})
+    assert key == file_cache_key('Siesta', str(filename), {'num_samples': 1})
+    assert key != file_cache_key('Siesta', str(filename), {'num_samples': 2})
+    filename.write('ab')
+    assert key != file_cache_key('Siesta', str(filename), {'num_samples': 1})
+
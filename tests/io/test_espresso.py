@@ -0,0 +1,74 @@
+import numpy as np
+
+from dftfit.io.espresso import QEReader, iter_qe_steps, Ry, bohr
+from dftfit.training import Training
+
+
+QE_HEADER = '''
+     bravais-lattice index     =            1
+     lattice parameter (alat)  =       8.0000  a.u.
+     number of atoms/cell      =            2
+
+     crystal axes: (cart. coord. in units of alat)
+               a(1) = (   1.000000   0.000000   0.000000 )
+               a(2) = (   0.000000   1.000000   0.000000 )
+               a(3) = (   0.000000   0.000000   1.000000 )
+
+   Cartesian axes
+
+     site n.     atom                  positions (alat units)
+         1           Mg1 tau(   1) = (   0.0000000   0.0000000   0.0000000  )
+         2           O   tau(   2) = (   0.5000000   0.5000000   0.5000000  )
+'''
+
+QE_STEP = '''
+!    total energy              =     -{f}.00000000 Ry
+
+     Forces acting on atoms (cartesian axes, Ry/au):
+
+     atom    1 type  1   force =     {f}.00000000    0.00000000    0.00000000
+     atom    2 type  2   force =    -{f}.00000000    0.00000000    0.00000000
+     The non-local contrib.  to forces
+     atom    1 type  1   force =     9.00000000    9.00000000    9.00000000
+     atom    2 type  2   force =     9.00000000    9.00000000    9.00000000
+
+     Total force =     1.000000     Total SCF correction =     0.000000
+
+
+     Computing stress (Cartesian axis) and pressure
+
+          total   stress  (Ry/bohr**3)                   (kbar)     P=       {f}.00
+   0.00000000   0.00000000   0.00000000            {f}.00        0.00        0.00
+   0.00000000   0.00000000   0.00000000            0.00        {f}.00        0.00
+   0.00000000   0.00000000   0.00000000            0.00        0.00        {f}.00
+
+ATOMIC_POSITIONS (angstrom)
+Mg1      0.000000000   0.000000000   0.{f}00000000
+O        2.116708800   2.116708800   2.116708800
+'''
+
+
+def test_qe_reader(tmpdir):
+    filename = tmpdir.join('md.out')
+    filename.write(QE_HEADER + ''.join(QE_STEP.format(f=i + 1) for i in range(4)))
+
+    assert sum(1 for _ in iter_qe_steps(str(filename), set())) == 4
+
+    calculations = QEReader.from_selector({'filename': str(filename), 'strategy': 'all'})
+    assert [c.energy for c in calculations] == [-(i + 1) * Ry for i in range(4)]
+    assert np.allclose(calculations[1].forces, np.array([[2, 0, 0], [-2, 0, 0]]) * Ry / bohr)
+    assert np.allclose(calculations[1].stress, np.eye(3) * 2e3)
+
+    # first step uses initial positions and later steps previous ATOMIC_POSITIONS
+    structure = calculations[0].structure
+    assert [s.symbol for s in structure.species] == ['Mg', 'O']
+    assert np.allclose(structure.lattice.matrix, np.eye(3) * 8.0 * bohr)
+    assert np.allclose(structure.cart_coords, [[0, 0, 0], [2.1167088, 2.1167088, 2.1167088]])
+    assert np.allclose(calculations[2].structure.cart_coords[0], [0, 0, 0.2])
+
+    calculation = QEReader.from_file(str(filename))
+    assert calculation.energy == -4 * Ry
+
+    training = Training({'version': 'v1', 'kind': 'Training', 'spec': [
+        {'type': 'QE', 'selector': {'filename': str(filename), 'num_samples': 2}}]})
+    assert [c.energy for c in training.calculations] == [-Ry, -4 * Ry]
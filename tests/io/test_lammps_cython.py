@@ -1,8 +1,13 @@
 import asyncio
+import os
+import time
+from unittest import mock
 
+import numpy as np
 import pytest
 
-from dftfit.io.lammps_cython import LammpsCythonDFTFITCalculator
+from dftfit.io.base import CalculatorFailure
+from dftfit.io.lammps_cython import LammpsCythonDFTFITCalculator, LammpsCythonWorker
 
 
 @pytest.mark.parametrize('structure_filename, supercell, num_atoms, potential_filename', [
@@ -37,3 +42,164 @@ def test_potential_lammps_cython(
     def f():
         calculator._apply_potential_files(p)
         calculator.workers[0]._apply_potential(p)
+
+
+def test_lammps_cython_worker_apply_changed_commands(structure, potential):
+    s = structure('test_files/structure/MgO.cif')
+    p = potential('test_files/potential/MgO-charge-buck-fitting.yaml')
+
+    with mock.patch('dftfit.io.lammps_cython.lammps.Lammps'):
+        worker = LammpsCythonWorker([s], list(set(s.species)), p.as_dict())
+        worker.create()
+        lmp = worker.lammps_systems[0]
+
+        worker._apply_potential(p)
+        num_commands = lmp.command.call_count
+        assert any(c[0][0].startswith('pair_style') for c in lmp.command.call_args_list)
+
+        # identical potential nothing to update
+        lmp.command.reset_mock()
+        worker._apply_potential(p)
+        assert lmp.command.call_count == 0
+
+        # only charges and coefficients are updated
+        lmp.command.reset_mock()
+        p.optimization_parameters = p.optimization_parameters * 1.01
+        worker._apply_potential(p)
+        commands = [c[0][0] for c in lmp.command.call_args_list]
+        assert 0 < len(commands) < num_commands
+        assert all(c.startswith('set') or c.startswith('pair_coeff') for c in commands)
+
+    # commands referencing potential files are always reissued
+    commands = ['pair_style tersoff', 'pair_coeff * * /tmp/potential.tersoff Li Ta O']
+    worker._lammps_commands = commands
+    assert worker._changed_commands(commands) == []
+    assert worker._changed_commands(commands, ['/tmp/potential.tersoff']) == commands[1:]
+
+
+def test_lammps_cython_worker_fast_run(structure, potential):
+    s = structure('test_files/structure/MgO.cif')
+    p = potential('test_files/potential/MgO-charge-buck-fitting.yaml')
+
+    with mock.patch('dftfit.io.lammps_cython.lammps.Lammps'):
+        worker = LammpsCythonWorker([s], list(set(s.species)), p.as_dict(), fast_run=True)
+        worker.create()
+        lmp = worker.lammps_systems[0]
+        lmp.thermo.computes['thermo_press'].vector = [0.0] * 6
+        lmp.thermo.computes['thermo_pe'].scalar = 0.0
+        lmp.thermo.computes['my_ke'].scalar = 0.0
+
+        results = worker.compute(p.optimization_parameters)
+        commands = [c[0][0] for c in lmp.command.call_args_list]
+        assert LammpsCythonWorker.FAST_NEIGHBOR_COMMAND in commands
+        assert commands[-1] == LammpsCythonWorker.FAST_RUN_COMMAND
+
+        # identical parameters reuse results without running lammps
+        lmp.command.reset_mock()
+        assert all(a is b for a, b in zip(worker.compute(p.optimization_parameters), results))
+        assert lmp.command.call_count == 0
+
+        # subsets of structures reuse results too
+        assert worker.compute(p.optimization_parameters, [0])[0] is results[0]
+        assert lmp.command.call_count == 0
+
+
+def test_lammps_cython_worker_fidelity(structure, potential):
+    s = structure('test_files/structure/MgO.cif')
+    p = potential('test_files/potential/MgO-charge-buck-fitting.yaml')
+
+    with mock.patch('dftfit.io.lammps_cython.lammps.Lammps'):
+        worker = LammpsCythonWorker([s], list(set(s.species)), p.as_dict())
+        worker.create()
+        lmp = worker.lammps_systems[0]
+
+        worker.set_fidelity({'kspace_tollerance': 1e-3, 'coulomb_cutoff': 6.0})
+        worker._apply_potential(p)
+        commands = [c[0][0] for c in lmp.command.call_args_list]
+        assert 'kspace_style pppm 0.001000' in commands
+        assert any(c.startswith('pair_style') and 'coul/long 6.000000' in c for c in commands)
+
+        # full fidelity reissues pair style and kspace commands
+        lmp.command.reset_mock()
+        worker.set_fidelity(None)
+        worker._apply_potential(p)
+        commands = [c[0][0] for c in lmp.command.call_args_list]
+        assert any(c.startswith('kspace_style') and c != 'kspace_style pppm 0.001000' for c in commands)
+        assert any(c.startswith('pair_style') and 'coul/long 10.000000' in c for c in commands)
+
+
+def test_lammps_cython_worker_stage_timings(structure, potential):
+    s = structure('test_files/structure/MgO.cif')
+    p = potential('test_files/potential/MgO-charge-buck-fitting.yaml')
+
+    with mock.patch('dftfit.io.lammps_cython.lammps.Lammps'):
+        worker = LammpsCythonWorker([s], list(set(s.species)), p.as_dict())
+        worker.create()
+        lmp = worker.lammps_systems[0]
+        lmp.thermo.computes['thermo_press'].vector = [0.0] * 6
+        lmp.thermo.computes['thermo_pe'].scalar = 0.0
+        lmp.thermo.computes['my_ke'].scalar = 0.0
+
+        worker.compute_batch([p.optimization_parameters] * 2)
+        timings = worker.stage_timings()
+        assert {stage: len(durations) for stage, durations in timings.items()} == {
+            'write_potential_files': 2, 'apply_potential': 2, 'lammps_run': 2}
+        assert worker.stage_timings() == {}
+
+        status = worker.status()
+        assert status['busy_seconds'] > 0 and status['rss_bytes'] > 0
+
+
+def test_lammps_cython_calculator_worker_supervision(structure, potential, tmpdir):
+    s = structure('test_files/structure/MgO.cif')
+    p = potential('test_files/potential/MgO-charge-buck-fitting.yaml')
+    hang_filename = str(tmpdir.join('hang'))
+
+    def run(*args):
+        if os.path.exists(hang_filename):
+            time.sleep(60)
+
+    # worker processes are forked with the mocked lammps
+    with mock.patch('dftfit.io.lammps_cython.lammps.Lammps') as Lammps:
+        lmp = Lammps.return_value
+        lmp.thermo.computes['thermo_press'].vector = [0.0] * 6
+        lmp.thermo.computes['thermo_pe'].scalar = 0.0
+        lmp.thermo.computes['my_ke'].scalar = 0.0
+        lmp.system.forces.copy.return_value = np.zeros((len(s), 3))
+        lmp.run.side_effect = run
+
+        calculator = LammpsCythonDFTFITCalculator([s, s, s], p, num_workers=2, worker_timeout=5)
+        loop = asyncio.get_event_loop()
+        try:
+            assert len(loop.run_until_complete(calculator.submit(p))) == 3
+
+            # crashed worker is restarted
+            calculator.workers[1][0].kill()
+            calculator.workers[1][0].join()
+            with pytest.raises(CalculatorFailure):
+                loop.run_until_complete(calculator.submit(p))
+            assert len(loop.run_until_complete(calculator.submit(p))) == 3
+
+            # hanging worker is killed and restarted
+            open(hang_filename, 'w').close()
+            start_time = time.time()
+            with pytest.raises(CalculatorFailure):
+                loop.run_until_complete(calculator.submit(p))
+            assert time.time() - start_time < 30
+            os.remove(hang_filename)
+            assert len(loop.run_until_complete(calculator.submit(p))) == 3
+            statuses = calculator.worker_status()
+            assert [status['failures'] for status in statuses] == [1, 2]
+
+            # worker killed between evaluations is restarted by other requests
+            calculator.workers[0][0].kill()
+            calculator.workers[0][0].join()
+            calculator.set_fidelity(None)
+            restarted_statuses = calculator.worker_status()
+            assert [status['failures'] for status in restarted_statuses] == [2, 2]
+            # busy seconds of restarted worker are kept
+            assert statuses[0]['busy_seconds'] > 0
+            assert restarted_statuses[0]['busy_seconds'] == statuses[0]['busy_seconds']
+            assert len(loop.run_until_complete(calculator.submit(p))) == 3
+        finally:
+            calculator.shutdown()
@@ -1,8 +1,11 @@
 import pytest
 
 import numpy as np
+import pymatgen as pmg
 
-from dftfit.io.siesta import SiestaReader
+from dftfit.io.base import CalculationRecord
+from dftfit.io.siesta import SiestaReader, count_xml_steps
+from dftfit.descriptor import farthest_point_sampling, kmeans_sampling, calculation_descriptor
 
 
 @pytest.mark.siesta
@@ -23,3 +26,85 @@ def test_siesta_reader():
         [1.174490293284e-4, -1.258277686581e-4, -1.767562635815e-3]
     ]) * eVA32GPa * GPa2Bar
     assert np.all(np.isclose(calculation.stress, stresses))
+
+
+def test_diversity_sampling():
+    descriptors = np.array([[0.0], [0.1], [0.2], [5.0], [5.1], [10.0]])
+    assert farthest_point_sampling(descriptors, 3).tolist() == [0, 3, 5]
+    assert len(kmeans_sampling(descriptors, 3)) == 3
+    assert kmeans_sampling(descriptors, 3).tolist() == sorted(kmeans_sampling(descriptors, 3).tolist())
+
+
+def test_calculation_descriptor_from_record():
+    lattice = pmg.Lattice([[4.0, 0.0, 0.0], [1.5, 3.8, 0.0], [0.3, 0.7, 4.4]])
+    structure = pmg.Structure(lattice, ['Mg', 'O', 'O'], [[0.0, 0.0, 0.0], [0.45, 0.5, 0.55], [0.9, 0.1, 0.8]])
+    forces = np.random.random((3, 3))
+    calculation = CalculationRecord([str(s.specie) for s in structure], lattice.matrix, structure.cart_coords, forces, np.zeros((3, 3)), 0.0)
+
+    descriptor = calculation_descriptor(calculation, forces)
+    assert calculation._structure is None
+    assert np.allclose(descriptor, calculation_descriptor(structure, forces))
+
+    distances = structure.lattice.get_all_distances(structure.frac_coords, structure.frac_coords)
+    expected, edges = np.histogram([distances[0, 1], distances[0, 2]], bins=24, range=(0.0, 6.0))
+    assert np.allclose(descriptor[24:48], expected / 3)
+
+
+SIESTA_XML_STEP = '''
+  <module dictRef="MD" serial="{step}">
+    <molecule>
+      <atomArray>
+        <atom elementType="Mg" x3="0.0" y3="0.0" z3="{x}"/>
+        <atom elementType="O" x3="2.1" y3="2.1" z3="2.1"/>
+      </atomArray>
+    </molecule>
+    <molecule>
+      <atomArray>
+        <atom elementType="Mg" x3="9.9" y3="9.9" z3="9.9"/>
+      </atomArray>
+    </molecule>
+    <crystal title="Lattice Parameters">
+      <cellParameter parameterType="length">4.2 4.2 4.2</cellParameter>
+      <cellParameter parameterType="angle">90.0 90.0 90.0</cellParameter>
+    </crystal>
+    {calculation}
+  </module>'''
+
+SIESTA_XML_CALCULATION = '''
+    <propertyList title="Forces">
+      <property dictRef="siesta:forces"><matrix rows="2" columns="3">{f} 0.0 0.0 -{f} 0.0 0.0</matrix></property>
+    </propertyList>
+    <propertyList>
+      <property title="Total Stress"><matrix rows="3" columns="3">{f} 0 0 0 {f} 0 0 0 {f}</matrix></property>
+    </propertyList>
+    <propertyList title="Final KS Energy">
+      <property dictRef="siesta:E_KS"><scalar>-{f}</scalar></property>
+    </propertyList>'''
+
+
+def test_siesta_reader_streaming(tmpdir):
+    steps = []
+    for i in range(5):
+        calculation = SIESTA_XML_CALCULATION.format(f=i+1) if i < 4 else ''
+        steps.append(SIESTA_XML_STEP.format(step=i, x=0.1 * i, calculation=calculation))
+    filename = tmpdir.join('output.xml')
+    filename.write('<cml xmlns="http://www.xml-cml.org/schema">%s\n</cml>' % ''.join(steps))
+
+    assert count_xml_steps(str(filename)) == 4
+
+    xml_parts = SiestaReader.xml_parts_from_root(str(filename))
+    expected = [SiestaReader.from_xml_parts(*parts) for parts in zip(*xml_parts)]
+    calculations = SiestaReader.from_selector({'filename': str(filename), 'strategy': 'all'})
+    assert len(calculations) == len(expected) == 4
+    for calculation, expected_calculation in zip(calculations, expected):
+        assert calculation.energy == expected_calculation.energy
+        assert np.allclose(calculation.forces, expected_calculation.forces)
+        assert np.allclose(calculation.stress, expected_calculation.stress)
+        assert np.allclose(calculation.structure.cart_coords, expected_calculation.structure.cart_coords)
+        assert len(calculation.structure) == 2
+
+    calculations = SiestaReader.from_selector({'filename': str(filename), 'num_samples': 2})
+    assert [c.energy for c in calculations] == [-1.0, -4.0]
+
+    calculation = SiestaReader.from_file(str(tmpdir))
+    assert calculation.energy == -4.0
@@ -3,6 +3,7 @@ import warnings
 import numpy as np
 
 from dftfit.io import VaspReader
+from dftfit.training import Training
 
 
 def test_vasp_reader():
@@ -16,3 +17,80 @@ def test_vasp_reader():
     structure = calculation.structure
     assert len(structure) == 2
     assert set(s.symbol for s in structure.species) == {'Mg', 'O'}
+
+
+VASPRUN_STEP = '''
+ <calculation>
+  <scstep><energy><i name="e_fr_energy"> 1.0 </i></energy></scstep>
+  <structure>
+   <crystal>
+    <varray name="basis" >
+     <v> 4.2 0.0 0.0 </v>
+     <v> 0.0 4.2 0.0 </v>
+     <v> 0.0 0.0 4.2 </v>
+    </varray>
+   </crystal>
+   <varray name="positions" >
+    <v> 0.0 0.0 {x} </v>
+    <v> 0.5 0.5 0.5 </v>
+   </varray>
+  </structure>
+  <varray name="forces" >
+   <v> {f} 0.0 0.0 </v>
+   <v> -{f} 0.0 0.0 </v>
+  </varray>
+  <varray name="stress" >
+   <v> {f} 0.0 0.0 </v>
+   <v> 0.0 {f} 0.0 </v>
+   <v> 0.0 0.0 {f} </v>
+  </varray>
+  <energy>
+   <i name="e_fr_energy"> -{f} </i>
+   <i name="e_wo_entrp"> -{f} </i>
+   <i name="e_0_energy"> 0.0 </i>
+  </energy>
+  <eigenvalues><array><set><r> 1.0 1.0 </r></set></array></eigenvalues>
+ </calculation>'''
+
+
+def test_vasp_reader_steps(tmpdir):
+    atominfo = '''
+ <atominfo>
+  <array name="atoms" >
+   <set>
+    <rc><c>Mg</c><c>   1</c></rc>
+    <rc><c>O </c><c>   2</c></rc>
+   </set>
+  </array>
+ </atominfo>'''
+    steps = ''.join(VASPRUN_STEP.format(x=0.1 * i, f=i + 1) for i in range(5))
+    filename = tmpdir.join('vasprun.xml')
+    filename.write('<modeling>%s%s\n</modeling>' % (atominfo, steps))
+
+    calculations = VaspReader.from_selector({'filename': str(filename), 'num_samples': 3})
+    assert [c.energy for c in calculations] == [-1.0, -3.0, -5.0]
+    assert np.allclose(calculations[1].stress, np.eye(3) * 3e3)
+    assert np.allclose(calculations[1].forces, [[3, 0, 0], [-3, 0, 0]])
+    structure = calculations[1].structure
+    assert [s.symbol for s in structure.species] == ['Mg', 'O']
+    assert np.allclose(structure.cart_coords, [[0, 0, 0.84], [2.1, 2.1, 2.1]])
+
+    calculation = VaspReader(str(tmpdir))
+    assert calculation.energy == -5.0
+
+    training = Training({'version': 'v1', 'kind': 'Training', 'spec': [
+        {'type': 'VASP', 'selector': {'filename': str(filename), 'strategy': 'all'}}]})
+    assert len(training.calculations) == 5
+
+
+def test_vasp_training_weights(tmpdir):
+    atominfo = '<atominfo><array name="atoms"><set><rc><c>Mg</c></rc><rc><c>O</c></rc></set></array></atominfo>'
+    filename = tmpdir.join('vasprun.xml')
+    filename.write('<modeling>%s%s\n</modeling>' % (atominfo, VASPRUN_STEP.format(x=0.0, f=1)))
+
+    training = Training({'version': 'v1', 'kind': 'Training', 'spec': [
+        {'type': 'VASP', 'selector': {'filename': str(filename), 'strategy': 'all'}},
+        {'type': 'VASP', 'selector': {'filename': str(filename), 'strategy': 'all', 'weight': 2.0, 'force_weights': {'O': 3.0}}},
+    ]})
+    assert training.calculation_weights.tolist() == [1.0, 2.0]
+    assert training.reference.atom_weights.tolist() == [1.0, 1.0, 2.0, 6.0]
@@ -0,0 +1,109 @@
+import os
+import time
+import multiprocessing
+
+import dftfit.dftfit
+from dftfit.batch import batch_scheduler
+from dftfit.db import DatabaseManager
+
+
+def mock_dftfit_process(full_schema, connection):
+    """ Writes evaluations like a fit or stalls on first attempt """
+    job = full_schema['job']
+    dbm = DatabaseManager(job['database'])
+    with dbm.connection:
+        run_id = dbm.connection.execute('''
+        INSERT INTO run (potential_hash, training_hash, start_time, initial_parameters, indicies, bounds, features, weights)
+        VALUES ('mock', 'mock', '2018-01-01 00:00:00', '[]', '[]', '[]', '[]', '[]')
+        ''').lastrowid
+    connection.send(('started', job['database'], run_id))
+
+    if job.get('crash'):
+        return
+
+    if job.get('stall_flag') and not os.path.exists(job['stall_flag']):
+        open(job['stall_flag'], 'w').close()
+        if job.get('worker_pid_filename'):
+            # stands in for calculator workers of the job
+            worker = multiprocessing.Process(target=time.sleep, args=(60,))
+            worker.start()
+            with open(job['worker_pid_filename'], 'w') as f:
+                f.write(str(worker.pid))
+        time.sleep(60)
+
+    for _ in range(3):
+        with dbm.connection:
+            dbm.connection.execute("INSERT INTO evaluation (run_id, parameters, errors, value) VALUES (?, '[]', '[]', 1.0)", (run_id,))
+        time.sleep(0.1)
+    connection.send(('completed', job['database'], run_id))
+
+
+def test_batch_scheduler_retries_stalled_job(tmpdir, monkeypatch):
+    monkeypatch.setattr(dftfit.dftfit, 'dftfit_process', mock_dftfit_process)
+    database = str(tmpdir.join('batch.db'))
+    full_schemas = [{
+        'configuration': {'spec': {'problem': {'num_workers': 1}}},
+        'job': {'database': database}
+    } for _ in range(3)]
+    full_schemas[1]['job']['stall_flag'] = str(tmpdir.join('stall'))
+    full_schemas.append({'configuration': {'spec': {'problem': {'num_workers': 8}}}, 'job': {}})
+
+    start_time = time.time()
+    run_ids = batch_scheduler(full_schemas, monitor_interval=2, max_cpus=4)
+    assert time.time() - start_time < 30
+
+    dbm = DatabaseManager(database)
+    runs = {row['id']: (row['num_evaluations'], row['end_time']) for row in dbm.connection.execute('''
+    SELECT run.id, count(evaluation.id) as num_evaluations, run.end_time
+    FROM run LEFT JOIN evaluation ON evaluation.run_id = run.id GROUP BY run.id
+    ''')}
+    # stalled run is finished without evaluations and retried
+    stalled_run_ids = sorted(set(runs) - set(run_ids))
+    assert len(run_ids) == 3 and len(stalled_run_ids) == 1
+    assert all(runs[run_id][0] == 3 for run_id in run_ids)
+    num_evaluations, end_time = runs[stalled_run_ids[0]]
+    assert num_evaluations == 0 and end_time is not None
+
+
+def test_batch_scheduler_job_crashes_before_progress(tmpdir, monkeypatch):
+    monkeypatch.setattr(dftfit.dftfit, 'dftfit_process', mock_dftfit_process)
+    database = str(tmpdir.join('batch.db'))
+    full_schemas = [
+        {'configuration': {'spec': {'problem': {'num_workers': 1}}}, 'job': {'database': database, 'crash': True}},
+        {'configuration': {'spec': {'problem': {'num_workers': 1}}}, 'job': {'database': database}},
+    ]
+
+    run_ids = batch_scheduler(full_schemas, monitor_interval=60, max_cpus=2, max_retries=1)
+
+    # crashed job is retried once and remaining jobs still complete
+    dbm = DatabaseManager(database)
+    runs = [tuple(row) for row in dbm.connection.execute('SELECT id, end_time IS NOT NULL FROM run ORDER BY id')]
+    assert len(run_ids) == 1 and len(runs) == 3
+    assert all(finished for run_id, finished in runs if run_id not in run_ids)
+
+
+def _process_running(pid):
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_batch_scheduler_stalled_job_terminates_workers(tmpdir, monkeypatch):
+    monkeypatch.setattr(dftfit.dftfit, 'dftfit_process', mock_dftfit_process)
+    worker_pid_filename = str(tmpdir.join('worker.pid'))
+    full_schemas = [{
+        'configuration': {'spec': {'problem': {'num_workers': 1}}},
+        'job': {'database': str(tmpdir.join('batch.db')), 'stall_flag': str(tmpdir.join('stall')), 'worker_pid_filename': worker_pid_filename}
+    }]
+
+    run_ids = batch_scheduler(full_schemas, monitor_interval=2, max_cpus=1)
+    assert len(run_ids) == 1
+
+    with open(worker_pid_filename) as f:
+        worker_pid = int(f.read())
+    start_time = time.time()
+    while _process_running(worker_pid) and time.time() - start_time < 5:
+        time.sleep(0.1)
+    assert not _process_running(worker_pid)
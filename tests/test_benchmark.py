@@ -0,0 +1,31 @@
+import math
+
+import pandas as pd
+
+from dftfit.benchmark import stage_fractions, parallel_efficiency
+
+
+def test_stage_fractions():
+    profile = pd.DataFrame({'total': {
+        'fitness': 10.0,
+        'calculator.pipe_send': 1.0,
+        'calculator.pipe_recv': 7.0,
+        'calculator.worker.apply_potential': 2.0,
+        'calculator.worker.lammps_run': 8.0,
+    }})
+    fractions = stage_fractions(profile, num_workers=2)
+    assert math.isclose(fractions['lammps_fraction'], 0.4)
+    assert math.isclose(fractions['ipc_fraction'], 0.3)
+
+    # single worker has no pipes
+    profile = pd.DataFrame({'total': {'fitness': 10.0, 'calculator.worker.lammps_run': 8.0}})
+    assert stage_fractions(profile, num_workers=1) == {'lammps_fraction': 0.8, 'ipc_fraction': 0.0}
+
+
+def test_parallel_efficiency():
+    df = pd.DataFrame({
+        'num_calculations': [10, 10, 10, 20, 20],
+        'num_workers': [1, 2, 4, 2, 4],
+        'evaluations_per_second': [10.0, 20.0, 30.0, 5.0, 10.0],
+    })
+    assert parallel_efficiency(df) == [1.0, 1.0, 0.75, 1.0, 1.0]
@@ -0,0 +1,54 @@
+import sqlite3
+
+import numpy as np
+
+from dftfit.db import DatabaseManager, write_evaluations_batch, write_run_profile, run_profile
+from dftfit.timing import StageTimer, summarize_timings
+
+
+class MockPotential:
+    optimization_parameters = np.array([1.0, 2.0])
+
+
+def test_db_evaluation_kind(tmpdir):
+    filename = str(tmpdir.join('old.db'))
+    connection = sqlite3.connect(filename)
+    connection.execute('''
+    CREATE TABLE evaluation (
+        id                 INTEGER PRIMARY KEY,
+        run_id             INTEGER NOT NULL,
+        parameters         JSON NOT NULL,
+        errors             JSON NOT NULL,
+        value              REAL
+    )''')
+    connection.execute("INSERT INTO evaluation (run_id, parameters, errors, value) VALUES (1, '[]', '[]', 1.0)")
+    connection.commit()
+    connection.close()
+
+    dbm = DatabaseManager(filename)
+    write_evaluations_batch(dbm, 1, [
+        (MockPotential(), [0.5], 0.5),
+        (MockPotential(), [0.1], 0.1, 'mini-batch'),
+        (MockPotential(), [0.2], 0.2, 'full', 'reduced-0'),
+    ])
+    tags = [tuple(row) for row in dbm.connection.execute('SELECT kind, fidelity FROM evaluation ORDER BY id')]
+    assert tags == [('full', 'full'), ('full', 'full'), ('mini-batch', 'full'), ('full', 'reduced-0')]
+
+
+def test_db_run_profile():
+    dbm = DatabaseManager()
+    dbm.connection.execute('''
+    INSERT INTO run (potential_hash, training_hash, start_time, initial_parameters, indicies, bounds, features, weights)
+    VALUES ('a', 'b', '2018-01-01 00:00:00', '[]', '[]', '[]', '["forces"]', '[1.0]')
+    ''')
+    assert len(run_profile(dbm, 1)) == 0
+
+    timer = StageTimer()
+    timer.update({'fitness': [1.0, 3.0], 'objective.forces': [0.5, 0.5]})
+    write_run_profile(dbm, 1, summarize_timings(timer.timings))
+
+    df = run_profile(dbm, 1)
+    assert list(df.index) == ['fitness', 'objective.forces']
+    assert df.loc['fitness', 'count'] == 2
+    assert np.isclose(df.loc['fitness', 'p50'], 2.0)
+    assert np.isclose(df.loc['objective.forces', 'fraction'], 0.25)
@@ -0,0 +1,60 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from dftfit.metrics import RunMetrics, render_metrics, process_rss
+
+
+def test_render_metrics():
+    content = render_metrics([
+        ('dftfit_evaluations_total', 'counter', 'Number of fitness evaluations', [({'kind': 'full'}, 3)]),
+        ('dftfit_best_value', 'gauge', 'Best value', []),
+    ])
+    assert content == (
+        '# HELP dftfit_evaluations_total Number of fitness evaluations\n'
+        '# TYPE dftfit_evaluations_total counter\n'
+        'dftfit_evaluations_total{kind="full"} 3.0\n'
+        '# HELP dftfit_best_value Best value\n'
+        '# TYPE dftfit_best_value gauge\n')
+
+
+def test_run_metrics_textfile(tmpdir):
+    filename = str(tmpdir.join('dftfit.prom'))
+    metrics = RunMetrics(textfile=filename, interval=0.0, window=2)
+    for value in [3.0, 1.0, 2.0]:
+        metrics.observe_evaluation(value)
+    metrics.observe_evaluation(0.5, kind='aborted')
+    assert metrics.due()
+    metrics.update([{'busy_seconds': 1.5, 'failures': 2, 'rss_bytes': 1024}], db_queue_depth=4)
+
+    with open(filename) as f:
+        lines = set(f.read().splitlines())
+    assert 'dftfit_evaluations_total{kind="aborted"} 1.0' in lines
+    assert 'dftfit_evaluations_total{kind="full"} 3.0' in lines
+    assert 'dftfit_best_value 1.0' in lines
+    assert 'dftfit_median_value 1.5' in lines
+    assert 'dftfit_db_queue_depth 4.0' in lines
+    assert 'dftfit_worker_busy_seconds_total{worker="0"} 1.5' in lines
+    assert 'dftfit_worker_lammps_failures_total{worker="0"} 2.0' in lines
+
+
+def test_run_metrics_http():
+    metrics = RunMetrics(port=0)
+    try:
+        metrics.observe_evaluation(2.0)
+        metrics.update([], db_queue_depth=0)
+        url = 'http://127.0.0.1:%d/metrics' % metrics.server.server_port
+        with urllib.request.urlopen(url) as response:
+            assert 'dftfit_best_value 2.0' in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url.replace('/metrics', '/'))
+        assert error.value.code == 404
+    finally:
+        metrics.close()
+
+
+def test_run_metrics_requires_exporter():
+    with pytest.raises(ValueError):
+        RunMetrics()
+    assert process_rss() > 0
@@ -82,3 +82,76 @@ def test_obj_100_set_calculations_fse(objective_function, benchmark):
     @benchmark
     def f():
         objective_function(md_sets, dft_sets)
+
+
+@pytest.mark.parametrize('objective_function', [
+    objective.force_objective_function,
+    objective.stress_objective_function,
+    objective.energy_objective_function
+])
+def test_obj_weights_equivalent_to_duplicates(objective_function):
+    num_atoms = 10
+    md_sets = [create_random_reader(num_atoms) for i in range(3)]
+    dft_sets = [create_random_reader(num_atoms) for i in range(3)]
+
+    duplicated = objective_function(md_sets + md_sets[:1], dft_sets + dft_sets[:1])
+    weighted = objective_function(md_sets, dft_sets, weights=[2.0, 1.0, 1.0])
+    assert np.isclose(duplicated, weighted)
+
+
+@pytest.mark.parametrize('objective_function', [
+    objective.force_objective_function,
+    objective.stress_objective_function,
+    objective.energy_objective_function
+])
+def test_obj_reference_data(objective_function):
+    md_sets = [create_random_reader(num_atoms) for num_atoms in [5, 10, 15]]
+    dft_sets = [create_random_reader(num_atoms) for num_atoms in [5, 10, 15]]
+    reference = objective.ReferenceData(dft_sets, weights=[1.0, 2.0, 3.0])
+    assert reference.forces.shape == (30, 3)
+    assert not reference.forces.flags.writeable
+    assert np.isclose(objective_function(md_sets, reference),
+                      objective_function(md_sets, dft_sets, weights=[1.0, 2.0, 3.0]))
+
+
+def test_obj_atom_weights():
+    md_sets = [create_random_reader(num_atoms) for num_atoms in [5, 10]]
+    dft_sets = [create_random_reader(num_atoms) for num_atoms in [5, 10]]
+    atom_weighted = objective.ReferenceData(dft_sets, atom_weights=[np.full(5, 2.0), None])
+    calculation_weighted = objective.ReferenceData(dft_sets, weights=[2.0, 1.0])
+    assert np.isclose(objective.force_objective_function(md_sets, atom_weighted),
+                      objective.force_objective_function(md_sets, calculation_weighted))
+
+
+@pytest.mark.parametrize('objective_function', [
+    objective.force_objective_function,
+    objective.stress_objective_function,
+    objective.energy_objective_function,
+])
+def test_obj_reference_subset(objective_function):
+    md_sets = [create_random_reader(num_atoms) for num_atoms in [5, 10, 15, 20]]
+    dft_sets = [create_random_reader(num_atoms) for num_atoms in [5, 10, 15, 20]]
+    weights = [1.0, 2.0, 3.0, 4.0]
+    atom_weights = [None, np.full(10, 0.5), None, np.linspace(0, 1, 20)]
+    subset = objective.ReferenceData(dft_sets, weights, atom_weights).subset([1, 3])
+    reference = objective.ReferenceData([dft_sets[1], dft_sets[3]], [2.0, 4.0], [atom_weights[1], atom_weights[3]])
+    assert len(subset) == 2
+    assert subset.forces.shape == (30, 3)
+    assert np.isclose(objective_function([md_sets[1], md_sets[3]], subset),
+                      objective_function([md_sets[1], md_sets[3]], reference))
+
+
+@pytest.mark.parametrize('objective_function', [
+    objective.force_objective_function,
+    objective.stress_objective_function,
+    objective.energy_objective_function,
+])
+def test_obj_reference_subset_lower_bound(objective_function):
+    md_sets = [create_random_reader(num_atoms) for num_atoms in [5, 10, 15, 20]]
+    dft_sets = [create_random_reader(num_atoms) for num_atoms in [5, 10, 15, 20]]
+    reference = objective.ReferenceData(dft_sets)
+    value = objective_function(md_sets, reference)
+    for indicies in [[0], [0, 2], [1, 2, 3]]:
+        subset = reference.subset(indicies, normalize=False)
+        assert subset.force_normalizer == reference.force_normalizer
+        assert objective_function([md_sets[i] for i in indicies], subset) <= value
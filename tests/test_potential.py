@@ -59,3 +59,60 @@ def test_potential_from_file(filename, num_opt_params, num_params):
     p = Potential.from_file(filename)
     assert len(p.optimization_parameters) == num_opt_params
     assert len(p.parameters) == num_params
+
+
+def test_potential_constraints():
+    schema = {
+        'version': 'v1',
+        'kind': 'Potential',
+        'spec': {
+            'constraint': {
+                'charge_balance': 'MgO',
+                'equations': [
+                    {'left': 'pair.0.parameters.0.coefficients.2',
+                     'right': [['pair.0.parameters.0.coefficients.0', 2.0]]},
+                    {'left': 'pair.0.parameters.1.coefficients.2',
+                     'right': [['pair.0.parameters.1.coefficients.1', -1.0]]},
+                ]
+            },
+            'charge': {
+                'Mg': {'initial': 1.4, 'bounds': [1.0, 2.0]},
+                'O': {'initial': -1.4, 'bounds': [-2.0, -1.0]}
+            },
+            'pair': [{
+                'type': 'buckingham',
+                'parameters': [{
+                    'elements': ['Mg', 'O'],
+                    'coefficients': [{'initial': 1.0, 'bounds': [0.0, 10.0]}, 0.3, {'initial': 0.0, 'bounds': [-10.0, 10.0]}]
+                }, {
+                    'elements': ['O', 'O'],
+                    'coefficients': [5.0, {'initial': 0.5, 'bounds': [0.0, 10.0]}, {'initial': 0.0, 'bounds': [-10.0, 10.0]}]
+                }]
+            }],
+        }
+    }
+    potential = Potential(schema)
+    assert len(potential.optimization_parameters) == 3
+    potential.optimization_parameters = [-1.5, 3.0, 0.25]
+    charges = potential.schema['spec']['charge']
+    coefficients = [p['coefficients'] for p in potential.schema['spec']['pair'][0]['parameters']]
+    assert float(charges['Mg']) == 1.5
+    assert float(charges['O']) == -1.5
+    assert float(coefficients[0][2]) == 6.0
+    assert float(coefficients[1][2]) == -0.25
+    assert len(potential.parameters) == 8
+
+
+def test_potential_hash_cache():
+    p = Potential.from_file('test_files/potential/MgO-charge-buck-fitting.yaml')
+    md5hash = p.md5hash
+    p_copy = p.copy()
+    assert p == p_copy and hash(p) == hash(p_copy)
+    assert len({p, p_copy}) == 1
+
+    potentials = {p_copy}
+    p_copy.optimization_parameters = p.optimization_parameters * 1.01
+    assert p_copy.md5hash == md5hash
+    assert p_copy.parameters_md5hash != p.parameters_md5hash
+    assert p != p_copy
+    assert p_copy in potentials and hash(p) == hash(p_copy)
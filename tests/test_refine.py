@@ -0,0 +1,28 @@
+import numpy as np
+
+from dftfit.refine import finite_difference_gradient
+
+
+def test_finite_difference_gradient():
+    def evaluate_batch(batch):
+        return [np.sum(x**2) + x[0] * x[1] for x in batch]
+
+    calls = []
+    def counted_evaluate_batch(batch):
+        calls.append(len(batch))
+        return evaluate_batch(batch)
+
+    x = np.array([0.5, -1.0, 2.0])
+    value, gradient = finite_difference_gradient(counted_evaluate_batch, x, ([-3, -3, -3], [3, 3, 3]), step=1e-4)
+    assert calls == [7] # single batch of 2N + 1 parameters
+    assert np.isclose(value, evaluate_batch([x])[0])
+    assert np.allclose(gradient, [2*x[0] + x[1], 2*x[1] + x[0], 2*x[2]], atol=1e-6)
+
+
+def test_finite_difference_gradient_bounds():
+    x = np.array([1.0, 0.0])
+    value, gradient = finite_difference_gradient(
+        lambda batch: [np.sum(x**2) for x in batch], x, ([0, 0], [1, 0]), step=1e-3)
+    # one sided difference at upper bound and fixed parameter
+    assert np.isclose(gradient[0], 2.0, atol=1e-2)
+    assert gradient[1] == 0.0
@@ -0,0 +1,91 @@
+import numpy as np
+import pygmo
+import pytest
+
+import dftfit.problem
+import dftfit.surrogate
+from dftfit.surrogate import surrogate_model, propose_candidates, SurrogateAlgorithm
+
+
+@pytest.mark.parametrize('model', ['gp', 'rf'])
+def test_surrogate_propose_candidates(model):
+    random_state = np.random.RandomState(0)
+    bounds = ([-2.0, -2.0], [2.0, 2.0])
+    X = random_state.uniform(-2.0, 2.0, size=(50, 2))
+    y = np.sum((X - 1.0)**2, axis=1)
+
+    candidates = propose_candidates(surrogate_model(model, seed=0), X, y, bounds, num_evaluations=5, random_state=random_state)
+    assert candidates.shape == (5, 2)
+    assert np.all((candidates >= -2.0) & (candidates <= 2.0))
+    # screened candidates are better than the average random sample
+    assert np.mean(np.sum((candidates - 1.0)**2, axis=1)) < np.mean(y)
+
+
+def test_surrogate_model_unknown():
+    with pytest.raises(ValueError):
+        surrogate_model('svm')
+
+
+class SphereProblem:
+    def fitness(self, x):
+        return (float(np.sum((x - 1.0)**2)),)
+
+    def get_bounds(self):
+        return ([-2.0, -2.0], [2.0, 2.0])
+
+
+def test_surrogate_algorithm_evolve():
+    population = pygmo.population(pygmo.problem(SphereProblem()), 10, seed=0)
+    initial_best = population.champion_f[0]
+
+    algorithm = pygmo.algorithm(SurrogateAlgorithm(gen=3, seed=0, model='rf', num_evaluations=5, num_candidates=200))
+    population = algorithm.evolve(population)
+    assert population.problem.get_fevals() == 10 + 3 * 5
+    assert len(population) == 10
+    assert population.champion_f[0] <= initial_best
+
+
+class FailingSphereProblem:
+    """ Sphere problem where the first evaluation after the initial
+    population fails with the failure penalty """
+    failure_penalty = 1e10
+
+    def __init__(self, population_size):
+        self.population_size = population_size
+        self.num_evaluations = 0
+        self.last_evaluation_kind = None
+
+    def evaluation_history(self):
+        return None
+
+    def fitness(self, x):
+        self.num_evaluations += 1
+        if self.num_evaluations == self.population_size + 1:
+            self.last_evaluation_kind = 'failed'
+            return (self.failure_penalty,)
+        self.last_evaluation_kind = 'full'
+        return (float(np.sum((x - 1.0)**2)),)
+
+    def get_bounds(self):
+        return ([-2.0, -2.0], [2.0, 2.0])
+
+
+def test_surrogate_algorithm_skips_failed_evaluation(monkeypatch):
+    monkeypatch.setattr(dftfit.problem, 'DFTFITSingleProblem', FailingSphereProblem)
+    training_values, proposals = [], []
+
+    def _propose_candidates(model, X, y, *args, **kwargs):
+        training_values.append(y)
+        proposals.append(propose_candidates(model, X, y, *args, **kwargs))
+        return proposals[-1]
+    monkeypatch.setattr(dftfit.surrogate, 'propose_candidates', _propose_candidates)
+
+    population = pygmo.population(pygmo.problem(FailingSphereProblem(10)), 10, seed=0)
+    algorithm = pygmo.algorithm(SurrogateAlgorithm(gen=2, seed=0, model='rf', num_evaluations=5, num_candidates=200))
+    population = algorithm.evolve(population)
+
+    # failed evaluation is not used to train the model
+    assert [len(y) for y in training_values] == [10, 14]
+    assert np.all(training_values[1] < FailingSphereProblem.failure_penalty)
+    # proposals of the next generation still follow the model
+    assert np.mean(np.sum((proposals[1] - 1.0)**2, axis=1)) < np.mean(training_values[0])
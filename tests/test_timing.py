@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from dftfit.timing import StageTimer, StageStatistics, summarize_timings
+
+
+def test_stage_timer():
+    timer = StageTimer()
+    with timer('sleep'):
+        time.sleep(0.01)
+    with pytest.raises(ValueError):
+        with timer('error'):
+            raise ValueError()
+    timer.update({'sleep': [1.0]}, prefix='worker.')
+
+    timings = timer.pop()
+    assert timings['sleep'].total >= 0.01
+    assert len(timings['error']) == 1
+    assert timings['worker.sleep'].samples == [1.0]
+    assert len(timer.timings) == 0
+
+    # timings of other timers (e.g. workers) are merged
+    timer.update(timings, prefix='worker.')
+    timer.update(timings, prefix='worker.')
+    assert len(timer.timings['worker.sleep']) == 2
+
+
+def test_stage_statistics_bounded():
+    statistics = StageStatistics(max_samples=100)
+    for duration in range(10000):
+        statistics.add(float(duration))
+    assert len(statistics.samples) == 100
+    assert statistics.count == 10000
+    assert statistics.total == sum(range(10000))
+
+    other = StageStatistics(max_samples=100)
+    for duration in range(10000):
+        other.add(float(duration) + 10000)
+    statistics.merge(other)
+    assert len(statistics.samples) == 100
+    assert statistics.count == 20000
+
+    summary = summarize_timings({'stage': statistics})
+    assert summary['stage']['mean'] == pytest.approx(9999.5)
+    assert summary['stage']['p50'] == pytest.approx(10000, rel=0.2)
+
+
+def test_summarize_timings():
+    summary = summarize_timings({'stage': [float(_) for _ in range(1, 101)], 'empty': []})
+    assert set(summary) == {'stage'}
+    assert summary['stage']['count'] == 100
+    assert summary['stage']['total'] == pytest.approx(5050.0)
+    assert summary['stage']['mean'] == pytest.approx(50.5)
+    assert summary['stage']['p50'] == pytest.approx(50.5)
+    assert summary['stage']['p90'] == pytest.approx(90.1)
@@ -1,6 +1,9 @@
 import pytest
+import numpy as np
+import pymatgen as pmg
 
-from dftfit.training import Training
+from dftfit.io.base import MDReader, CalculationRecord
+from dftfit.training import Training, deduplicate_calculations, load_calculations_per_task, element_force_weights
 
 
 # mattoolkit is not running (but we will use cache to keep it alive)
@@ -19,3 +22,45 @@ def test_training_from_file(filename, num_calculations, material_properties):
     training = Training.from_file('test_files/training/%s' % filename, **kwargs)
     assert len(training.calculations) == num_calculations
     assert set(training.material_properties.keys()) == material_properties
+
+
+def test_deduplicate_calculations():
+    lattice = pmg.Lattice.from_parameters(4.2, 4.2, 4.2, 90, 90, 90)
+    structure = pmg.Structure(lattice, ['Mg', 'O'], [[0, 0, 0], [0.5, 0.5, 0.5]])
+    permuted = pmg.Structure(lattice, ['O', 'Mg'], [[0.5, 0.5, 0.5], [0, 0, 0]])
+    perturbed = pmg.Structure(lattice, ['Mg', 'O'], [[0, 0, 0], [0.55, 0.5, 0.5]])
+
+    calculations = [MDReader(forces=np.zeros((2, 3)), stress=np.zeros((3, 3)), energy=0.0, structure=s)
+                    for s in [structure, permuted, perturbed, structure]]
+    unique_calculations, multiplicities = deduplicate_calculations(calculations, tolerance=1e-3)
+    assert unique_calculations == [calculations[0], calculations[2]]
+    assert np.all(multiplicities == [3, 1])
+
+
+def _range_task(start, stop):
+    return list(range(start, stop))
+
+
+@pytest.mark.parametrize('num_workers', [1, 3])
+def test_load_calculations_order(num_workers):
+    tasks = [(_range_task, (i * 3, (i + 1) * 3)) for i in range(6)]
+    assert load_calculations_per_task(tasks, num_workers=num_workers) == [list(range(i * 3, (i + 1) * 3)) for i in range(6)]
+
+
+def test_training_replicate():
+    training = Training.from_file('test_files/training/training-mattoolkit-mgo.yaml', cache_filename='test_files/mattoolkit/cache/cache.db')
+    replicated = training.replicate(3)
+    assert len(replicated) == 3 * len(training)
+    assert len(training) == 3
+    assert np.all(replicated.reference.forces == np.tile(training.reference.forces, (3, 1)))
+
+
+def test_training_cache_filename_deprecated(caplog):
+    Training.from_file('test_files/training/training-mattoolkit-mgo.yaml', cache_filename='test_files/mattoolkit/cache/cache.db')
+    assert 'Set cache_directory' in caplog.text
+
+
+def test_element_force_weights_lazy_structure():
+    calculation = CalculationRecord(['Mg', 'O', 'O'], np.eye(3) * 4.2, np.random.random((3, 3)), np.zeros((3, 3)), np.zeros((3, 3)), 0.0)
+    assert np.allclose(element_force_weights(calculation, {'O': 2.0}), [1.0, 2.0, 2.0])
+    assert calculation._structure is None